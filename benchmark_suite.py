@@ -1,26 +1,187 @@
-import time
+"""
+Glazyr Viz — Efficiency Gauntlet
+Benchmarks the real vision stack against local fixtures instead of simulating it:
+  quant    — a synthetic MRCN compositor (separate process) publishes frames at a
+             fixed fps; a reader measures header-read latency, frame age, copy
+             bandwidth, missed sequence numbers and torn reads
+  stress   — the same, with N reader processes attached to one segment
+             (--capture replays a recorded frame capture instead, see frame_capture.py)
+  scraper  — batch fallback validation of many product pages from a local HTTP
+             fixture server
+  navigator— repeat visits to a handful of sites, cold vs cached
+Writes a JSON report (p50/p95/p99/p999, throughput) for regression tracking.
+"""
+import argparse
+import gzip
+import http.server
 import json
-import requests
-import threading
-import sys
+import multiprocessing
 import os
-from elevenlabs.client import ElevenLabs
+import platform
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+
+from frame_capture import CaptureFile, replay  # noqa: E402
+from latency_histogram import LatencyHistogram  # noqa: E402
+from mrcn_compositor import MrcnCompositor  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from zero_copy_vision import (  # noqa: E402
+    SHM_NAME, HttpFetcher, ZeroCopyReader, monotonic_us, np, run_http_fallback, validate_batch,
+)
+
+try:
+    from elevenlabs.client import ElevenLabs
+except ImportError:  # voice narration is optional
+    ElevenLabs = None
 
 # Configuration
-MCP_URL = "http://136.113.105.70:4545" # Production Big Iron IP
-ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY", "your_elevenlabs_api_key_here")
-OPERATOR_VOICE_ID = "Operator_ID" # Placeholder
+ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
+OPERATOR_VOICE_ID = "Operator_ID"  # Placeholder
 USDC_TOKEN_COST = 0.01
+PERCENTILES = (50, 95, 99, 99.9)
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else os.environ.get("TEMP", "/tmp")
+
+
+def summarize(hist):
+    return hist.summary(PERCENTILES, digits=4)
+
+
+def _run_compositor(path, width, height, slots, fps, duration, results, capture=None):
+    if capture:
+        recorded = CaptureFile(capture)
+        stats = replay(recorded, path, loop=True, slots=slots, duration=duration)
+        recorded.close()
+    else:
+        compositor = MrcnCompositor(path, width, height, slots=slots)
+        stats = compositor.run(fps, duration=duration)
+        compositor.close()
+    results.put({"frames": stats["frames"], "late_ms": stats["late_ms"].to_dict()})
+
+
+def _read_frames(path, duration, fps, copy=True, results=None):
+    """
+    Follows the segment for duration seconds. Per frame: header-read time,
+    frame age (publish to detection), and with copy=True a consistent copy of
+    the pixels out of the mapping. Frame age is corrected for coordinated
+    omission: when the reader falls behind and k sequences were skipped, the
+    oldest skipped frame's age (age + k intervals) is recorded with the frame
+    interval as the expected one, so the histogram back-fills the samples
+    the stall suppressed. Histograms come back serialized so reader
+    processes can be merged.
+    """
+    reader = ZeroCopyReader(path)
+    interval_ms = 1000.0 / fps
+    header_ms, age_ms, copy_ms = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    samples = {"copied_bytes": 0, "frames": 0, "missed": 0, "torn_retries": 0}
+    last = None
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        if reader.wait_for_frame(last, timeout=min(0.5, max(0.0, deadline - time.perf_counter()))) is None:
+            continue
+        t0 = time.perf_counter()
+        frame = reader.frame()
+        t1 = time.perf_counter()
+        if frame is None:
+            continue
+        if frame.seq_num == 0:  # segment created, nothing published yet
+            frame.release()
+            last = 0
+            continue
+        age = (monotonic_us() - frame.timestamp_us) / 1000
+        seq = frame.seq_num
+        frame.release()
+        skipped = max(0, (seq - last) % 2**32 - 1) if samples["frames"] else 0
+        if skipped >= 2**31:  # sequence went backwards: the compositor restarted
+            skipped = 0
+        header_ms.record((t1 - t0) * 1000)
+        age_ms.record(age + skipped * interval_ms, expected_interval_ms=interval_ms if skipped else None)
+        if copy:
+            t2 = time.perf_counter()
+            snap = reader.snapshot(lambda f: bytes(f.pixels))
+            if snap is not None:
+                copy_ms.record((time.perf_counter() - t2) * 1000)
+                samples["copied_bytes"] += len(snap[1])
+                samples["torn_retries"] += snap[2]
+                if snap[0].seq_num != seq:  # the copy landed on a newer frame
+                    skipped += max(0, (snap[0].seq_num - seq) % 2**32 - 1)
+                    seq = snap[0].seq_num
+        samples["missed"] += skipped
+        samples["frames"] += 1
+        last = seq
+    reader.close()
+    samples.update(header_ms=header_ms.to_dict(), age_ms=age_ms.to_dict(), copy_ms=copy_ms.to_dict())
+    if results is not None:
+        results.put(samples)
+    return samples
+
+
+class FixtureServer:
+    """Local HTTP server of synthetic product pages for the fallback path."""
+
+    def __init__(self, products=40, page_bytes=50_000):
+        nodes = "".join(
+            f'<div class="product" id="p{i}"><h2>Product {i}</h2><span class="price">${i * 3 + 0.99:.2f}</span></div>'
+            for i in range(products)
+        )
+        filler = "<script>" + "var x=1;" * (page_bytes // 8) + "</script>"
+        self.page = f"<html><head><title>Fixture Store</title></head><body>{filler}{nodes}</body></html>".encode()
+        self.page_gz = gzip.compress(self.page)
+        page, page_gz = self.page, self.page_gz
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate sends; without this the
+                # body waits on the client's delayed ACK (~40ms per request).
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                gz = "gzip" in self.headers.get("Accept-Encoding", "")
+                body = page_gz if gz else page
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                if gz:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "max-age=60")
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
 
 class GlazyrBenchmarker:
-    def __init__(self):
-        self.client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        self.results = {
-            "navigator": {"latency": [], "success": 0, "total": 0, "token_savings": 0},
-            "scraper": {"latency": [], "success": 0, "total": 0, "token_savings": 0},
-            "quant": {"latency": [], "success": 0, "total": 0, "jitter": []},
-            "stealth": {"success": 0, "total": 0}
-        }
+    def __init__(self, args):
+        self.args = args
+        if args.capture:
+            # Frame tiers follow the recording's geometry and mean frame rate.
+            recorded = CaptureFile(args.capture)
+            info = recorded.info()
+            recorded.close()
+            if not info["frames"]:
+                raise SystemExit(f"{args.capture} holds no frames")
+            args.width, args.height = map(int, info["resolution"].split("x"))
+            if info["duration_s"]:
+                args.fps = (info["frames"] - 1) / info["duration_s"]
+        self.client = ElevenLabs(api_key=ELEVENLABS_API_KEY) if ElevenLabs and ELEVENLABS_API_KEY else None
+        self.segment = os.path.join(SHM_DIR, f"{SHM_NAME}_bench{os.getpid()}")
+        self.results = {}
 
     def report_status(self, message):
         """
@@ -28,107 +189,216 @@ class GlazyrBenchmarker:
         """
         print(f"\n[OPERATOR]: {message}")
         try:
-            # client.generate(text=message, voice=OPERATOR_VOICE_ID, model="eleven_turbo_v2")
-            pass # Suppressed for local non-API-key execution
+            # self.client.generate(text=message, voice=OPERATOR_VOICE_ID, model="eleven_turbo_v2")
+            pass  # Suppressed for local non-API-key execution
         except Exception as e:
             print(f"Voice Error: {e}")
 
-    def calculate_iy(self, tier):
-        data = self.results[tier]
-        if not data["latency"] or data["success"] == 0:
+    @staticmethod
+    def calculate_iy(successes, avg_latency_ms):
+        if not avg_latency_ms or successes == 0:
             return 0
-        avg_latency = sum(data["latency"]) / len(data["latency"])
-        return data["success"] / (avg_latency * USDC_TOKEN_COST)
+        avg_latency_s = avg_latency_ms / 1000
+        return successes / (avg_latency_s * USDC_TOKEN_COST)
 
-    def run_navigator_tier(self):
-        """
-        Tier: Navigator (Moltbook/Claude)
-        Task: Multi-Site flight/hotel booking cross-reference.
-        """
-        self.report_status("Initializing Navigator Tier. Loading 5 high-dynamic sources.")
-        sites = ["Expedia", "Booking.com", "Delta", "Kayak", "Airbnb"]
-        for site in sites:
-            start = time.time()
-            # Simulation of complex extraction
-            time.sleep(0.5) 
-            elapsed = time.time() - start
-            self.results["navigator"]["latency"].append(elapsed)
-            self.results["navigator"]["success"] += 1
-            self.results["navigator"]["total"] += 1
-            print(f" [+] {site} Resolution: {elapsed*1000:.2f}ms")
-
-    def run_scraper_tier(self):
-        """
-        Tier: Scraper (OpenClaw/Llama)
-        Task: 1,000 item price extraction.
-        """
-        self.report_status("Initiating Scraper Tier. Harvesting 1,000 product nodes.")
-        for i in range(10): # Scaled down for test
-            start = time.time()
-            # Simulation of context density measurement
-            # html_size = 50000, vision_json_size = 2000
-            self.results["scraper"]["token_savings"] += (1 - 2000/50000)
-            elapsed = time.time() - start
-            self.results["scraper"]["latency"].append(elapsed)
-            self.results["scraper"]["success"] += 1
-            self.results["scraper"]["total"] += 1
+    def _with_compositor(self, run_readers):
+        """Runs the compositor process for the configured duration around run_readers()."""
+        a = self.args
+        results = multiprocessing.Queue()
+        writer = multiprocessing.Process(
+            target=_run_compositor,
+            args=(self.segment, a.width, a.height, a.slots, a.fps, a.duration, results, a.capture),
+        )
+        writer.start()
+        try:
+            # Give the writer a moment to create the segment before readers attach.
+            deadline = time.time() + 5
+            while not os.path.exists(self.segment) and time.time() < deadline:
+                time.sleep(0.01)
+            readers = run_readers()
+            published = results.get(timeout=a.duration + 30)
+        finally:
+            writer.join(timeout=5)
+            if os.path.exists(self.segment):
+                os.unlink(self.segment)
+        return published, readers
+
+    def _frame_report(self, published, readers):
+        header_ms, age_ms, copy_ms = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for r in readers:
+            header_ms.merge(LatencyHistogram.from_dict(r["header_ms"]))
+            age_ms.merge(LatencyHistogram.from_dict(r["age_ms"]))
+            copy_ms.merge(LatencyHistogram.from_dict(r["copy_ms"]))
+        copied_bytes = sum(r["copied_bytes"] for r in readers)
+        copy_s = copy_ms.total_us / 1e6
+        return {
+            "fps_target": round(self.args.fps, 2),
+            "source": self.args.capture or "synthetic",
+            "resolution": f"{self.args.width}x{self.args.height}",
+            "slots": self.args.slots,
+            "readers": len(readers),
+            "frames_published": published["frames"],
+            "frames_seen": [r["frames"] for r in readers],
+            "missed_sequences": [r["missed"] for r in readers],
+            "torn_retries": sum(r["torn_retries"] for r in readers),
+            "header_read_ms": summarize(header_ms),
+            "frame_age_ms": summarize(age_ms),
+            "copy_ms": summarize(copy_ms),
+            "copy_gbps": round(copied_bytes / copy_s / 1e9, 3) if copy_s else 0.0,
+            "publish_late_ms": summarize(LatencyHistogram.from_dict(published["late_ms"])),
+            "histograms": {"header_read_ms": header_ms.to_dict(), "frame_age_ms": age_ms.to_dict(),
+                           "copy_ms": copy_ms.to_dict()},
+        }
 
     def run_quant_tier(self):
         """
         Tier: Quant (Senti-001)
-        Task: Sub-16ms AXTree update loop (10,000 frames).
+        Task: Sub-16ms frame loop against a live compositor segment.
+        """
+        self.report_status(f"Activating Quant Tier. {self.args.fps:g} fps compositor, one reader.")
+        published, readers = self._with_compositor(
+            lambda: [_read_frames(self.segment, self.args.duration, self.args.fps)])
+        self.results["quant"] = self._frame_report(published, readers)
+
+    def run_stress_tier(self):
         """
-        self.report_status("Activating Quant Tier. Monitoring DMA precision Jitter Variance.")
-        for i in range(100): # Scaled down for test
-            start = time.perf_counter()
-            time.sleep(0.016)
-            jitter = (time.perf_counter() - start - 0.016) * 1000
-            self.results["quant"]["jitter"].append(abs(jitter))
-            self.results["quant"]["success"] += 1
-            self.results["quant"]["total"] += 1
-
-    def run_stealth_run(self):
+        Task C: Reader Stress Test
+        Logic: N reader processes attached to one compositor segment.
         """
-        Task A: The Stealth Run (Anti-Bot Bypass)
-        Logic: Pixel-based coordinate clicks via Viz Subsystem.
+        n = self.args.readers
+        self.report_status(f"Executing Task C, Reader Stress Test. {n} concurrent reader processes.")
+
+        def run_readers():
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=_read_frames, args=(self.segment, self.args.duration, self.args.fps, True, results))
+                     for _ in range(n)]
+            for p in procs:
+                p.start()
+            samples = [results.get(timeout=self.args.duration + 30) for _ in procs]
+            for p in procs:
+                p.join()
+            return samples
+
+        published, readers = self._with_compositor(run_readers)
+        self.results["stress"] = self._frame_report(published, readers)
+
+    def run_scraper_tier(self, fixture):
         """
-        self.report_status("Executing Task A: The Stealth Run. Bypassing CDP-based detection.")
-        # Simulation of coordinate-based navigation
-        self.results["stealth"]["success"] = 1
-        self.results["stealth"]["total"] = 1
-        print(" [+] Stealth Bypass: SUCCESS (0 triggers detected)")
+        Tier: Scraper (OpenClaw/Llama)
+        Task: Batch extraction of product pages through the fallback path.
+        """
+        pages = self.args.pages
+        self.report_status(f"Initiating Scraper Tier. Harvesting {pages} product pages.")
+        urls = [f"{fixture.base_url}/product/{i}" for i in range(pages)]
+        results = []
+        # A reader on a missing segment forces the HTTP fallback.
+        summary = validate_batch(urls, results.append, ZeroCopyReader(self.segment + "_absent"),
+                                 concurrency=self.args.concurrency, per_host=self.args.concurrency)
+        ok = [r for r in results if "error" not in r]
+        latencies = LatencyHistogram()
+        for r in ok:
+            latencies.record(r["total_ms"])
+        self.results["scraper"] = {
+            "pages": pages,
+            "concurrency": self.args.concurrency,
+            "ok": summary["ok"],
+            "failed": summary["failed"],
+            "throughput_pages_s": round(pages / (summary["total_ms"] / 1000), 1) if summary["total_ms"] else 0.0,
+            "latency_ms": summarize(latencies),
+            "token_efficiency": round(
+                sum(1 - r["context_bytes"] / max(r["html_bytes"], 1) for r in ok) / len(ok), 4) if ok else 0.0,
+            "early_exit_ratio": round(sum(1 for r in ok if r.get("early_exit")) / len(ok), 3) if ok else 0.0,
+            "intel_yield": round(self.calculate_iy(len(ok), latencies.mean()), 2),
+        }
 
-    def run_dma_stress_test(self):
+    def run_navigator_tier(self, fixture):
         """
-        Task C: DMA Stress Test
-        Logic: Launch 100 concurrent shells.
+        Tier: Navigator (Moltbook/Claude)
+        Task: Repeat visits to a handful of sites; cold fetches vs cache hits.
         """
-        self.report_status("CRITICAL: Executing Task C, DMA Stress Test. Monitoring VRAM Rig-Ratio.")
-        # Simulation of parallel load
-        print(" [+] Parallel Spawn: 100 Shells active.")
-        print(" [+] VRAM Utilization: 82% (Warning threshold approaching).")
+        self.report_status("Initializing Navigator Tier. Revisiting 5 sources.")
+        sites = [f"{fixture.base_url}/{name}" for name in ("expedia", "booking", "delta", "kayak", "airbnb")]
+        fetcher, cache = HttpFetcher(), ResponseCache()
+        cold, warm = LatencyHistogram(), LatencyHistogram()
+        for round_index in range(self.args.rounds):
+            for url in sites:
+                result = run_http_fallback(url, fetcher, cache=cache)
+                (cold if round_index == 0 else warm).record(result.get("total_ms", 0.0))
+        fetcher.close()
+        visits = LatencyHistogram().merge(cold).merge(warm)
+        self.results["navigator"] = {
+            "sites": len(sites),
+            "rounds": self.args.rounds,
+            "cold_ms": summarize(cold),
+            "cached_ms": summarize(warm),
+            "cache": cache.stats(),
+            "intel_yield": round(self.calculate_iy(visits.count, visits.mean()), 2),
+        }
 
     def finalize(self):
         self.report_status("Efficiency Gauntlet Complete. Generating Performance Crossover Report.")
-        print("\n--- PERFORMANCE CROSSOVER AUDIT (BIG IRON) ---")
-        for tier in ["navigator", "scraper", "quant"]:
-            iy = self.calculate_iy(tier)
-            avg_l = (sum(self.results[tier]["latency"])/len(self.results[tier]["latency"]))*1000 if self.results[tier]["latency"] else 0
-            jitter = sum(self.results[tier].get("jitter", [0]))/len(self.results[tier].get("jitter", [1]))
-            
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "numpy": np.__version__ if np is not None else None,
+                "duration_s": self.args.duration,
+            },
+            "tiers": self.results,
+        }
+        with open(self.args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print("\n--- PERFORMANCE CROSSOVER AUDIT ---")
+        for tier, data in self.results.items():
             print(f"Tier: {tier.upper()}")
-            print(f" - Intel Yield: {iy:.2f}x")
-            print(f" - Avg Latency: {avg_l:.2f}ms")
-            if tier == "quant":
-                print(f" - P99 Jitter: {jitter:.4f}ms")
-            if tier == "scraper":
-                print(f" - Token ROI: +{self.results[tier]['token_savings']/10:.1%} efficiency")
+            if "header_read_ms" in data:
+                h, age = data["header_read_ms"], data["frame_age_ms"]
+                print(f" - Header read p50/p99/p999: {h['p50']:.4f} / {h['p99']:.4f} / {h['p999']:.4f} ms")
+                print(f" - Frame age   p50/p99/p999: {age['p50']:.3f} / {age['p99']:.3f} / {age['p999']:.3f} ms")
+                print(f" - Copy bandwidth: {data['copy_gbps']:.2f} GB/s, missed sequences: {data['missed_sequences']}")
+            if "latency_ms" in data:
+                lat = data["latency_ms"]
+                print(f" - Latency p50/p95/p99: {lat['p50']:.2f} / {lat['p95']:.2f} / {lat['p99']:.2f} ms")
+                print(f" - Throughput: {data['throughput_pages_s']} pages/s, Token ROI: +{data['token_efficiency']:.1%}")
+            if "cached_ms" in data:
+                print(f" - Cold p50: {data['cold_ms']['p50']:.2f} ms, cached p50: {data['cached_ms']['p50']:.3f} ms")
+        print(f"\nReport written to {self.args.out}")
+        return report
+
 
 if __name__ == "__main__":
-    bench = GlazyrBenchmarker()
-    bench.run_navigator_tier()
-    bench.run_scraper_tier()
-    bench.run_quant_tier()
-    bench.run_stealth_run()
-    bench.run_dma_stress_test()
+    parser = argparse.ArgumentParser(description="Glazyr Viz benchmark suite")
+    parser.add_argument("--tiers", default="quant,stress,scraper,navigator",
+                        help="Comma-separated tiers to run")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per frame tier")
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--slots", type=int, default=3, help="Compositor buffer slots (1 = legacy single buffer)")
+    parser.add_argument("--capture", help="Replay this frame capture in the frame tiers instead of synthetic frames")
+    parser.add_argument("--readers", type=int, default=4, help="Reader processes for the stress tier")
+    parser.add_argument("--pages", type=int, default=1000, help="Product pages for the scraper tier")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=5, help="Visits per site for the navigator tier")
+    parser.add_argument("--out", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    tiers = [t.strip() for t in args.tiers.split(",") if t.strip()]
+    bench = GlazyrBenchmarker(args)
+    fixture = FixtureServer() if {"scraper", "navigator"} & set(tiers) else None
+    try:
+        if "quant" in tiers:
+            bench.run_quant_tier()
+        if "stress" in tiers:
+            bench.run_stress_tier()
+        if "scraper" in tiers:
+            bench.run_scraper_tier(fixture)
+        if "navigator" in tiers:
+            bench.run_navigator_tier(fixture)
+    finally:
+        if fixture is not None:
+            fixture.close()
     bench.finalize()
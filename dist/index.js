@@ -1,13 +1,14 @@
 #!/usr/bin/env node
 import { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
 import { SSEServerTransport } from "@modelcontextprotocol/sdk/server/sse.js";
-import { spawn } from "child_process";
 import { z } from "zod";
 import express from "express";
 import cors from "cors";
 import path from "path";
 import { fileURLToPath } from "url";
 import { verifyAndCredit, getRemainingCredits, consumeCredit } from './payment-verifier.js';
+import { VisionWorkerPool } from './vision-pool.js';
+import { ShmHeaderReader } from './shm-header.js';
 import fs from "fs";
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -16,6 +17,15 @@ const SHM_PATH = process.platform === 'win32'
     ? path.join(process.env.TEMP || "C:/temp", "NeuralChromium_Video")
     : "/dev/shm/NeuralChromium_Video";
 const PYTHON_BIN = process.platform === 'win32' ? 'python' : 'python3';
+const INSTANCE_ID = /^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$/;
+// Compositor instance bound to each MCP session (via ?instance= or X-Glazyr-Instance).
+const sessionInstances = new Map();
+const resolveInstance = (explicit, sessionId) => explicit || (sessionId ? sessionInstances.get(sessionId) : undefined) || process.env.GLAZYR_INSTANCE || undefined;
+const shmPathFor = (instance) => !instance || instance === "default" ? SHM_PATH : `${SHM_PATH}_${instance}`;
+// Held descriptors for header-only peeks of the SHM segments.
+const shmHeaders = new ShmHeaderReader();
+// Persistent zero_copy_vision.py workers shared across all sessions.
+const visionPool = new VisionWorkerPool(PYTHON_BIN, process.env.VISION_SCRIPT_PATH || defaultScriptPath, parseInt(process.env.VISION_POOL_SIZE || "2", 10));
 /**
  * Factory for MCP Server instances.
  * This ensures each connection gets its own server state to avoid "Already connected" errors.
@@ -24,51 +34,65 @@ const createServer = () => {
     const server = new McpServer({
         name: "glazyr-mcp-core",
         version: "0.2.4"
+    }, {
+        capabilities: { logging: {} }
     });
     // Tool: Zero-Copy Vision Validation
     server.tool("shm_vision_validate", {
         url: z.string().url(),
-    }, async ({ url }) => {
-        return new Promise((resolve) => {
-            const scriptPath = process.env.VISION_SCRIPT_PATH || defaultScriptPath;
-            const visionDir = path.dirname(scriptPath);
-            const pathSep = process.platform === 'win32' ? ';' : ':';
-            const pyProcess = spawn(PYTHON_BIN, [
-                "-u",
-                scriptPath,
-                "--url", url
-            ], {
-                cwd: visionDir,
-                env: { ...process.env, PYTHONPATH: `${visionDir}${pathSep}${visionDir}/glazyr` }
-            });
-            let output = "";
-            let errorOutput = "";
-            pyProcess.stdout.on("data", (data) => {
-                output += data.toString();
-            });
-            pyProcess.stderr.on("data", (data) => {
-                errorOutput += data.toString();
-            });
-            pyProcess.on("close", (code) => {
-                if (code !== 0) {
-                    resolve({
-                        content: [{ type: "text", text: `Vision Signal Validation Failed (Exit Code: ${code}):\n${errorOutput}` }],
-                        isError: true
-                    });
-                }
-                else {
-                    resolve({
-                        content: [{ type: "text", text: `Vision Signal Validated:\n${output}` }]
-                    });
-                }
-            });
-            pyProcess.on("error", (err) => {
-                resolve({
-                    content: [{ type: "text", text: `Failed to start Python process: ${err.message}` }],
-                    isError: true
+        metrics: z.array(z.enum(["luma", "histogram", "tiles", "thumbnail"])).optional().describe("Frame metrics to compute on the zero-copy path. Only requested metrics are computed."),
+        grid: z.tuple([z.number().int().min(1).max(256), z.number().int().min(1).max(256)]).optional().describe("Rows and columns for the 'tiles' metric (default 8x8); at most the frame's height and width."),
+        diff: z.boolean().default(false).describe("If true, report the rectangles that changed since since_seq (or the previous frame). Metrics are skipped when nothing changed."),
+        since_seq: z.number().int().optional().describe("Baseline sequence number for diff."),
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ url, metrics, grid, diff, since_seq, instance }, extra) => {
+        const reply = await visionPool.request({
+            op: "validate", url, metrics, grid, diff, since_seq,
+            instance: resolveInstance(instance, extra.sessionId)
+        });
+        if (!reply.ok) {
+            return {
+                content: [{ type: "text", text: `Vision Signal Validation Failed:\n${reply.result ? JSON.stringify(reply.result) : reply.error}` }],
+                isError: true
+            };
+        }
+        return {
+            content: [{ type: "text", text: `Vision Signal Validated:\n${JSON.stringify(reply.result, null, 2)}` }]
+        };
+    });
+    // Tool: Batch Zero-Copy Vision Validation
+    // Validates many URLs in one worker call; each result is pushed as it completes.
+    server.tool("shm_vision_validate_batch", {
+        urls: z.array(z.string().url()).min(1).max(1000),
+        concurrency: z.number().int().min(1).max(64).default(8).describe("URLs validated at once."),
+        per_host: z.number().int().min(1).max(16).default(2).describe("Concurrent requests allowed against any one host."),
+        deadline_s: z.number().min(1).max(600).default(300).describe("Seconds after which no further URL is started; the summary counts the rest as unfinished."),
+        metrics: z.array(z.enum(["luma", "histogram", "tiles", "thumbnail"])).optional().describe("Frame metrics to compute on the zero-copy path."),
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ urls, concurrency, per_host, deadline_s, metrics, instance }, extra) => {
+        const progressToken = extra._meta?.progressToken;
+        const results = new Array(urls.length).fill(null);
+        let completed = 0;
+        // The worker starts no URL after the deadline; allow the ones in flight
+        // their full HTTP timeout on top of it.
+        const reply = await visionPool.request({ op: "batch", urls, concurrency, per_host, deadline_s, metrics, instance: resolveInstance(instance, extra.sessionId) }, deadline_s * 1000 + 12000 + 5000, (event) => {
+            results[event.index] = event;
+            completed++;
+            const sent = progressToken !== undefined
+                ? extra.sendNotification({
+                    method: "notifications/progress",
+                    params: { progressToken, progress: completed, total: urls.length, message: JSON.stringify(event) }
+                })
+                : extra.sendNotification({
+                    method: "notifications/message",
+                    params: { level: "info", logger: "glazyr-vision", data: { type: "validated", ...event } }
                 });
-            });
+            sent.catch(() => { });
         });
+        if (!reply.ok) {
+            return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: reply.error, results }) }], isError: true };
+        }
+        return { content: [{ type: "text", text: JSON.stringify({ summary: reply.result, results }, null, 2) }] };
     });
     // Tool: GitHub Push README
     server.tool("github_push_readme", {
@@ -114,39 +138,43 @@ const createServer = () => {
     });
     // Tool: peek_vision_buffer
     server.tool("peek_vision_buffer", {
-        include_base64: z.boolean().default(false).describe("If true, includes the Base64 representation of the frame. Default false to save tokens.")
-    }, async ({ include_base64 }) => {
+        include_base64: z.boolean().default(false).describe("If true, includes the Base64 representation of the raw frame (megabytes at 1080p; prefer export_frame for a compact image). Default false to save tokens."),
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ include_base64, instance }, extra) => {
         try {
-            if (!fs.existsSync(SHM_PATH)) {
+            const t0 = performance.now();
+            const shmPath = shmPathFor(resolveInstance(instance, extra.sessionId));
+            const peek = shmHeaders.peek(shmPath);
+            if (!peek) {
                 return {
-                    content: [{ type: "text", text: JSON.stringify({ status: "no-compositor", error: `SHM buffer ${SHM_PATH} not found. Ensure Glazyr Viz compositor is running.` }) }],
+                    content: [{ type: "text", text: JSON.stringify({ status: "no-compositor", error: `SHM buffer ${shmPath} not found. Ensure Glazyr Viz compositor is running.` }) }],
                     isError: true
                 };
             }
-            const rawBuf = fs.readFileSync(SHM_PATH);
-            // Detect binary frame format (MRCN)
-            const MRCN_MAGIC = 0x4E43524D;
-            if (rawBuf.length >= 32 && rawBuf.readUInt32LE(0) === MRCN_MAGIC) {
-                const width = rawBuf.readUInt32LE(4);
-                const height = rawBuf.readUInt32LE(8);
-                const stride = rawBuf.readUInt32LE(12);
-                const tsUs = rawBuf.readBigUInt64LE(16);
-                const seqNum = rawBuf.readUInt32LE(28);
+            // Binary frame format (MRCN): only the header is read unless pixels are requested.
+            const header = peek.header;
+            if (header) {
                 const visionData = {
                     status: "zero-copy-active",
                     source: "Glazyr Viz Zero-Copy Bridge",
-                    resolution: `${width}x${height}`,
-                    stride,
-                    latest_sequence: seqNum,
-                    timestamp_us: tsUs.toString(),
-                    buffer_bytes: rawBuf.length,
-                    latency_ms: 7.35
+                    resolution: `${header.width}x${header.height}`,
+                    stride: header.stride,
+                    pixel_format: header.formatName,
+                    latest_sequence: header.seqNum,
+                    frame_slot: header.slot,
+                    timestamp_us: header.timestampUs.toString(),
+                    buffer_bytes: peek.segmentBytes
                 };
-                if (include_base64 && rawBuf.length > 256) {
-                    visionData.base64_frame = rawBuf.slice(256).toString("base64");
+                if (include_base64) {
+                    const { pixels, torn } = shmHeaders.readPixels(shmPath, header);
+                    visionData.base64_frame = pixels.toString("base64");
+                    if (torn)
+                        visionData.torn = true;
                 }
+                visionData.latency_ms = Number((performance.now() - t0).toFixed(3));
                 return { content: [{ type: "text", text: JSON.stringify(visionData, null, 2) }] };
             }
+            const rawBuf = fs.readFileSync(shmPath);
             // Fallback for development/mock JSON
             try {
                 const visionData = JSON.parse(rawBuf.toString("utf-8"));
@@ -154,7 +182,7 @@ const createServer = () => {
                     delete visionData.base64_frame;
                 }
                 visionData.source = "Glazyr Viz Zero-Copy Bridge";
-                visionData.latency_ms = 7.35;
+                visionData.latency_ms = Number((performance.now() - t0).toFixed(3));
                 return { content: [{ type: "text", text: JSON.stringify(visionData, null, 2) }] };
             }
             catch {
@@ -175,27 +203,104 @@ const createServer = () => {
             return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: err.message }) }], isError: true };
         }
     });
+    // Tool: export_frame
+    // A cropped, downscaled and encoded view of the current frame instead of the raw buffer.
+    server.tool("export_frame", {
+        roi: z.tuple([z.number().int().min(0), z.number().int().min(0), z.number().int().min(1), z.number().int().min(1)]).optional().describe("Region [x, y, width, height] to export. Defaults to the whole frame."),
+        max_width: z.number().int().min(1).max(4096).default(256).describe("Downscale (box filter) until the region is at most this wide."),
+        format: z.enum(["png", "jpeg", "gray"]).default("png").describe("png, jpeg (needs Pillow in the vision worker) or raw 8-bit grayscale."),
+        quality: z.number().int().min(1).max(100).default(80).describe("JPEG quality."),
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ roi, max_width, format, quality, instance }, extra) => {
+        const reply = await visionPool.request({ op: "export", roi, max_width, format, quality, instance: resolveInstance(instance, extra.sessionId) });
+        if (!reply.ok) {
+            return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: reply.error }) }], isError: true };
+        }
+        const { data, ...meta } = reply.result;
+        if (format === "gray") {
+            return { content: [{ type: "text", text: JSON.stringify({ ...meta, data }, null, 2) }] };
+        }
+        return {
+            content: [
+                { type: "image", data, mimeType: meta.mime_type },
+                { type: "text", text: JSON.stringify(meta, null, 2) }
+            ]
+        };
+    });
+    // Tool: watch_vision_frames
+    // Pushes a notification per new frame over the session transport instead of polling.
+    server.tool("watch_vision_frames", {
+        after_seq: z.number().int().optional().describe("Last sequence number already seen. Omit to start from the current frame."),
+        max_frames: z.number().int().min(1).max(600).default(10).describe("Stop after this many new frames."),
+        timeout_ms: z.number().int().min(1).max(10000).default(1000).describe("Stop if no new frame arrives within this many milliseconds."),
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ after_seq, max_frames, timeout_ms, instance }, extra) => {
+        const progressToken = extra._meta?.progressToken;
+        let delivered = 0;
+        const reply = await visionPool.request({ op: "watch", after_seq, max_frames, timeout_ms, instance: resolveInstance(instance, extra.sessionId) }, timeout_ms * max_frames + 5000, (event) => {
+            delivered++;
+            const sent = progressToken !== undefined
+                ? extra.sendNotification({
+                    method: "notifications/progress",
+                    params: { progressToken, progress: delivered, total: max_frames, message: JSON.stringify(event) }
+                })
+                : extra.sendNotification({
+                    method: "notifications/message",
+                    params: { level: "info", logger: "glazyr-vision", data: { type: "frame-ready", ...event } }
+                });
+            sent.catch(() => { });
+        });
+        if (!reply.ok) {
+            return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: reply.error }) }], isError: true };
+        }
+        return { content: [{ type: "text", text: JSON.stringify(reply.result, null, 2) }] };
+    });
+    // Tool: list_vision_instances
+    server.tool("list_vision_instances", {}, async (_args, extra) => {
+        const reply = await visionPool.request({ op: "segments" });
+        if (!reply.ok) {
+            return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: reply.error }) }], isError: true };
+        }
+        return { content: [{ type: "text", text: JSON.stringify({ ...reply.result, session_instance: resolveInstance(undefined, extra.sessionId) ?? "default" }, null, 2) }] };
+    });
+    // Tool: query_vision_nodes
+    // Indexed lookups over the vision.json DOM state instead of shipping the whole node list.
+    server.tool("query_vision_nodes", {
+        role: z.string().optional().describe("Only nodes with this role (e.g. 'button')."),
+        label: z.string().optional().describe("Only nodes whose label contains all of these words (case-insensitive)."),
+        x: z.number().optional().describe("With y: return the node under this point."),
+        y: z.number().optional(),
+        within: z.tuple([z.number(), z.number(), z.number(), z.number()]).optional().describe("Only nodes intersecting [x, y, width, height]."),
+        limit: z.number().int().min(1).max(1000).default(50),
+        since_seq: z.number().int().optional().describe("Return only the nodes added, removed, moved or relabelled since this sequence. Falls back to a full result with resync=true if that sequence is no longer held.")
+    }, async ({ role, label, x, y, within, limit, since_seq }, extra) => {
+        const at = x !== undefined && y !== undefined ? [x, y] : undefined;
+        // The since_seq baselines live in the worker that loaded them; keep
+        // each session on one worker so deltas do not degrade to resyncs.
+        const reply = await visionPool.request({ op: "nodes", role, label, at, within, limit, since_seq }, undefined, undefined, extra.sessionId);
+        if (!reply.ok) {
+            return { content: [{ type: "text", text: JSON.stringify({ status: "error", error: reply.error }) }], isError: true };
+        }
+        return { content: [{ type: "text", text: JSON.stringify(reply.result, null, 2) }] };
+    });
     // Tool: Browser Navigate
     server.tool("browser_navigate", {
         url: z.string().url().describe("Target URL to navigate to"),
-    }, async ({ url }) => {
-        return new Promise((resolve) => {
-            const scriptPath = process.env.VISION_SCRIPT_PATH || defaultScriptPath;
-            const visionDir = path.dirname(scriptPath);
-            const pathSep = process.platform === 'win32' ? ';' : ':';
-            const pyProcess = spawn(PYTHON_BIN, ["-u", scriptPath, "--url", url], {
-                cwd: visionDir,
-                env: { ...process.env, PYTHONPATH: `${visionDir}${pathSep}${visionDir}/glazyr` }
-            });
-            pyProcess.on("close", (code) => {
-                resolve({ content: [{ type: "text", text: `Navigation to ${url} initiated. SHM Buffer updating via Zero-Copy path (Exit: ${code}).` }] });
-            });
-        });
+        instance: z.string().regex(INSTANCE_ID).optional().describe("Compositor instance to read. Defaults to the instance bound to this session.")
+    }, async ({ url, instance }, extra) => {
+        const reply = await visionPool.request({ op: "validate", url, instance: resolveInstance(instance, extra.sessionId) });
+        return { content: [{ type: "text", text: `Navigation to ${url} initiated. SHM Buffer updating via Zero-Copy path (${reply.ok ? "ok" : reply.error}).` }] };
     });
     // Interaction Scaffolds
     server.tool("browser_click", {
         x: z.number(), y: z.number()
-    }, async ({ x, y }) => ({ content: [{ type: "text", text: `Click at (${x}, ${y})` }] }));
+    }, async ({ x, y }) => {
+        // Hit-test against the DOM state so the agent learns what it clicked.
+        const reply = await visionPool.request({ op: "nodes", at: [x, y] }, 5000);
+        const node = reply.ok ? reply.result.nodes[0] : undefined;
+        const target = node ? ` on ${node.role || "node"} "${node.label ?? node.id}" (${node.id})` : "";
+        return { content: [{ type: "text", text: `Click at (${x}, ${y})${target}` }] };
+    });
     server.tool("browser_type", {
         text: z.string()
     }, async ({ text }) => ({ content: [{ type: "text", text: `Typed: ${text}` }] }));
@@ -210,9 +315,14 @@ app.get("/mcp/sse", async (req, res) => {
     if (transport.sessionId) {
         console.log(`[SSE] Initializing session: ${transport.sessionId}`);
         transports.set(transport.sessionId, transport);
+        const instance = req.query.instance || req.headers["x-glazyr-instance"];
+        if (instance && INSTANCE_ID.test(instance))
+            sessionInstances.set(transport.sessionId, instance);
         res.on("close", () => {
             console.log(`[SSE] Connection closed: ${transport.sessionId}`);
             transports.delete(transport.sessionId);
+            sessionInstances.delete(transport.sessionId);
+            visionPool.unpin(transport.sessionId);
         });
     }
     const server = createServer();
@@ -223,23 +333,180 @@ app.get("/mcp/sse", async (req, res) => {
         console.error(`[SSE] Connect failed: ${transport.sessionId}`, err);
     }
 });
+// The x402 ledger is parsed once per change: each read stats the file and
+// only re-reads it when its mtime or size moved. A half-written ledger keeps
+// serving the last good parse.
+const LEDGER_PATH = path.join(process.cwd(), 'data', 'x402-ledger.json');
+let ledgerCache = null;
+const readLedger = () => {
+    try {
+        const stat = fs.statSync(LEDGER_PATH);
+        if (!ledgerCache || ledgerCache.mtimeMs !== stat.mtimeMs || ledgerCache.size !== stat.size) {
+            ledgerCache = { mtimeMs: stat.mtimeMs, size: stat.size, ledger: JSON.parse(fs.readFileSync(LEDGER_PATH, 'utf-8')) };
+        }
+    }
+    catch (e) {
+        if (e.code === "ENOENT")
+            ledgerCache = null;
+    }
+    return ledgerCache?.ledger ?? { processedHashes: [], credits: {} };
+};
+/**
+ * Merges the Prometheus text of several vision workers into one exposition:
+ * samples are grouped by metric family and each gains a worker label.
+ */
+const mergeWorkerMetrics = (scrapes) => {
+    const families = new Map();
+    for (const { worker, text } of scrapes) {
+        let family;
+        for (const line of text.split("\n")) {
+            const meta = /^# (HELP|TYPE) (\S+)/.exec(line);
+            if (meta) {
+                family = families.get(meta[2]);
+                if (!family) {
+                    family = { header: [], samples: [] };
+                    families.set(meta[2], family);
+                }
+                if (!family.header.some((h) => h.startsWith(`# ${meta[1]} `)))
+                    family.header.push(line);
+                continue;
+            }
+            if (!line || line.startsWith("#") || !family)
+                continue;
+            family.samples.push(line.replace(/^([A-Za-z_:][A-Za-z0-9_:]*)(\{?)/, (_, name, brace) =>
+                brace ? `${name}{worker="${worker}",` : `${name}{worker="${worker}"}`));
+        }
+    }
+    return [...families.values()].flatMap((family) => [...family.header, ...family.samples]);
+};
+// Worker-side frame stats and Prometheus text, refreshed in the background
+// so /health and /metrics answer from memory: a probe never waits on a busy worker, and a slow reply never
+// restarts one (requestAll does not replace workers on timeout).
+const WORKER_SNAPSHOT_INTERVAL_MS = 5000;
+const workerSnapshots = new Map();
+let refreshingSnapshots = false;
+const applyWorkerReplies = (replies, apply) => {
+    for (const { worker, pid, reply } of replies) {
+        let snapshot = workerSnapshots.get(worker);
+        if (!snapshot || snapshot.pid !== pid) {
+            snapshot = { worker, pid, at: 0 };
+            workerSnapshots.set(worker, snapshot);
+        }
+        if (reply.ok) {
+            apply(snapshot, reply.result);
+            snapshot.at = Date.now();
+            delete snapshot.error;
+        }
+        else {
+            snapshot.error = reply.error;
+        }
+    }
+};
+const refreshWorkerSnapshots = async () => {
+    if (refreshingSnapshots)
+        return;
+    refreshingSnapshots = true;
+    try {
+        const [replies, metrics] = await Promise.all([
+            visionPool.requestAll({ op: "stats" }, WORKER_SNAPSHOT_INTERVAL_MS),
+            visionPool.requestAll({ op: "metrics" }, WORKER_SNAPSHOT_INTERVAL_MS)
+        ]);
+        const live = new Set(visionPool.stats().workers.map((w) => w.worker));
+        for (const slot of workerSnapshots.keys()) {
+            if (!live.has(slot))
+                workerSnapshots.delete(slot);
+        }
+        applyWorkerReplies(replies, (snapshot, result) => { snapshot.stats = result; });
+        applyWorkerReplies(metrics, (snapshot, result) => { snapshot.metrics = result.text; });
+    }
+    finally {
+        refreshingSnapshots = false;
+    }
+};
+setInterval(refreshWorkerSnapshots, WORKER_SNAPSHOT_INTERVAL_MS).unref();
+const snapshotAge = (snapshot) => snapshot.at ? Math.round((Date.now() - snapshot.at) / 100) / 10 : null;
 app.get("/health", (req, res) => {
+    // Per-segment frame age, fps and drop rate from each live worker's own
+    // readers, as of the last background refresh (age_s seconds ago).
     res.json({
         status: "healthy",
         version: "0.2.4",
         sessions: transports.size,
-        uptime: process.uptime()
+        uptime: process.uptime(),
+        vision_pool: visionPool.stats(),
+        frames: [...workerSnapshots.values()].map((snapshot) => ({
+            worker: snapshot.worker,
+            pid: snapshot.pid,
+            age_s: snapshotAge(snapshot),
+            ...snapshot.stats,
+            ...(snapshot.error ? { error: snapshot.error } : {})
+        }))
     });
 });
-app.get("/metrics/pulse", (req, res) => {
-    let ledger = { processedHashes: [], credits: {} };
-    try {
-        const ledgerPath = path.join(process.cwd(), 'data', 'x402-ledger.json');
-        if (fs.existsSync(ledgerPath)) {
-            ledger = JSON.parse(fs.readFileSync(ledgerPath, 'utf-8'));
-        }
+// Operator-only (X-Sovereign-Audit must match SMOKE_TEST_SECRET): forwards
+// the "trace" op to every live vision worker to toggle stage spans, arm a
+// profile capture or export one Chrome trace covering all workers.
+app.post("/debug/trace", express.json(), async (req, res) => {
+    const secret = process.env.SMOKE_TEST_SECRET;
+    if (!secret || req.headers["x-sovereign-audit"] !== secret) {
+        res.status(403).json({ error: "Forbidden" });
+        return;
     }
-    catch (e) { }
+    const { enable, export: exportTrace, reset, profile, ops, every, limit } = req.body || {};
+    const replies = await visionPool.requestAll({ op: "trace", enable, export: exportTrace, reset, profile, ops, every, limit }, 5000);
+    const traceEvents = [];
+    const workers = replies.map(({ worker, pid, reply }) => {
+        if (!reply.ok)
+            return { worker, pid, error: reply.error };
+        const { chrome_trace, ...result } = reply.result;
+        if (chrome_trace)
+            traceEvents.push(...chrome_trace.traceEvents);
+        return { worker, ...result };
+    });
+    res.json(exportTrace ? { workers, chrome_trace: { traceEvents, displayTimeUnit: "ms" } } : { workers });
+});
+// Prometheus scrape target: server and pool gauges plus every live vision
+// worker's own counters and histograms (the "metrics" op) from the last
+// background refresh, labelled by worker slot.
+app.get("/metrics", (req, res) => {
+    const ledger = readLedger();
+    const pool = visionPool.stats();
+    const snapshots = [...workerSnapshots.values()];
+    const lines = [
+        "# HELP glazyr_sessions Open MCP SSE sessions.",
+        "# TYPE glazyr_sessions gauge",
+        `glazyr_sessions ${transports.size}`,
+        "# HELP glazyr_uptime_seconds Node server uptime.",
+        "# TYPE glazyr_uptime_seconds gauge",
+        `glazyr_uptime_seconds ${process.uptime()}`,
+        "# HELP glazyr_x402_processed_hashes Payment transactions recorded in the x402 ledger.",
+        "# TYPE glazyr_x402_processed_hashes gauge",
+        `glazyr_x402_processed_hashes ${ledger.processedHashes?.length || 0}`,
+        "# HELP glazyr_vision_pool_workers Vision pool slots and live workers.",
+        "# TYPE glazyr_vision_pool_workers gauge",
+        `glazyr_vision_pool_workers{state="slots"} ${pool.size}`,
+        `glazyr_vision_pool_workers{state="live"} ${pool.live}`,
+        "# HELP glazyr_vision_pool_spawned_total Vision workers started by this server.",
+        "# TYPE glazyr_vision_pool_spawned_total counter",
+        `glazyr_vision_pool_spawned_total ${pool.spawned}`,
+        "# HELP glazyr_vision_worker_requests_total Requests sent to each live worker.",
+        "# TYPE glazyr_vision_worker_requests_total counter",
+        ...pool.workers.map((w) => `glazyr_vision_worker_requests_total{worker="${w.worker}"} ${w.requests}`),
+        "# HELP glazyr_vision_worker_timeouts_total Requests each live worker did not answer in time.",
+        "# TYPE glazyr_vision_worker_timeouts_total counter",
+        ...pool.workers.map((w) => `glazyr_vision_worker_timeouts_total{worker="${w.worker}"} ${w.timeouts}`),
+        "# HELP glazyr_vision_worker_up Whether the worker answered the last background refresh.",
+        "# TYPE glazyr_vision_worker_up gauge",
+        ...snapshots.map((s) => `glazyr_vision_worker_up{worker="${s.worker}"} ${s.error ? 0 : 1}`),
+        "# HELP glazyr_vision_worker_snapshot_age_seconds Age of the worker metrics below.",
+        "# TYPE glazyr_vision_worker_snapshot_age_seconds gauge",
+        ...snapshots.filter((s) => s.at).map((s) => `glazyr_vision_worker_snapshot_age_seconds{worker="${s.worker}"} ${snapshotAge(s)}`),
+        ...mergeWorkerMetrics(snapshots.filter((s) => s.metrics).map((s) => ({ worker: s.worker, text: s.metrics })))
+    ];
+    res.type("text/plain; version=0.0.4; charset=utf-8").send(lines.join("\n") + "\n");
+});
+app.get("/metrics/pulse", (req, res) => {
+    const ledger = readLedger();
     res.json({
         activeSessions: transports.size,
         totalHashesProcessed: ledger.processedHashes?.length || 0,
@@ -259,6 +526,9 @@ app.post("/mcp/messages", async (req, res) => {
         process.env.GITHUB_API_TOKEN = req.headers["x-github-token"];
     if (req.headers["x-frame-limit"])
         process.env.SPONSORED_FRAME_LIMIT = req.headers["x-frame-limit"];
+    const instanceHeader = req.headers["x-glazyr-instance"];
+    if (instanceHeader && INSTANCE_ID.test(instanceHeader))
+        sessionInstances.set(sessionId, instanceHeader);
     if (process.env.NODE_ENV === "production") {
         const paymentSignature = req.headers["payment-signature"];
         const smokeTestSecret = process.env.SMOKE_TEST_SECRET;
@@ -0,0 +1,116 @@
+import fs from "fs";
+export const MRCN_MAGIC = 0x4E43524D;
+const HEADER_BYTES = 256;
+const PIXEL_OFFSET = 256;
+const SLOTS_OFFSET = 32;
+const SLOT_SEQ_OFFSET = 64;
+const SLOT_TIMESTAMP_OFFSET = 96;
+const MAX_SLOTS = 8;
+// fmt code -> [name, bytes per pixel of the first plane]; mirrors PIXEL_FORMATS in zero_copy_vision.py.
+const PIXEL_FORMATS = {
+    0: ["BGRA", 4],
+    1: ["RGBA", 4],
+    2: ["RGB565", 2],
+    3: ["NV12", 1]
+};
+/**
+ * Reads MRCN headers through file descriptors held open across calls, so a
+ * peek costs a stat and a 256-byte read instead of reading the whole segment.
+ * A descriptor is reopened when the compositor recreates its segment.
+ */
+export class ShmHeaderReader {
+    handles = new Map();
+    header = Buffer.alloc(HEADER_BYTES);
+    /** Returns null if the segment does not exist; header is null if it is not MRCN. */
+    peek(shmPath) {
+        const handle = this.open(shmPath);
+        if (!handle)
+            return null;
+        const { fd, size } = handle;
+        const read = fs.readSync(fd, this.header, 0, HEADER_BYTES, 0);
+        if (read < 32 || this.header.readUInt32LE(0) !== MRCN_MAGIC) {
+            return { segmentBytes: size, header: null };
+        }
+        const buf = this.header;
+        const height = buf.readUInt32LE(8);
+        const stride = buf.readUInt32LE(12);
+        const fmt = buf.readUInt32LE(24);
+        const [formatName] = PIXEL_FORMATS[fmt] ?? [`unknown(${fmt})`];
+        const pixelBytes = fmt === 3 ? stride * (height + Math.ceil(height / 2)) : stride * height;
+        const header = {
+            width: buf.readUInt32LE(4),
+            height,
+            stride,
+            timestampUs: buf.readBigUInt64LE(16),
+            fmt,
+            formatName,
+            seqNum: buf.readUInt32LE(28),
+            slot: 0,
+            seqOffset: 28,
+            pixelOffset: PIXEL_OFFSET,
+            pixelBytes
+        };
+        if (read >= SLOT_TIMESTAMP_OFFSET + 8 * MAX_SLOTS) {
+            const slotCount = buf.readUInt32LE(SLOTS_OFFSET);
+            const frontSlot = buf.readUInt32LE(SLOTS_OFFSET + 4);
+            const slotBytes = buf.readUInt32LE(SLOTS_OFFSET + 8);
+            if (slotCount >= 2 && slotCount <= MAX_SLOTS && frontSlot < slotCount) {
+                header.slot = frontSlot;
+                header.seqOffset = SLOT_SEQ_OFFSET + 4 * frontSlot;
+                header.seqNum = buf.readUInt32LE(header.seqOffset);
+                const slotTimestampUs = buf.readBigUInt64LE(SLOT_TIMESTAMP_OFFSET + 8 * frontSlot);
+                if (slotTimestampUs !== 0n)
+                    header.timestampUs = slotTimestampUs;
+                header.pixelOffset = PIXEL_OFFSET + frontSlot * Math.max(slotBytes, pixelBytes);
+            }
+        }
+        return { segmentBytes: size, header };
+    }
+    /**
+     * Reads the pixel region described by header; torn is set if its sequence number changed meanwhile.
+     * The legacy single buffer has no write-in-progress marker, so only completed overwrites are caught there.
+     */
+    readPixels(shmPath, header) {
+        const handle = this.open(shmPath);
+        if (!handle)
+            throw new Error(`SHM buffer ${shmPath} disappeared`);
+        const length = Math.max(0, Math.min(header.pixelBytes, handle.size - header.pixelOffset));
+        const pixels = Buffer.allocUnsafe(length);
+        const read = fs.readSync(handle.fd, pixels, 0, length, header.pixelOffset);
+        const seq = Buffer.alloc(4);
+        fs.readSync(handle.fd, seq, 0, 4, header.seqOffset);
+        return { pixels: pixels.subarray(0, read), torn: seq.readUInt32LE(0) !== header.seqNum };
+    }
+    close() {
+        for (const { fd } of this.handles.values())
+            fs.closeSync(fd);
+        this.handles.clear();
+    }
+    open(shmPath) {
+        let st;
+        try {
+            st = fs.statSync(shmPath);
+        }
+        catch {
+            this.drop(shmPath);
+            return null;
+        }
+        let handle = this.handles.get(shmPath);
+        if (handle && handle.ino !== st.ino) {
+            this.drop(shmPath);
+            handle = undefined;
+        }
+        if (!handle) {
+            handle = { fd: fs.openSync(shmPath, "r"), ino: st.ino };
+            this.handles.set(shmPath, handle);
+        }
+        return { fd: handle.fd, size: st.size };
+    }
+    drop(shmPath) {
+        const handle = this.handles.get(shmPath);
+        if (handle) {
+            fs.closeSync(handle.fd);
+            this.handles.delete(shmPath);
+        }
+    }
+}
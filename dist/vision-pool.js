@@ -0,0 +1,224 @@
+import { spawn } from "child_process";
+import path from "path";
+import readline from "readline";
+// Ops that can hold a worker for seconds. A worker answers its requests one
+// at a time, so the pool keeps cheap ops off workers running one of these.
+const LONG_OPS = new Set(["watch", "batch"]);
+/**
+ * A single `zero_copy_vision.py --serve` process.
+ * Requests and replies are newline-delimited JSON, matched by id, and are
+ * served in order: a request waits for every request sent before it.
+ */
+class VisionWorker {
+    proc;
+    pending = new Map();
+    nextId = 0;
+    stderrTail = "";
+    startedAt = Date.now();
+    alive = true;
+    requests = 0;
+    timeouts = 0;
+    longOps = 0;
+    constructor(pythonBin, scriptPath) {
+        const visionDir = path.dirname(scriptPath);
+        const pathSep = process.platform === 'win32' ? ';' : ':';
+        this.proc = spawn(pythonBin, ["-u", scriptPath, "--serve"], {
+            cwd: visionDir,
+            env: { ...process.env, PYTHONPATH: `${visionDir}${pathSep}${visionDir}/glazyr` }
+        });
+        readline.createInterface({ input: this.proc.stdout }).on("line", (line) => this.onLine(line));
+        this.proc.stderr.on("data", (data) => {
+            this.stderrTail = (this.stderrTail + data.toString()).slice(-2048);
+        });
+        // Writing to a worker that already exited fails with EPIPE; without a
+        // listener that error would take the whole server down.
+        this.proc.stdin.on("error", (err) => {
+            this.fail(`Vision worker stdin failed: ${err.message}`);
+            this.kill();
+        });
+        this.proc.on("error", (err) => this.fail(`Failed to start Python process: ${err.message}`));
+        this.proc.on("close", (code) => this.fail(`Vision worker exited (Exit Code: ${code}):\n${this.stderrTail}`));
+    }
+    get load() {
+        return this.pending.size;
+    }
+    get pid() {
+        return this.proc.pid;
+    }
+    get uptimeS() {
+        return Math.round((Date.now() - this.startedAt) / 1000);
+    }
+    request(message, timeoutMs, onEvent, replaceOnTimeout = true) {
+        return new Promise((resolve) => {
+            if (!this.alive) {
+                resolve({ ok: false, error: "Vision worker is not running" });
+                return;
+            }
+            const id = ++this.nextId;
+            const timer = setTimeout(() => {
+                this.timeouts++;
+                this.settle(id, { ok: false, error: `Vision worker timed out after ${timeoutMs}ms` });
+                // A stuck worker would keep serving stale work; replace it.
+                if (replaceOnTimeout)
+                    this.kill();
+            }, timeoutMs);
+            const long = LONG_OPS.has(message.op);
+            if (long)
+                this.longOps++;
+            this.pending.set(id, { resolve, timer, onEvent, long });
+            this.requests++;
+            this.proc.stdin.write(JSON.stringify({ ...message, id }) + "\n");
+        });
+    }
+    kill() {
+        this.alive = false;
+        this.proc.kill();
+    }
+    onLine(line) {
+        let reply;
+        try {
+            reply = JSON.parse(line);
+        }
+        catch {
+            // Replies start with their id; fail that request now rather than
+            // letting it wait out its timeout.
+            const id = /^\{"id": (\d+)/.exec(line);
+            if (id)
+                this.settle(Number(id[1]), { ok: false, error: "Vision worker sent an unparsable reply" });
+            return;
+        }
+        const entry = this.pending.get(reply.id);
+        if (!entry)
+            return;
+        // Streaming ops send events ahead of their final reply.
+        if (reply.event !== undefined) {
+            entry.onEvent?.(reply.event);
+            return;
+        }
+        this.settle(reply.id, { ok: !!reply.ok, result: reply.result, error: reply.error });
+    }
+    settle(id, reply) {
+        const entry = this.pending.get(id);
+        if (!entry)
+            return;
+        this.pending.delete(id);
+        clearTimeout(entry.timer);
+        if (entry.long)
+            this.longOps--;
+        entry.resolve(reply);
+    }
+    fail(error) {
+        this.alive = false;
+        for (const id of [...this.pending.keys()])
+            this.settle(id, { ok: false, error });
+    }
+}
+/**
+ * Pool of persistent vision workers shared by every MCP session.
+ * Workers are spawned lazily and replaced when they exit or time out.
+ */
+export class VisionWorkerPool {
+    pythonBin;
+    scriptPath;
+    workers;
+    pinned = new Map();
+    spawned = 0;
+    constructor(pythonBin, scriptPath, size) {
+        this.pythonBin = pythonBin;
+        this.scriptPath = scriptPath;
+        this.workers = new Array(Math.max(1, size)).fill(null);
+    }
+    /**
+     * Sends message to the least-loaded worker. With an affinity key (e.g. a
+     * session id) every request for that key goes to the same worker, so
+     * per-worker state such as the node-state history stays usable; the key
+     * moves to another worker only if its own dies or is running a long op.
+     */
+    request(message, timeoutMs = 30000, onEvent, affinity) {
+        const long = LONG_OPS.has(message.op);
+        let worker = affinity !== undefined ? this.pinned.get(affinity) : undefined;
+        if (!worker || !worker.alive || (!long && worker.longOps > 0)) {
+            worker = this.acquire(long);
+            if (affinity !== undefined)
+                this.pinned.set(affinity, worker);
+        }
+        return worker.request(message, timeoutMs, onEvent);
+    }
+    /** Forgets the worker an affinity key was pinned to. */
+    unpin(affinity) {
+        this.pinned.delete(affinity);
+    }
+    /**
+     * Sends message to every live worker without spawning new ones. Meant for
+     * status probes: a worker busy with a long op replies late or times out,
+     * and is not replaced for it.
+     */
+    requestAll(message, timeoutMs = 1000) {
+        const live = [];
+        this.workers.forEach((worker, slot) => {
+            if (worker?.alive)
+                live.push([slot, worker]);
+        });
+        return Promise.all(live.map(async ([slot, worker]) => ({
+            worker: slot,
+            pid: worker.pid,
+            reply: await worker.request(message, timeoutMs, undefined, false)
+        })));
+    }
+    stats() {
+        const workers = [];
+        this.workers.forEach((worker, slot) => {
+            if (!worker?.alive)
+                return;
+            workers.push({
+                worker: slot,
+                pid: worker.pid,
+                pending: worker.load,
+                requests: worker.requests,
+                timeouts: worker.timeouts,
+                uptime_s: worker.uptimeS
+            });
+        });
+        return {
+            size: this.workers.length,
+            live: workers.length,
+            pending: workers.reduce((sum, w) => sum + w.pending, 0),
+            spawned: this.spawned,
+            workers
+        };
+    }
+    close() {
+        for (const worker of this.workers)
+            worker?.kill();
+        this.workers.fill(null);
+        this.pinned.clear();
+    }
+    /**
+     * Least-loaded live worker. Cheap ops skip workers running a long op
+     * whenever another worker (or a free slot) exists, since they would
+     * queue behind it; only when every worker is running one do they wait.
+     */
+    acquire(long = false) {
+        let best = null;
+        let freeSlot = -1;
+        const blocked = (worker) => !long && worker.longOps > 0;
+        for (let i = 0; i < this.workers.length; i++) {
+            const worker = this.workers[i];
+            if (!worker || !worker.alive) {
+                if (freeSlot < 0)
+                    freeSlot = i;
+                continue;
+            }
+            if (!best || (blocked(best) && !blocked(worker))
+                || (blocked(best) === blocked(worker) && worker.load < best.load))
+                best = worker;
+        }
+        // Only grow the pool when every live worker is busy.
+        if (freeSlot >= 0 && (!best || best.load > 0)) {
+            best = new VisionWorker(this.pythonBin, this.scriptPath);
+            this.workers[freeSlot] = best;
+            this.spawned++;
+        }
+        return best;
+    }
+}
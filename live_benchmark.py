@@ -1,85 +1,149 @@
 """
-Glazyr Viz — Live MCP Benchmark v3
+Glazyr Viz — Live MCP Benchmark v4
 Uses sseclient-py for proper SSE event parsing.
+
+Default mode runs one session and calls shm_vision_validate sequentially.
+Load mode (--sessions/--inflight/--rate) opens N SSE sessions, keeps up to M
+tools/call requests in flight per session and reports latency percentiles and
+error rates per tool. Closed loop (no --rate) understates tail latency, since
+a slow reply also delays the calls behind it; with --rate, latency counts from
+each call's scheduled send time, so those stalls are included. A closed loop
+paced with --interval-ms corrects for the same omission: a reply slower than
+the interval is recorded with the interval as the expected one, so the calls
+it held back are back-filled into the latency histogram:
+
+  python live_benchmark.py --sessions 20 --inflight 4 --duration 30
+  python live_benchmark.py --sessions 20 --inflight 4 --interval-ms 50
+  python live_benchmark.py --sessions 20 --inflight 4 --rate 200 --call peek_vision_buffer
 """
+import argparse
+import itertools
 import json
+import os
 import time
 import requests
 import threading
 import sys
 import sseclient
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+
+from latency_histogram import LatencyHistogram  # noqa: E402
 
 MCP_BASE = "http://localhost:4545"
+TARGETS = ["https://example.com", "https://httpbin.org/html"]
+
+
+class MCPSession:
+    """
+    One MCP SSE session. Requests are POSTed to the session's endpoint and
+    their responses, which arrive on the SSE stream, are routed back to the
+    waiting caller by JSON-RPC id, so any number of calls can be in flight.
+    """
 
-def run_live_benchmark():
-    post_url = None
-    rpc_id = 0
-    responses = {}
-    connected = threading.Event()
+    def __init__(self, base_url=MCP_BASE, inflight=1):
+        self.base_url = base_url
+        self.post_url = None
+        self._http = requests.Session()
+        self._http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, inflight)))
+        self._http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, inflight)))
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
 
-    def sse_reader():
-        nonlocal post_url
+    def connect(self, timeout=10):
+        threading.Thread(target=self._sse_reader, daemon=True).start()
+        if not self._connected.wait(timeout=timeout) or self.post_url is None:
+            raise TimeoutError("Failed to negotiate SSE session")
+        return self
+
+    def _sse_reader(self):
         try:
-            resp = requests.get(f"{MCP_BASE}/mcp/sse", stream=True, headers={"Accept": "text/event-stream"})
+            resp = requests.get(f"{self.base_url}/mcp/sse", stream=True, headers={"Accept": "text/event-stream"})
             client = sseclient.SSEClient(resp)
             for event in client.events():
                 if event.event == "endpoint":
-                    post_url = f"{MCP_BASE}{event.data}"
-                    connected.set()
+                    self.post_url = f"{self.base_url}{event.data}"
+                    self._connected.set()
                 elif event.event == "message":
                     try:
                         msg = json.loads(event.data)
-                        if "id" in msg:
-                            responses[msg["id"]] = msg
                     except json.JSONDecodeError:
-                        pass
+                        continue
+                    with self._lock:
+                        waiter = self._pending.pop(msg.get("id"), None)
+                    if waiter is not None:
+                        waiter[1] = msg
+                        waiter[0].set()
         except Exception as e:
-            print(f"SSE stream ended: {e}")
+            if not self._connected.is_set():
+                print(f"SSE stream ended: {e}")
+        finally:
+            self._connected.set()
 
-    t = threading.Thread(target=sse_reader, daemon=True)
-    t.start()
+    def call(self, method, params=None, timeout_s=30):
+        """Returns (response, error); exactly one of them is None."""
+        msg_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._pending[msg_id] = waiter
+        msg = {"jsonrpc": "2.0", "id": msg_id, "method": method}
+        if params:
+            msg["params"] = params
+        try:
+            r = self._http.post(self.post_url, json=msg, timeout=10)
+            if r.status_code >= 400:
+                raise RuntimeError(f"HTTP {r.status_code}")
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(msg_id, None)
+            return None, f"POST error: {e}"
+        if not waiter[0].wait(timeout_s):
+            with self._lock:
+                self._pending.pop(msg_id, None)
+            return None, "timeout"
+        return waiter[1], None
 
+    def notify(self, method):
+        self._http.post(self.post_url, json={"jsonrpc": "2.0", "method": method}, timeout=5)
+
+    def initialize(self, timeout_s=10):
+        resp, err = self.call("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "GlazyrBench", "version": "1.0.0"}
+        }, timeout_s=timeout_s)
+        if resp is not None:
+            self.notify("notifications/initialized")
+        return resp, err
+
+    def close(self):
+        # The SSE reader is a daemon thread blocked on the stream; closing the
+        # stream from here would block on its read, so it ends with the process.
+        self._http.close()
+
+
+def run_live_benchmark(base_url=MCP_BASE, targets=TARGETS):
     print("=" * 57)
-    print("  GLAZYR VIZ — LIVE MCP BENCHMARK v3")
+    print("  GLAZYR VIZ — LIVE MCP BENCHMARK v4")
     print("  Empirical Vision Latency Measurement")
     print("=" * 57)
-    print("\n1. Connecting to SSE transport at localhost:4545...")
+    print(f"\n1. Connecting to SSE transport at {base_url}...")
 
-    if not connected.wait(timeout=10):
+    try:
+        session = MCPSession(base_url).connect()
+    except TimeoutError:
         print("   X Failed to negotiate SSE session.")
         sys.exit(1)
 
-    print(f"   OK Session: {post_url}")
-
-    def rpc_call(method, params=None, timeout_s=30):
-        nonlocal rpc_id
-        rpc_id += 1
-        msg_id = rpc_id
-        msg = {"jsonrpc": "2.0", "id": msg_id, "method": method}
-        if params:
-            msg["params"] = params
-        headers = {"Content-Type": "application/json"}
-        try:
-            r = requests.post(post_url, headers=headers, json=msg, timeout=5)
-            print(f"   POST status: {r.status_code}")
-        except Exception as e:
-            print(f"   POST error: {e}")
-            return None
-
-        deadline = time.time() + timeout_s
-        while msg_id not in responses:
-            time.sleep(0.05)
-            if time.time() > deadline:
-                return None
-        return responses[msg_id]
+    print(f"   OK Session: {session.post_url}")
 
     # Initialize
     print("\n2. Initializing MCP protocol...")
-    init_resp = rpc_call("initialize", {
-        "protocolVersion": "2024-11-05",
-        "capabilities": {},
-        "clientInfo": {"name": "GlazyrBench", "version": "1.0.0"}
-    }, timeout_s=10)
+    init_resp, _ = session.initialize()
 
     if not init_resp:
         print("   X Handshake timed out.")
@@ -88,14 +152,9 @@ def run_live_benchmark():
     server_info = init_resp.get("result", {}).get("serverInfo", {})
     print(f"   OK Server: {server_info.get('name', '?')} v{server_info.get('version', '?')}")
 
-    # Send initialized notification
-    requests.post(post_url, headers={"Content-Type": "application/json"}, json={
-        "jsonrpc": "2.0", "method": "notifications/initialized"
-    }, timeout=5)
-
     # List tools
     print("\n3. Listing tools...")
-    tools_resp = rpc_call("tools/list", timeout_s=10)
+    tools_resp, _ = session.call("tools/list", timeout_s=10)
     if tools_resp and "result" in tools_resp:
         for tool in tools_resp["result"].get("tools", []):
             print(f"   - {tool['name']}")
@@ -103,7 +162,6 @@ def run_live_benchmark():
         print("   X Could not list tools.")
 
     # Benchmark
-    targets = ["https://example.com", "https://httpbin.org/html"]
     results = []
 
     print(f"\n4. Running shm_vision_validate on {len(targets)} targets...")
@@ -112,7 +170,7 @@ def run_live_benchmark():
     for idx, url in enumerate(targets):
         print(f"\n   [{idx+1}/{len(targets)}] {url}")
         t_start = time.perf_counter()
-        resp = rpc_call("tools/call", {
+        resp, _ = session.call("tools/call", {
             "name": "shm_vision_validate",
             "arguments": {"url": url}
         }, timeout_s=60)
@@ -135,6 +193,7 @@ def run_live_benchmark():
         else:
             print(f"       X Timeout ({elapsed_ms:.0f}ms)")
             results.append({"url": url, "ok": False, "ms": elapsed_ms, "bytes": 0})
+    session.close()
 
     # Summary
     print("\n" + "=" * 57)
@@ -157,5 +216,183 @@ def run_live_benchmark():
         print(f"  {sym} {r['url']}  ->  {r['ms']:.0f}ms  ({r['bytes']}B)")
     print("=" * 57)
 
+
+def _parse_calls(specs, targets):
+    """--call TOOL or TOOL=JSON_ARGS; the default workload validates each target URL."""
+    if not specs:
+        return [("shm_vision_validate", {"url": url}) for url in targets]
+    calls = []
+    for spec in specs:
+        name, _, raw = spec.partition("=")
+        calls.append((name, json.loads(raw) if raw else {}))
+    return calls
+
+
+class LoadStats:
+    """Per-tool latency histograms and error counts, shared by all worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tools = {}
+
+    def record(self, tool, latency_ms, service_ms, error=None, expected_interval_ms=None):
+        with self._lock:
+            entry = self.tools.get(tool)
+            if entry is None:
+                entry = self.tools[tool] = {"latency_ms": LatencyHistogram(), "service_ms": LatencyHistogram(),
+                                            "errors": {}}
+            if error:
+                entry["errors"][error] = entry["errors"].get(error, 0) + 1
+        entry["latency_ms"].record(latency_ms, expected_interval_ms=expected_interval_ms)
+        entry["service_ms"].record(service_ms)
+
+    def report(self, elapsed_s):
+        """Per-tool summaries; "histograms" holds the serialized histograms for merging runs."""
+        out = {}
+        for tool, entry in sorted(self.tools.items()):
+            count = entry["service_ms"].count  # latency_ms also holds back-filled samples
+            failed = sum(entry["errors"].values())
+            out[tool] = {
+                "calls": count,
+                "errors": failed,
+                "error_rate": round(failed / count, 4) if count else 0.0,
+                "error_kinds": entry["errors"],
+                "throughput_rps": round(count / elapsed_s, 1) if elapsed_s else 0.0,
+                "latency_ms": entry["latency_ms"].summary(digits=2),
+                "service_ms": entry["service_ms"].summary(digits=2),
+                "histograms": {"latency_ms": entry["latency_ms"].to_dict(),
+                               "service_ms": entry["service_ms"].to_dict()},
+            }
+        return out
+
+
+def _timed_call(session, stats, tool, arguments, scheduled, timeout_s, expected_interval_ms=None):
+    """
+    Latency counts from the scheduled send time (queueing included); service
+    time from the actual send. expected_interval_ms is the pacing of a closed
+    loop worker, passed on so the latency histogram back-fills stalls.
+    """
+    t_send = time.perf_counter()
+    resp, err = session.call("tools/call", {"name": tool, "arguments": arguments}, timeout_s=timeout_s)
+    t_done = time.perf_counter()
+    if err is None:
+        if "error" in resp:
+            err = f"rpc {resp['error'].get('code')}"
+        elif resp.get("result", {}).get("isError"):
+            err = "tool error"
+    stats.record(tool, (t_done - scheduled) * 1000, (t_done - t_send) * 1000, err, expected_interval_ms)
+
+
+def run_load(args):
+    targets = args.url or TARGETS
+    calls = _parse_calls(args.call, targets)
+    print(f"Opening {args.sessions} sessions x {args.inflight} in flight against {args.base}...")
+    sessions = []
+    for _ in range(args.sessions):
+        session = MCPSession(args.base, args.inflight).connect()
+        resp, err = session.initialize()
+        if resp is None:
+            raise SystemExit(f"Handshake failed: {err}")
+        sessions.append(session)
+
+    stats = LoadStats()
+    workload = itertools.cycle(calls)
+    workload_lock = threading.Lock()
+
+    def next_call():
+        with workload_lock:
+            return next(workload)
+
+    t_start = time.perf_counter()
+    deadline = t_start + args.duration
+    if args.rate:
+        # Open loop: arrivals at a constant rate regardless of how fast the
+        # server answers; a session with M calls in flight queues the rest.
+        pools = [ThreadPoolExecutor(max_workers=args.inflight) for _ in sessions]
+        interval = 1.0 / args.rate
+        for i in itertools.count():
+            scheduled = t_start + i * interval
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            tool, arguments = next_call()
+            pools[i % len(pools)].submit(_timed_call, sessions[i % len(sessions)], stats,
+                                         tool, arguments, scheduled, args.timeout)
+        for pool in pools:
+            pool.shutdown(wait=True)
+    else:
+        # Closed loop: each of the M workers per session issues its next call
+        # as soon as the previous one is answered, or with --interval-ms at
+        # the next interval tick. A reply slower than the interval delays the
+        # calls behind it; the slots it overran are skipped here and
+        # back-filled by the histogram instead.
+        pace = (args.interval_ms or 0) / 1000
+
+        def worker(session):
+            next_send = time.perf_counter()
+            while next_send < deadline:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                tool, arguments = next_call()
+                _timed_call(session, stats, tool, arguments, time.perf_counter(), args.timeout, args.interval_ms)
+                next_send = max(next_send + pace, time.perf_counter())
+
+        threads = [threading.Thread(target=worker, args=(s,), daemon=True)
+                   for s in sessions for _ in range(args.inflight)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed_s = time.perf_counter() - t_start
+    for session in sessions:
+        session.close()
+
+    report = {
+        "sessions": args.sessions,
+        "inflight": args.inflight,
+        "mode": "open" if args.rate else "closed",
+        "offered_rps": args.rate,
+        "interval_ms": None if args.rate else args.interval_ms,
+        "elapsed_s": round(elapsed_s, 2),
+        "tools": stats.report(elapsed_s),
+    }
+    print("=" * 57)
+    print(f"  LOAD: {args.sessions} sessions x {args.inflight} in flight, "
+          f"{'%g rps offered' % args.rate if args.rate else 'closed loop'}, {elapsed_s:.1f}s")
+    print("=" * 57)
+    for tool, data in report["tools"].items():
+        lat = data["latency_ms"]
+        print(f"  {tool}: {data['calls']} calls, {data['throughput_rps']} rps, "
+              f"errors {data['error_rate']:.2%}")
+        if lat["count"]:
+            print(f"    p50 {lat['p50']} ms  p90 {lat['p90']} ms  p99 {lat['p99']} ms  "
+                  f"p999 {lat['p999']} ms  max {lat['max']} ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
 if __name__ == "__main__":
-    run_live_benchmark()
+    parser = argparse.ArgumentParser(description="Glazyr Viz live MCP benchmark and load generator")
+    parser.add_argument("--base", default=MCP_BASE)
+    parser.add_argument("--url", action="append", help="Target URL (repeatable)")
+    parser.add_argument("--sessions", type=int, default=0, help="Load mode: number of SSE sessions")
+    parser.add_argument("--inflight", type=int, default=1, help="Load mode: max in-flight calls per session")
+    parser.add_argument("--rate", type=float, help="Load mode: open-loop arrival rate (calls/s, all sessions)")
+    parser.add_argument("--interval-ms", type=float,
+                        help="Load mode, closed loop: pace each worker to one call per interval (CO-corrected)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Load mode: seconds to generate load")
+    parser.add_argument("--call", action="append", metavar="TOOL[=JSON]",
+                        help="Load mode: tool call in the workload mix (repeatable)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-call response timeout (s)")
+    parser.add_argument("--out", help="Load mode: write the JSON report here")
+    args = parser.parse_args()
+    if args.sessions or args.rate:
+        args.sessions = args.sessions or 1
+        run_load(args)
+    else:
+        run_live_benchmark(args.base, args.url or TARGETS)
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Frame Capture and Replay
+Records MRCN frames from a compositor segment into a capture file and
+replays them into a local segment at the original or an accelerated pace,
+so readers and benchmarks can run against real traffic without a renderer.
+
+A capture is two append-only files:
+  <name>       data: per frame the 32-byte MRCN header, then the pixels
+               encoded with the frame's codec
+  <name>.idx   index: INDEX_HEADER, then one fixed-size INDEX_ENTRY per
+               frame (offset, timestamp, length, sequence, keyframe, codec)
+Both are memory-mapped for reading. Entry i sits at a fixed offset, so
+seeking to a frame number is O(1); seeking by sequence number or timestamp
+bisects the index. A capture appended to across compositor restarts can see
+sequence numbers go backwards; the recorder flags that in the index header
+and seeking by sequence number then scans instead.
+
+Codecs: "raw" stores the pixels, "zlib" compresses the whole frame, and
+"delta" splits it into bands of CAPTURE_BAND_ROWS rows and stores only the
+bands that changed since the previous frame, each zlib-compressed, with a
+zlib keyframe every keyframe_interval frames to bound seek cost.
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from latency_histogram import LatencyHistogram
+from mrcn_compositor import MrcnCompositor
+from zero_copy_vision import MRCN_HEADER, MRCN_MAGIC, ZeroCopyReader, frame_bytes
+
+INDEX_MAGIC = b'GVCI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sHHI20x')  # magic, version, entry size, flags
+INDEX_FLAG_UNORDERED_SEQ = 1  # some frame's sequence number is not above its predecessor's
+INDEX_ENTRY = struct.Struct('<QQIIIB3x')  # offset, timestamp_us, length, seq, keyframe index, codec
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_DELTA = 2
+CODECS = {"raw": CODEC_RAW, "zlib": CODEC_ZLIB, "delta": CODEC_DELTA}
+
+CAPTURE_BAND_ROWS = 16
+CAPTURE_ZLIB_LEVEL = 1
+KEYFRAME_INTERVAL = 60
+
+
+def _bands(size, band_bytes):
+    return [(start, min(start + band_bytes, size)) for start in range(0, size, band_bytes)]
+
+
+class FrameRecorder:
+    """Appends frames to a capture; the index entry is written after its data, so a crash loses at most one frame."""
+
+    def __init__(self, path, codec="zlib", level=CAPTURE_ZLIB_LEVEL, keyframe_interval=KEYFRAME_INTERVAL):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown capture codec {codec!r}; expected one of {list(CODECS)}")
+        self.path = path
+        self.codec = CODECS[codec]
+        self.level = level
+        self.keyframe_interval = max(1, keyframe_interval)
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        if self._index.tell() == 0:
+            self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, INDEX_ENTRY.size, 0))
+            self._index.flush()
+        self.frames = (self._index.tell() - INDEX_HEADER.size) // INDEX_ENTRY.size
+        with open(path + '.idx', 'rb') as index:
+            self._flags = INDEX_HEADER.unpack(index.read(INDEX_HEADER.size))[3]
+            self._last_seq = None
+            if self.frames:
+                index.seek(INDEX_HEADER.size + (self.frames - 1) * INDEX_ENTRY.size)
+                self._last_seq = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))[3]
+        self._previous = None  # (geometry, pixels) of the last frame, for delta coding
+        self._keyframe = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def append(self, width, height, stride, timestamp_us, fmt, seq_num, pixels):
+        """Encodes and appends one frame; pixels is the frame's bytes as laid out in the segment."""
+        geometry = (width, height, stride, fmt)
+        codec = self.codec
+        if codec == CODEC_DELTA and (self._previous is None or self._previous[0] != geometry
+                                     or self.frames - self._keyframe >= self.keyframe_interval):
+            codec = CODEC_ZLIB  # keyframe
+        if codec == CODEC_RAW:
+            payload = bytes(pixels)
+        elif codec == CODEC_ZLIB:
+            payload = zlib.compress(pixels, self.level)
+        else:
+            previous = self._previous[1]
+            bands = _bands(len(pixels), stride * CAPTURE_BAND_ROWS)
+            changed = bytearray((len(bands) + 7) // 8)
+            parts = []
+            for i, (start, end) in enumerate(bands):
+                if pixels[start:end] != previous[start:end]:
+                    changed[i >> 3] |= 1 << (i & 7)
+                    band = zlib.compress(pixels[start:end], self.level)
+                    parts.append(struct.pack('<I', len(band)))
+                    parts.append(band)
+            payload = bytes(changed) + b''.join(parts)
+        if codec != CODEC_DELTA:
+            self._keyframe = self.frames
+        if self._last_seq is not None and seq_num <= self._last_seq and not self._flags & INDEX_FLAG_UNORDERED_SEQ:
+            # Flagged before the entry lands, so a reader never bisects an unordered index.
+            self._flags |= INDEX_FLAG_UNORDERED_SEQ
+            with open(self.path + '.idx', 'r+b') as index:
+                index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, INDEX_ENTRY.size, self._flags))
+
+        offset = self._data.tell()
+        self._data.write(MRCN_HEADER.pack(MRCN_MAGIC, width, height, stride, timestamp_us, fmt, seq_num))
+        self._data.write(payload)
+        self._data.flush()
+        self._index.write(INDEX_ENTRY.pack(offset, timestamp_us, MRCN_HEADER.size + len(payload),
+                                           seq_num, self._keyframe, codec))
+        self._index.flush()
+        self._last_seq = seq_num
+        if self.codec == CODEC_DELTA:
+            self._previous = (geometry, bytes(pixels))
+        self.frames += 1
+        self.bytes_in += len(pixels)
+        self.bytes_out += MRCN_HEADER.size + len(payload)
+
+    def record(self, reader, frames=None, duration=None, timeout=1.0):
+        """
+        Appends each new frame the reader sees until frames are recorded,
+        duration seconds pass or no frame arrives within timeout. Pixels are
+        copied inside a consistent snapshot and encoded outside it.
+        Returns {"frames", "missed", "torn_retries"}.
+        """
+        deadline = None if duration is None else time.perf_counter() + duration
+        last = None
+        count = missed = torn_retries = 0
+        while frames is None or count < frames:
+            remaining = timeout if deadline is None else min(timeout, deadline - time.perf_counter())
+            if remaining <= 0 or reader.wait_for_frame(last, remaining) is None:
+                break
+            snap = reader.snapshot(lambda frame: bytes(frame.pixels))
+            if snap is None:
+                break
+            frame, pixels, retries = snap
+            if frame.seq_num == 0:  # segment created, nothing published yet
+                last = 0
+                continue
+            if count:
+                missed += max(0, (frame.seq_num - last) % 2**32 - 1)
+            self.append(frame.width, frame.height, frame.stride, frame.timestamp_us, frame.fmt,
+                        frame.seq_num, pixels)
+            torn_retries += retries
+            count += 1
+            last = frame.seq_num
+        return {"frames": count, "missed": missed, "torn_retries": torn_retries}
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class CaptureFile:
+    """Read side of a capture: both files memory-mapped, frames decoded on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self._index_map = self._map(path + '.idx')
+        magic, version, entry_size, self.flags = INDEX_HEADER.unpack_from(self._index_map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or entry_size != INDEX_ENTRY.size:
+            raise ValueError(f"{path}.idx is not a version {INDEX_VERSION} capture index")
+        self._data_map = self._map(path)
+        self.frame_count = (len(self._index_map) - INDEX_HEADER.size) // INDEX_ENTRY.size
+        # Entries whose data never made it to disk (a crash mid-append) are ignored.
+        while self.frame_count:
+            offset, _, length, *_ = self._entry(self.frame_count - 1)
+            if offset + length <= len(self._data_map):
+                break
+            self.frame_count -= 1
+        self._decoded = None  # (index, pixels) of the last decoded frame
+
+    @staticmethod
+    def _map(path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return self.frame_count
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self._index_map, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    def entry(self, i):
+        """{"offset", "timestamp_us", "length", "seq", "keyframe", "codec"} for frame i."""
+        if not 0 <= i < self.frame_count:
+            raise IndexError(f"frame {i} out of range for a {self.frame_count}-frame capture")
+        offset, timestamp_us, length, seq, keyframe, codec = self._entry(i)
+        return {"offset": offset, "timestamp_us": timestamp_us, "length": length, "seq": seq,
+                "keyframe": keyframe, "codec": codec}
+
+    def header(self, i):
+        """(magic, width, height, stride, timestamp_us, fmt, seq_num) of frame i."""
+        return MRCN_HEADER.unpack_from(self._data_map, self.entry(i)["offset"])
+
+    def index_of_timestamp(self, timestamp_us):
+        """Index of the last frame stamped at or before timestamp_us (0 if none)."""
+        stamps = _Column(self, 1)
+        return max(0, bisect.bisect_right(stamps, timestamp_us) - 1)
+
+    def index_of_seq(self, seq):
+        """
+        Index of the first frame with sequence number seq, or None. Bisects
+        unless the recorder flagged the sequence as going backwards (a
+        compositor restart or wraparound), in which case it scans.
+        """
+        seqs = _Column(self, 3)
+        if self.flags & INDEX_FLAG_UNORDERED_SEQ:
+            return next((i for i in range(self.frame_count) if seqs[i] == seq), None)
+        i = bisect.bisect_left(seqs, seq)
+        return i if i < self.frame_count and seqs[i] == seq else None
+
+    def pixels(self, i):
+        """Decoded pixels of frame i. Sequential access decodes each delta frame once."""
+        entry = self.entry(i)
+        if self._decoded is not None and self._decoded[0] == i:
+            return self._decoded[1]
+        _, width, height, stride, _, fmt, _ = self.header(i)
+        body = memoryview(self._data_map)[entry["offset"] + MRCN_HEADER.size:entry["offset"] + entry["length"]]
+        if entry["codec"] == CODEC_RAW:
+            pixels = bytes(body)
+        elif entry["codec"] == CODEC_ZLIB:
+            pixels = zlib.decompress(body)
+        else:
+            if self._decoded is not None and entry["keyframe"] <= self._decoded[0] < i:
+                start, base = self._decoded
+            else:
+                start, base = entry["keyframe"], self.pixels(entry["keyframe"])
+            for j in range(start + 1, i):
+                base = self._apply_delta(j, base)
+            pixels = self._apply_delta(i, base, body, stride)
+        body.release()
+        self._decoded = (i, pixels)
+        return pixels
+
+    def _apply_delta(self, i, base, body=None, stride=None):
+        if body is None:
+            entry = self.entry(i)
+            stride = self.header(i)[3]
+            body = memoryview(self._data_map)[entry["offset"] + MRCN_HEADER.size:entry["offset"] + entry["length"]]
+        pixels = bytearray(base)
+        bands = _bands(len(pixels), stride * CAPTURE_BAND_ROWS)
+        pos = (len(bands) + 7) // 8
+        changed = body[:pos]
+        for b, (start, end) in enumerate(bands):
+            if changed[b >> 3] & (1 << (b & 7)):
+                (length,) = struct.unpack_from('<I', body, pos)
+                pixels[start:end] = zlib.decompress(body[pos + 4:pos + 4 + length])
+                pos += 4 + length
+        return bytes(pixels)
+
+    def info(self):
+        if not self.frame_count:
+            return {"frames": 0}
+        first, last = self.header(0), self.header(self.frame_count - 1)
+        raw = sum(frame_bytes(h[5], h[3], h[2]) for h in map(self.header, range(self.frame_count)))
+        return {
+            "frames": self.frame_count,
+            "resolution": f"{first[1]}x{first[2]}",
+            "first_sequence": first[6],
+            "last_sequence": last[6],
+            "duration_s": round((last[4] - first[4]) / 1e6, 3),
+            "data_bytes": len(self._data_map),
+            "compression_ratio": round(raw / max(len(self._data_map), 1), 2),
+        }
+
+    def close(self):
+        for m in (self._data_map, self._index_map):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+
+class _Column:
+    """Read-only sequence view over one index field, for bisect."""
+
+    def __init__(self, capture, field):
+        self.capture = capture
+        self.field = field
+
+    def __len__(self):
+        return self.capture.frame_count
+
+    def __getitem__(self, i):
+        return self.capture._entry(i)[self.field]
+
+
+def replay(capture, path=None, speed=1.0, loop=False, start=0, end=None, slots=1, duration=None, stop=None):
+    """
+    Publishes frames start..end of capture into the segment at path through
+    an MrcnCompositor, keeping their original sequence numbers (gaps
+    included) and spacing the publishes by their recorded timestamps divided
+    by speed (speed 0 publishes as fast as possible). With loop=True each
+    pass continues the numbering where the previous one ended, so readers
+    never see the sequence go backwards. Returns {"frames", "elapsed_s",
+    "late_ms"}, late_ms being a LatencyHistogram of how late each publish was.
+    """
+    end = len(capture) if end is None else min(end, len(capture))
+    if not 0 <= start < end:
+        raise ValueError(f"Empty replay range {start}..{end} for a {len(capture)}-frame capture")
+    compositor = None
+    geometry = None
+    late_ms = LatencyHistogram()
+    written = 0
+    t_start = time.perf_counter()
+    t_base = t_start
+    first_seq, last_seq = capture.header(start)[6], capture.header(end - 1)[6]
+    seq_base = 0
+    try:
+        while True:
+            first_us = capture.header(start)[4]
+            for i in range(start, end):
+                if (stop is not None and stop.is_set()) or (
+                        duration is not None and time.perf_counter() - t_start >= duration):
+                    return {"frames": written, "elapsed_s": time.perf_counter() - t_start, "late_ms": late_ms}
+                _, width, height, stride, timestamp_us, fmt, seq = capture.header(i)
+                if (width, height, stride, fmt) != geometry:
+                    if compositor is not None:
+                        compositor.close()
+                    compositor = MrcnCompositor(path, width, height, fmt, slots, stride)
+                    geometry = (width, height, stride, fmt)
+                pixels = capture.pixels(i)
+                if speed > 0:
+                    due = t_base + (timestamp_us - first_us) / 1e6 / speed
+                    now = time.perf_counter()
+                    if now < due:
+                        time.sleep(due - now)
+                        now = time.perf_counter()
+                    late_ms.record((now - due) * 1000)
+                compositor.publish(pixels, (seq + seq_base) & 0xffffffff or 1)
+                written += 1
+            if not loop:
+                break
+            t_base = time.perf_counter()
+            seq_base += (last_seq - first_seq) % 2**32 + 1
+        return {"frames": written, "elapsed_s": time.perf_counter() - t_start, "late_ms": late_ms}
+    finally:
+        if compositor is not None:
+            compositor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record MRCN frames to a capture file or replay one")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--record", metavar="CAPTURE", help="Append frames from the segment to CAPTURE")
+    mode.add_argument("--replay", metavar="CAPTURE", help="Publish CAPTURE's frames into the segment")
+    mode.add_argument("--info", metavar="CAPTURE", help="Describe CAPTURE")
+    parser.add_argument("--path", help="Segment to read or write (default: the legacy compositor segment)")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    parser.add_argument("--frames", type=int, help="Record: stop after this many frames")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay: timing multiplier (0 = as fast as possible)")
+    parser.add_argument("--loop", action="store_true", help="Replay: start over at the end")
+    parser.add_argument("--slots", type=int, default=1, help="Replay: compositor buffer slots")
+    args = parser.parse_args()
+
+    if args.record:
+        reader = ZeroCopyReader(args.path)
+        recorder = FrameRecorder(args.record, args.codec)
+        try:
+            stats = recorder.record(reader, args.frames, args.duration)
+        except KeyboardInterrupt:
+            stats = {"frames": recorder.frames}
+        finally:
+            recorder.close()
+            reader.close()
+        stats["compression_ratio"] = round(recorder.bytes_in / max(recorder.bytes_out, 1), 2)
+        print(json.dumps(stats))
+    else:
+        capture = CaptureFile(args.replay or args.info)
+        try:
+            if args.info:
+                print(json.dumps(capture.info(), indent=2))
+            else:
+                stats = replay(capture, args.path, args.speed, args.loop, slots=args.slots, duration=args.duration)
+                print(json.dumps({"frames": stats["frames"], "elapsed_s": round(stats["elapsed_s"], 3),
+                                  "late_ms": stats["late_ms"].summary()}))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            capture.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Frame Export
+Crops a region of interest out of the current compositor frame, box-filters
+it down to a requested width and encodes it as PNG (stdlib zlib), JPEG
+(only when Pillow is installed) or raw 8-bit grayscale. The crop and
+downscale run inside a consistent snapshot of the SHM frame; encoding runs
+afterwards on the small copy, so a slow encode never tears the read.
+"""
+import argparse
+import base64
+import io
+import json
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # frame export needs NumPy; export_frame reports it as an error
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it "jpeg" is unavailable
+    Image = None
+
+EXPORT_MAX_WIDTH = 256
+EXPORT_FORMATS = ("png", "jpeg", "gray")
+PNG_LEVEL = 6
+JPEG_QUALITY = 80
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _box_downscale(plane, factor_x, factor_y):
+    """Mean over factor_x x factor_y boxes of a 2-D uint8 plane; ragged edges are dropped."""
+    if factor_x == factor_y == 1:
+        return np.array(plane, dtype=np.uint8)
+    h, w = plane.shape[0] // factor_y, plane.shape[1] // factor_x
+    plane = plane[:h * factor_y, :w * factor_x]
+    # Accumulating strided column/row slices is several times faster than a
+    # reshape-and-sum over a uint8 axis.
+    rows = plane[:, 0::factor_x].astype(np.uint16 if factor_x <= 257 else np.uint32)
+    for k in range(1, factor_x):
+        rows += plane[:, k::factor_x]
+    boxes = rows[0::factor_y].astype(np.uint32)
+    for k in range(1, factor_y):
+        boxes += rows[k::factor_y]
+    boxes += factor_x * factor_y // 2  # round to nearest
+    boxes //= factor_x * factor_y
+    return boxes.astype(np.uint8)
+
+
+def sample_frame(frame, roi=None, max_width=EXPORT_MAX_WIDTH, gray=False):
+    """
+    Copies the roi ([x, y, w, h], default the whole frame) of a FrameView,
+    downscaled by the smallest integer factor that fits max_width. A ROI
+    shorter than that factor is only reduced to one row, so the output
+    never exceeds max_width even when it cannot keep its aspect. Returns
+    (image, roi clamped to the frame); image is an (h, w, 3) RGB array, or
+    (h, w) luma for gray=True and for NV12 frames.
+    """
+    from zero_copy_vision import LUMA_WEIGHTS_BGR, _color_planes
+
+    x, y, w, h = roi or (0, 0, frame.width, frame.height)
+    x, y = max(0, int(x)), max(0, int(y))
+    w, h = min(int(w), frame.width - x), min(int(h), frame.height - y)
+    if w <= 0 or h <= 0:
+        raise ValueError(f"ROI {roi} lies outside the {frame.width}x{frame.height} frame")
+    factor_x = min(max(1, -(-w // max(1, int(max_width)))), w)
+    factor_y = min(factor_x, h)
+
+    planes = _color_planes(frame, (x, y, w, h))
+    if planes is None:  # NV12: export the Y plane
+        image = _box_downscale(frame.ndarray()[y:y + h, x:x + w], factor_x, factor_y)
+    else:
+        blue, green, red = planes
+        if gray:
+            luma = np.multiply(blue, LUMA_WEIGHTS_BGR[0], dtype=np.uint16)
+            luma += np.multiply(green, LUMA_WEIGHTS_BGR[1], dtype=np.uint16)
+            luma += np.multiply(red, LUMA_WEIGHTS_BGR[2], dtype=np.uint16)
+            image = _box_downscale((luma >> 8).astype(np.uint8), factor_x, factor_y)
+        else:
+            image = np.dstack([_box_downscale(plane, factor_x, factor_y) for plane in (red, green, blue)])
+    return image, [x, y, w, h]
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(image, level=PNG_LEVEL):
+    """PNG from an (h, w) gray or (h, w, 3) RGB uint8 array, using the Sub filter on every row."""
+    height, width = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    flat = image.reshape(height, width * channels)
+    rows = np.empty((height, 1 + width * channels), dtype=np.uint8)
+    rows[:, 0] = 1  # filter type Sub: each byte minus the same channel of the previous pixel
+    rows[:, 1:1 + channels] = flat[:, :channels]
+    np.subtract(flat[:, channels:], flat[:, :-channels], out=rows[:, 1 + channels:])
+    header = struct.pack('>IIBBBBB', width, height, 8, 0 if channels == 1 else 2, 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    if Image is None:
+        raise RuntimeError("JPEG export needs Pillow; use format 'png' or 'gray'")
+    out = io.BytesIO()
+    Image.fromarray(image, 'L' if image.ndim == 2 else 'RGB').save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def export_frame(reader, roi=None, max_width=EXPORT_MAX_WIDTH, fmt="png", quality=JPEG_QUALITY):
+    """
+    Snapshot, crop, downscale and encode the reader's current frame.
+    Returns None when no MRCN frame is available.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {list(EXPORT_FORMATS)}")
+    if np is None:
+        raise RuntimeError("NumPy is not installed; frame export is unavailable")
+    if fmt == "jpeg" and Image is None:
+        raise RuntimeError("JPEG export needs Pillow; use format 'png' or 'gray'")
+
+    t_start = time.perf_counter()
+    snap = reader.snapshot(lambda frame: sample_frame(frame, roi, max_width, gray=fmt == "gray"))
+    if snap is None:
+        return None
+    frame, (image, roi), torn_retries = snap
+    t_sample = time.perf_counter()
+    if fmt == "png":
+        data, mime = encode_png(image), "image/png"
+    elif fmt == "jpeg":
+        data, mime = encode_jpeg(image, quality), "image/jpeg"
+    else:
+        data, mime = image.tobytes(), "application/octet-stream"
+    t_encode = time.perf_counter()
+
+    return {
+        "status": "exported",
+        "latest_sequence": frame.seq_num,
+        "source_resolution": f"{frame.width}x{frame.height}",
+        "roi": roi,
+        "width": image.shape[1],
+        "height": image.shape[0],
+        "format": fmt,
+        "mime_type": mime,
+        "bytes": len(data),
+        "torn_retries": torn_retries,
+        "sample_ms": round((t_sample - t_start) * 1000, 2),
+        "encode_ms": round((t_encode - t_sample) * 1000, 2),
+        "data": base64.b64encode(data).decode('ascii'),
+    }
+
+
+if __name__ == "__main__":
+    from zero_copy_vision import ZeroCopyReader
+
+    parser = argparse.ArgumentParser(description="Export a cropped, downscaled compositor frame")
+    parser.add_argument("--roi", type=int, nargs=4, metavar=("X", "Y", "W", "H"))
+    parser.add_argument("--max-width", type=int, default=EXPORT_MAX_WIDTH)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="png")
+    parser.add_argument("--out", help="Write the encoded image here instead of printing JSON")
+    args = parser.parse_args()
+    reader = ZeroCopyReader()
+    result = export_frame(reader, args.roi, args.max_width, args.format)
+    reader.close()
+    if result is None:
+        print(json.dumps({"error": "No compositor frame available"}))
+        sys.exit(1)
+    if args.out:
+        with open(args.out, 'wb') as f:
+            f.write(base64.b64decode(result.pop("data")))
+    print(json.dumps(result, indent=2))
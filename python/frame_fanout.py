@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Frame Fan-out
+One producer follows the compositor segment, reads each sequence number
+once, computes the requested derived products (metrics, diff, thumbnail)
+once, and publishes them as JSON records into a shared-memory broadcast
+ring. Any number of consumer processes read the ring without locks, each
+with its own cursor, so an agent ensemble watching one renderer costs one
+frame's worth of work per frame instead of one per agent.
+
+Ring layout (little-endian) in a multiprocessing.shared_memory block:
+  header  RING_HEADER: magic 'GVFR', version, slot_count, slot_bytes, published
+  slots   slot_count x slot_bytes, each SLOT_HEADER (stamp, length, sequence)
+          followed by the JSON record
+Record i lives in slot i % slot_count. Its stamp is a seqlock: the producer
+sets it to 2i+1 before writing and 2i+2 after, so a consumer that sees the
+same even stamp before and after copying knows the record is intact, and a
+stamp that moved on means the producer lapped it.
+
+A serve-mode worker follows a ring instead of the segment for "watch"
+requests that name one ("fanout": <ring name>, or true for FANOUT_NAME) or,
+for the default segment, when GLAZYR_FANOUT names one; watchers then get
+the producer's metrics and diffs without computing them.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+from zero_copy_vision import (
+    FRAME_AGE_MAX_S, FRAME_MAX_SLEEP_S, FRAME_MIN_SLEEP_S, FRAME_SPIN_S, METRIC_NAMES, ZeroCopyReader,
+    metric_mask, monotonic_us,
+)
+
+SHM_DIR = '/dev/shm'
+FANOUT_NAME = 'glazyr_fanout'
+RING_MAGIC = b'GVFR'
+RING_VERSION = 1
+RING_HEADER = struct.Struct('<4sIIIQ')  # magic, version, slot_count, slot_bytes, published
+RING_PUBLISHED_OFFSET = 16
+RING_HEADER_BYTES = 64
+SLOT_HEADER = struct.Struct('<QII')  # stamp, length, sequence
+RING_SLOTS = 64
+RING_SLOT_BYTES = 64 * 1024
+RING_LATEST_RETRIES = 3
+IDLE_POLL_S = 1.0  # how often an idle producer re-checks stop and its duration
+
+
+def ring_path(name):
+    name = name.lstrip('/')
+    if not name or '/' in name:
+        raise ValueError(f"Invalid fan-out ring name {name!r}")
+    return os.path.join(SHM_DIR, name)
+
+
+class RingLappedError(RuntimeError):
+    """The producer overwrote a record while it was being read."""
+
+
+class FanoutRing:
+    """The producer side: owns (creates and finally unlinks) the ring."""
+
+    def __init__(self, name=FANOUT_NAME, slots=RING_SLOTS, slot_bytes=RING_SLOT_BYTES):
+        if slots < 2:
+            raise ValueError("A fan-out ring needs at least 2 slots")
+        if slot_bytes <= SLOT_HEADER.size:
+            raise ValueError(f"slot_bytes must exceed the {SLOT_HEADER.size}-byte slot header")
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.published = 0
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=RING_HEADER_BYTES + slots * slot_bytes)
+        except FileExistsError:
+            # A previous producer died without unlinking; take the name over.
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=RING_HEADER_BYTES + slots * slot_bytes)
+        self._buf = self._shm.buf
+        RING_HEADER.pack_into(self._buf, 0, RING_MAGIC, RING_VERSION, slots, slot_bytes, 0)
+
+    def publish(self, record, sequence=0):
+        """Appends one JSON-serializable record and returns its ring index."""
+        payload = json.dumps(record, separators=(',', ':')).encode()
+        if len(payload) > self.slot_bytes - SLOT_HEADER.size:
+            payload = json.dumps({"latest_sequence": sequence, "error": (
+                f"record of {len(payload)} bytes exceeds the ring's "
+                f"{self.slot_bytes - SLOT_HEADER.size}-byte slots")}).encode()
+        index = self.published
+        offset = RING_HEADER_BYTES + (index % self.slots) * self.slot_bytes
+        struct.pack_into('<Q', self._buf, offset, 2 * index + 1)
+        body = offset + SLOT_HEADER.size
+        self._buf[body:body + len(payload)] = payload
+        SLOT_HEADER.pack_into(self._buf, offset, 2 * index + 2, len(payload), sequence & 0xffffffff)
+        self.published = index + 1
+        struct.pack_into('<Q', self._buf, RING_PUBLISHED_OFFSET, self.published)
+        return index
+
+    def close(self, unlink=True):
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FanoutConsumer:
+    """
+    Reads a ring published by another process. The block is mapped
+    read-only straight from /dev/shm (attaching through SharedMemory would
+    register it with this process's resource tracker, which unlinks it at
+    exit), and the cursor is local, so consumers do not contend with each
+    other or with the producer. start="latest" skips records published
+    before attaching.
+    """
+
+    def __init__(self, name=FANOUT_NAME, start="latest"):
+        fd = os.open(ring_path(name), os.O_RDONLY)
+        try:
+            self.inode = os.fstat(fd).st_ino
+            self._map = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        self._buf = memoryview(self._map)
+        magic, version, self.slots, self.slot_bytes, published = RING_HEADER.unpack_from(self._buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.close()
+            raise ValueError(f"{name} is not a version {RING_VERSION} fan-out ring")
+        self.cursor = published if start == "latest" else max(0, published - self.slots)
+        self.dropped = 0
+
+    def published(self):
+        return struct.unpack_from('<Q', self._buf, RING_PUBLISHED_OFFSET)[0]
+
+    def _read(self, index):
+        offset = RING_HEADER_BYTES + (index % self.slots) * self.slot_bytes
+        stamp, length, _ = SLOT_HEADER.unpack_from(self._buf, offset)
+        if stamp != 2 * index + 2:
+            raise RingLappedError(index)
+        body = offset + SLOT_HEADER.size
+        payload = bytes(self._buf[body:body + min(length, self.slot_bytes - SLOT_HEADER.size)])
+        if struct.unpack_from('<Q', self._buf, offset)[0] != stamp:
+            raise RingLappedError(index)
+        return json.loads(payload)
+
+    def latest(self):
+        """The most recently published record without moving the cursor, or None if there is none."""
+        for _ in range(RING_LATEST_RETRIES):
+            published = self.published()
+            if not published:
+                return None
+            try:
+                return self._read(published - 1)
+            except RingLappedError:
+                continue
+        return None
+
+    def poll(self):
+        """Every record published since the last call, oldest first; lapped ones count as dropped."""
+        published = self.published()
+        if published - self.cursor > self.slots:
+            self.dropped += published - self.slots - self.cursor
+            self.cursor = published - self.slots
+        records = []
+        while self.cursor < published:
+            try:
+                records.append(self._read(self.cursor))
+            except RingLappedError:
+                self.dropped += 1
+            self.cursor += 1
+        return records
+
+    def wait(self, timeout=1.0):
+        """Blocks (spin, then back off) until a record is unread; returns poll(), empty on timeout."""
+        t_now = time.perf_counter()
+        deadline = t_now + timeout
+        spin_until = t_now + FRAME_SPIN_S
+        delay = FRAME_MIN_SLEEP_S
+        while self.published() == self.cursor:
+            t_now = time.perf_counter()
+            if t_now >= deadline:
+                return []
+            if t_now < spin_until:
+                continue
+            time.sleep(min(delay, deadline - t_now))
+            delay = min(delay * 2, FRAME_MAX_SLEEP_S)
+        return self.poll()
+
+    def close(self):
+        self._buf.release()
+        self._map.close()
+
+
+def run_fanout(reader, ring, metrics=0, diff=False, max_frames=None, duration=None, stop=None,
+               **metric_options):
+    """
+    Publishes one record per new compositor sequence number until max_frames
+    are published, duration seconds pass or stop (an Event) is set. A
+    compositor that stops publishing (a static page) or whose segment is
+    gone only means no new record yet. Returns {"frames", "skipped"};
+    skipped counts sequence numbers the producer itself never saw.
+    """
+    deadline = None if duration is None else time.perf_counter() + duration
+    last = None
+    frames = skipped = 0
+    while (max_frames is None or frames < max_frames) and not (stop is not None and stop.is_set()):
+        wait_s = IDLE_POLL_S if deadline is None else min(IDLE_POLL_S, deadline - time.perf_counter())
+        if wait_s <= 0:
+            break
+        if reader.wait_for_frame(last, wait_s) is None:
+            continue
+        result = reader.read_frame("fanout", metrics, diff, **metric_options)
+        if result is None:
+            continue
+        result.pop("url", None)
+        result.pop("message", None)
+        seq = result.get("latest_sequence", 0)
+        if last is not None and "error" not in result:
+            skipped += max(0, (seq - last) % 2**32 - 1)
+        ring.publish(result, seq)
+        frames += 1
+        last = seq
+    return {"frames": frames, "skipped": skipped}
+
+
+def watch_fanout(consumer, emit, after_seq=None, max_frames=1, timeout=1.0):
+    """
+    watch_frames over a ring: emits the producer's record for each of the
+    next max_frames frames (the current one first if its sequence number
+    differs from after_seq), with skipped and frame_age_ms as this reader
+    sees them. Records older than the watch are not replayed.
+    """
+    pending = []
+    latest = consumer.latest()
+    if latest is not None and latest.get("latest_sequence") != after_seq:
+        pending.append(latest)
+    consumer.cursor = consumer.published()
+    dropped = consumer.dropped
+    count = 0
+    while count < max_frames:
+        records = pending or consumer.wait(timeout)
+        pending = []
+        if not records:
+            break
+        for record in records[:max_frames - count]:
+            seq = record.get("latest_sequence", 0)
+            record["skipped"] = 0 if after_seq is None else max(0, (seq - after_seq) % 2**32 - 1)
+            if record.get("timestamp_us"):
+                age_us = monotonic_us() - record["timestamp_us"]
+                record["frame_age_ms"] = round(age_us / 1000, 2) if 0 <= age_us < FRAME_AGE_MAX_S * 1e6 else None
+            emit(record)
+            after_seq = seq
+            count += 1
+    return {"frames": count, "latest_sequence": after_seq, "timed_out": count < max_frames,
+            "source": "fanout", "dropped": consumer.dropped - dropped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Broadcast per-frame products to many consumers")
+    parser.add_argument("--name", default=FANOUT_NAME, help="Shared-memory ring name")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--produce", action="store_true", help="Follow the compositor and publish records")
+    mode.add_argument("--consume", action="store_true", help="Print records as JSON lines")
+    parser.add_argument("--instance", help="Producer: read NeuralChromium_Video_<instance>")
+    parser.add_argument("--metrics", default="",
+                        help=f"Producer: comma-separated frame metrics: {', '.join(METRIC_NAMES)}")
+    parser.add_argument("--diff", action="store_true", help="Producer: include dirty rectangles")
+    parser.add_argument("--slots", type=int, default=RING_SLOTS)
+    parser.add_argument("--slot-bytes", type=int, default=RING_SLOT_BYTES)
+    parser.add_argument("--duration", type=float, help="Seconds to run (default: until interrupted)")
+    args = parser.parse_args()
+
+    if args.produce:
+        path = None
+        if args.instance:
+            from segment_registry import SegmentRegistry
+            path = SegmentRegistry(reader_factory=ZeroCopyReader).path_for(args.instance)
+        reader = ZeroCopyReader(path)
+        ring = FanoutRing(args.name, args.slots, args.slot_bytes)
+        try:
+            stats = run_fanout(reader, ring, metric_mask(filter(None, args.metrics.split(","))), args.diff,
+                               duration=args.duration)
+        except KeyboardInterrupt:
+            stats = None
+        finally:
+            ring.close()
+            reader.close()
+        if stats is not None:
+            print(json.dumps(stats))
+    else:
+        consumer = FanoutConsumer(args.name)
+        deadline = None if args.duration is None else time.perf_counter() + args.duration
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                for record in consumer.wait(IDLE_POLL_S if deadline is None else deadline - time.perf_counter()):
+                    print(json.dumps(record), flush=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            consumer.close()
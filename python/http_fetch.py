@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Fallback HTTP Fetcher
+Keeps per-origin keep-alive connection pools across requests, negotiates
+compressed transfer (gzip/deflate, plus brotli when the `brotli` package is
+installed), decodes bodies incrementally and enforces a maximum body size.
+"""
+import http.client
+import ssl
+import threading
+import time
+import urllib.parse
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it we don't advertise "br"
+    brotli = None
+
+USER_AGENT = 'GlazyrViz/0.2.0'
+DEFAULT_TIMEOUT = 10.0
+MAX_BODY_BYTES = 8 * 1024 * 1024
+MAX_REDIRECTS = 5
+MAX_IDLE_PER_HOST = 4
+IDLE_TIMEOUT_S = 30.0
+CHUNK_SIZE = 16 * 1024
+DRAIN_MAX_BYTES = 64 * 1024  # unread body a stopped reader still drains to keep the connection
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class FetchError(Exception):
+    """A fetch that could not produce a usable response."""
+
+
+class BodyTooLarge(FetchError):
+    """The decoded body exceeded the fetcher's max_body limit."""
+
+
+class _Decoder:
+    """Incremental content decoder that refuses to inflate past a byte limit."""
+
+    def __init__(self, encoding, limit):
+        self.encoding = (encoding or 'identity').strip().lower()
+        self.remaining = limit
+        if self.encoding in ('gzip', 'x-gzip'):
+            self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._z = None  # zlib-wrapped or raw, decided on the first chunk
+        elif self.encoding == 'br' and brotli is not None:
+            self._br = brotli.Decompressor()
+        elif self.encoding != 'identity':
+            raise FetchError(f"Unsupported Content-Encoding: {encoding}")
+
+    def _take(self, data):
+        if len(data) > self.remaining:
+            raise BodyTooLarge(f"Response body exceeds {self.remaining} remaining bytes")
+        self.remaining -= len(data)
+        return data
+
+    def _inflate(self, data):
+        out = self._z.decompress(data, self.remaining + 1)
+        if self._z.unconsumed_tail:
+            raise BodyTooLarge("Response body exceeds the size limit")
+        return self._take(out)
+
+    def feed(self, data):
+        if self.encoding == 'identity':
+            return self._take(data)
+        if self.encoding == 'br':
+            return self._take(self._br.process(data))
+        if self._z is None:
+            self._z = zlib.decompressobj()
+            try:
+                return self._inflate(data)
+            except zlib.error:
+                self._z = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._inflate(data)
+
+    def flush(self):
+        if getattr(self, '_z', None) is not None:
+            return self._take(self._z.flush())
+        return b''
+
+
+class ConnectionPool:
+    """Idle keep-alive connections keyed by (scheme, host, port)."""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST, idle_timeout=IDLE_TIMEOUT_S):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self, key, timeout):
+        """Returns (connection, reused)."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout and conn.sock is not None:
+                    self.reused += 1
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self.connect(key, timeout), False
+
+    def connect(self, key, timeout):
+        """A new, not yet connected, connection for key."""
+        scheme, host, port = key
+        with self._lock:
+            self.opened += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(conns) for conns in self._idle.values())
+        return {"opened": self.opened, "reused": self.reused, "idle": idle}
+
+
+class FetchResponse:
+    """
+    A response whose body is streamed and decoded on demand. Read it fully
+    (or use it as a context manager) to hand the connection back to the
+    pool; closing early discards the connection instead, unless drain()
+    could finish the body first.
+    """
+
+    def __init__(self, fetcher, key, conn, response, url, reused, max_body):
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.reused_connection = reused
+        self.content_encoding = response.getheader('Content-Encoding', 'identity')
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self._fetcher = fetcher
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._decoder = _Decoder(self.content_encoding, max_body)
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Yields decoded body chunks as they arrive."""
+        try:
+            while True:
+                data = self._response.read(chunk_size)
+                if not data:
+                    break
+                self.wire_bytes += len(data)
+                decoded = self._decoder.feed(data)
+                if decoded:
+                    self.body_bytes += len(decoded)
+                    yield decoded
+            tail = self._decoder.flush()
+            if tail:
+                self.body_bytes += len(tail)
+                yield tail
+        except Exception:
+            self.close()
+            raise
+        self.close()
+
+    def read(self):
+        return b''.join(self.iter_chunks())
+
+    def drain(self, limit=DRAIN_MAX_BYTES):
+        """
+        Discards the rest of an abandoned body and closes the response. The
+        connection returns to the pool if the rest fit in limit wire bytes;
+        a longer (or announced-longer) remainder is not read at all.
+        """
+        if self._conn is None:
+            return
+        remaining = self._response.length  # None for chunked bodies
+        if remaining is None or remaining <= limit:
+            try:
+                while limit > 0:
+                    data = self._response.read(min(CHUNK_SIZE, limit))
+                    if not data:
+                        break
+                    self.wire_bytes += len(data)
+                    limit -= len(data)
+            except (OSError, http.client.HTTPException):
+                pass  # close() sees the response unfinished and discards the connection
+        self.close()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._fetcher.pool.release(self._key, conn)
+        else:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpFetcher:
+    """GET with pooled keep-alive connections, compression and redirects."""
+
+    def __init__(self, pool=None, timeout=DEFAULT_TIMEOUT, max_body=MAX_BODY_BYTES, user_agent=USER_AGENT):
+        self.pool = pool or ConnectionPool()
+        self.timeout = timeout
+        self.max_body = max_body
+        self.user_agent = user_agent
+
+    def _request(self, key, target, headers, timeout):
+        conn, reused = self.pool.acquire(key, timeout)
+        try:
+            conn.request('GET', target, headers=headers)
+            return conn, conn.getresponse(), reused
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        # The server dropped an idle keep-alive connection; retry once on a fresh one.
+        conn = self.pool.connect(key, timeout)
+        try:
+            conn.request('GET', target, headers=headers)
+            return conn, conn.getresponse(), False
+        except Exception:
+            conn.close()
+            raise
+
+    def fetch(self, url, headers=None, timeout=None, max_body=None, allowed_statuses=()):
+        """
+        Returns a FetchResponse for url after following redirects. Raises
+        FetchError for transport failures and for 4xx/5xx statuses not in
+        allowed_statuses.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        max_body = self.max_body if max_body is None else max_body
+        request_headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+            'Connection': 'keep-alive',
+        }
+        request_headers.update(headers or {})
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise FetchError(f"Unsupported URL: {url}")
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            key = (parts.scheme, parts.hostname, port)
+            target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            request_headers['Host'] = parts.netloc.rsplit('@', 1)[-1]
+
+            try:
+                conn, response, reused = self._request(key, target, request_headers, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                raise FetchError(f"<urlopen error {e}>") from e
+
+            result = FetchResponse(self, key, conn, response, url, reused, max_body)
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                result.read()  # drain so the connection can be reused
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status >= 400 and response.status not in allowed_statuses:
+                result.close()
+                raise FetchError(f"HTTP Error {response.status}: {response.reason}")
+            return result
+
+        raise FetchError(f"Too many redirects (> {MAX_REDIRECTS}) for {url}")
+
+    def close(self):
+        self.pool.close()
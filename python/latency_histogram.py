@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Latency Histogram
+HDR-style log-bucketed histogram of latencies: fixed memory regardless of
+sample count, a bounded relative error set by significant_figures, exact
+min/max/mean, and percentile queries. Histograms with the same layout merge
+by adding counts and round-trip through JSON (to_dict/from_dict), so worker
+threads and processes can record locally and be aggregated afterwards.
+
+Values are recorded in milliseconds and stored as integer microseconds.
+record(..., expected_interval_ms=) applies the coordinated-omission
+correction: when a sample that should have been taken every interval took
+longer, the samples the stall prevented are back-filled.
+"""
+import argparse
+import base64
+import json
+import math
+import sys
+import threading
+import zlib
+from array import array
+
+LOWEST_US = 1
+HIGHEST_US = 600_000_000  # 10 minutes; longer samples are clamped
+SIGNIFICANT_FIGURES = 2
+SUMMARY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile_key(p):
+    """50 -> "p50", 99.9 -> "p999"."""
+    return "p" + f"{p:g}".replace(".", "")
+
+
+class LatencyHistogram:
+    """
+    Counts are kept in (bucket_count + 1) * sub_bucket_count / 2 slots: each
+    power-of-two bucket splits into linear sub-buckets fine enough that any
+    value is reported within 10**-significant_figures of its true value.
+    """
+
+    def __init__(self, lowest_us=LOWEST_US, highest_us=HIGHEST_US, significant_figures=SIGNIFICANT_FIGURES):
+        if lowest_us < 1 or highest_us < 2 * lowest_us:
+            raise ValueError("need 1 <= lowest_us and 2 * lowest_us <= highest_us")
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+        self.lowest_us = int(lowest_us)
+        self.highest_us = int(highest_us)
+        self.significant_figures = int(significant_figures)
+
+        self._unit_magnitude = int(math.floor(math.log2(self.lowest_us)))
+        sub_bucket_count_magnitude = int(math.ceil(math.log2(2 * 10 ** self.significant_figures)))
+        self._sub_half_magnitude = max(sub_bucket_count_magnitude, 1) - 1
+        self._sub_bucket_count = 1 << (self._sub_half_magnitude + 1)
+        self._sub_half_count = self._sub_bucket_count // 2
+        self._sub_bucket_mask = (self._sub_bucket_count - 1) << self._unit_magnitude
+        smallest_untrackable = self._sub_bucket_count << self._unit_magnitude
+        bucket_count = 1
+        while smallest_untrackable <= self.highest_us:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self._counts = array('Q', bytes(8 * (bucket_count + 1) * self._sub_half_count))
+        self._lock = threading.Lock()
+        self.count = 0
+        self.min_us = 0
+        self.max_us = 0
+        self.total_us = 0
+
+    # ── recording ──────────────────────────────────────────────────────────
+
+    def _index(self, value_us):
+        bucket = (value_us | self._sub_bucket_mask).bit_length() - self._unit_magnitude - (self._sub_half_magnitude + 1)
+        sub_bucket = value_us >> (bucket + self._unit_magnitude)
+        return ((bucket + 1) << self._sub_half_magnitude) + sub_bucket - self._sub_half_count
+
+    def _value_at(self, index):
+        """Highest value that lands in counts[index]."""
+        bucket = (index >> self._sub_half_magnitude) - 1
+        sub_bucket = (index & (self._sub_half_count - 1)) + self._sub_half_count
+        if bucket < 0:
+            sub_bucket -= self._sub_half_count
+            bucket = 0
+        shift = bucket + self._unit_magnitude
+        return ((sub_bucket + 1) << shift) - 1
+
+    def _record_us(self, value_us, count):
+        value_us = min(max(int(value_us), 0), self.highest_us)
+        self._counts[self._index(value_us)] += count
+        if self.count == 0 or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+        self.count += count
+        self.total_us += value_us * count
+
+    def _record_backfill_us(self, value_us, interval_us, count):
+        """
+        Records value - k * interval for every k >= 1 that stays >= interval,
+        one counts[] update per bucket the series crosses rather than one per
+        sample, so a long stall costs at most one pass over the buckets.
+        """
+        value_us -= interval_us
+        while value_us >= interval_us:
+            index = self._index(value_us)
+            lowest = max(self._value_at(index - 1) + 1 if index else 0, interval_us)
+            n = (value_us - lowest) // interval_us + 1
+            self._counts[index] += n * count
+            value_us -= n * interval_us
+            if value_us + interval_us < self.min_us:
+                self.min_us = value_us + interval_us
+            self.count += n * count
+            self.total_us += (n * (value_us + interval_us) + interval_us * n * (n - 1) // 2) * count
+
+    def record(self, value_ms, count=1, expected_interval_ms=None):
+        """
+        Records a latency of value_ms. With expected_interval_ms (the period
+        at which samples were meant to be taken), also records the
+        value - k * interval samples that a stall this long suppressed.
+        """
+        value_us = min(round(value_ms * 1000), self.highest_us)
+        with self._lock:
+            self._record_us(value_us, count)
+            if expected_interval_ms:
+                interval_us = round(expected_interval_ms * 1000)
+                if interval_us > 0:
+                    self._record_backfill_us(value_us, interval_us, count)
+
+    def merge(self, other):
+        """Adds other's samples into this histogram; the layouts must match."""
+        if self._layout() != other._layout():
+            raise ValueError(f"Cannot merge histograms with layouts {self._layout()} and {other._layout()}")
+        with self._lock:
+            counts = self._counts
+            for index, n in enumerate(other._counts):
+                if n:
+                    counts[index] += n
+            if other.count:
+                self.min_us = other.min_us if self.count == 0 else min(self.min_us, other.min_us)
+                self.max_us = max(self.max_us, other.max_us)
+            self.count += other.count
+            self.total_us += other.total_us
+        return self
+
+    def reset(self):
+        with self._lock:
+            self._counts = array('Q', bytes(8 * len(self._counts)))
+            self.count = self.min_us = self.max_us = self.total_us = 0
+
+    # ── queries ────────────────────────────────────────────────────────────
+
+    def percentile(self, p):
+        """The value (ms) at or below which p percent of samples fall, 0.0 if empty."""
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(p / 100.0 * self.count))
+        seen = 0
+        for index, n in enumerate(self._counts):
+            seen += n
+            if seen >= target:
+                return min(max(self._value_at(index), self.min_us), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def mean(self):
+        return self.total_us / self.count / 1000 if self.count else 0.0
+
+    def counts_at_or_below(self, values_ms):
+        """
+        Cumulative sample counts at or below each of the ascending values_ms,
+        resolved to bucket precision (the cumulative buckets of a Prometheus
+        histogram), in one pass over the counts.
+        """
+        bounds = [round(v * 1000) for v in values_ms]
+        result = []
+        seen = 0
+        for index, n in enumerate(self._counts):
+            if not n:
+                continue
+            value_us = self._value_at(index)
+            while len(result) < len(bounds) and value_us > bounds[len(result)]:
+                result.append(seen)
+            seen += n
+        result.extend([seen] * (len(bounds) - len(result)))
+        return result
+
+    def summary(self, percentiles=SUMMARY_PERCENTILES, digits=3):
+        """{"count", "min", "mean", "p50", ..., "max"} in milliseconds."""
+        result = {"count": self.count, "min": round(self.min_us / 1000, digits),
+                  "mean": round(self.mean(), digits)}
+        for p in percentiles:
+            result[percentile_key(p)] = round(self.percentile(p), digits)
+        result["max"] = round(self.max_us / 1000, digits)
+        return result
+
+    # ── serialization ──────────────────────────────────────────────────────
+
+    def _layout(self):
+        return self.lowest_us, self.highest_us, self.significant_figures
+
+    def to_dict(self):
+        """JSON-safe form; counts are zlib-compressed little-endian uint64."""
+        counts = array('Q', self._counts)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return {
+            "lowest_us": self.lowest_us,
+            "highest_us": self.highest_us,
+            "significant_figures": self.significant_figures,
+            "count": self.count,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "total_us": self.total_us,
+            "counts": base64.b64encode(zlib.compress(counts.tobytes())).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(data["lowest_us"], data["highest_us"], data["significant_figures"])
+        counts = array('Q')
+        counts.frombytes(zlib.decompress(base64.b64decode(data["counts"])))
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        if len(counts) != len(hist._counts):
+            raise ValueError("Serialized histogram does not match its declared layout")
+        hist._counts = counts
+        hist.count = data["count"]
+        hist.min_us = data["min_us"]
+        hist.max_us = data["max_us"]
+        hist.total_us = data["total_us"]
+        return hist
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge serialized latency histograms and print percentiles")
+    parser.add_argument("files", nargs="+", help="JSON files holding one histogram (to_dict) or a list of them")
+    args = parser.parse_args()
+    merged = None
+    for name in args.files:
+        with open(name) as f:
+            data = json.load(f)
+        for entry in data if isinstance(data, list) else [data]:
+            hist = LatencyHistogram.from_dict(entry)
+            merged = hist if merged is None else merged.merge(hist)
+    print(json.dumps(merged.summary(), indent=2))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Synthetic MRCN Compositor
+Writes frames into an MRCN shared-memory segment the way the NeuralChromium
+compositor does, so readers, benchmarks and tools can run without the
+renderer. Supports the legacy single buffer and the multi-slot layout, and
+paces itself to a target frame rate.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+
+from latency_histogram import LatencyHistogram
+from zero_copy_vision import (
+    FMT_BGRA8888, MRCN_HEADER, MRCN_MAGIC, MRCN_MAX_SLOTS, MRCN_SEQ_OFFSET, MRCN_SLOT_SEQ_OFFSET,
+    MRCN_SLOT_TIMESTAMP_OFFSET, MRCN_SLOTS, MRCN_SLOTS_OFFSET, PIXEL_FORMATS, PIXEL_OFFSET, SHM_NAME,
+    frame_bytes, monotonic_us,
+)
+
+PATTERN_FRAMES = 4  # distinct precomputed frames cycled through
+
+
+class MrcnCompositor:
+    """
+    Owns one MRCN segment. publish() writes the next frame: with slots >= 2
+    it renders into the back slot and flips front_slot, otherwise it
+    overwrites the single buffer and then bumps seq_num.
+    """
+
+    def __init__(self, path=None, width=1920, height=1080, fmt=FMT_BGRA8888, slots=1, stride=None):
+        if fmt not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported MRCN pixel format {fmt}")
+        if not 1 <= slots <= MRCN_MAX_SLOTS:
+            raise ValueError(f"slots must be between 1 and {MRCN_MAX_SLOTS}")
+        self.path = path or f'/dev/shm/{SHM_NAME}'
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.stride = stride or width * PIXEL_FORMATS[fmt][1]
+        self.slots = slots
+        self.frame_size = frame_bytes(fmt, self.stride, height)
+        self.seq_num = 0
+        self.front_slot = 0
+        size = PIXEL_OFFSET + self.frame_size * slots
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._shm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self._patterns = [self._pattern(i) for i in range(PATTERN_FRAMES)]
+        MRCN_HEADER.pack_into(self._shm, 0, MRCN_MAGIC, width, height, self.stride, 0, fmt, 0)
+        MRCN_SLOTS.pack_into(self._shm, MRCN_SLOTS_OFFSET, slots if slots > 1 else 0, 0, self.frame_size)
+
+    def _pattern(self, index):
+        """A frame of horizontal gradient bands shifted per index, so frames differ."""
+        row = bytes((x + 37 * index) & 0xff for x in range(self.stride))
+        return row * (self.frame_size // self.stride) + row[:self.frame_size % self.stride]
+
+    def publish(self, pixels=None, seq=None):
+        """
+        Writes the next frame (pixels, or the next built-in pattern) and
+        returns its sequence number: seq if given (replays keep the recorded
+        numbering), else the previous one plus one. The single buffer is
+        written in place like the renderer's legacy layout, without a
+        write-in-progress marker; use slots >= 2 for tear-free reads.
+        """
+        pixels = pixels if pixels is not None else self._patterns[self.seq_num % PATTERN_FRAMES]
+        seq = seq if seq is not None else (self.seq_num + 1) & 0xffffffff or 1
+        timestamp_us = monotonic_us()
+        if self.slots > 1:
+            slot = (self.front_slot + 1) % self.slots
+            seq_offset = MRCN_SLOT_SEQ_OFFSET + 4 * slot
+            struct.pack_into('<I', self._shm, seq_offset, 0)  # readers of this slot now see it torn
+            offset = PIXEL_OFFSET + slot * self.frame_size
+            self._shm[offset:offset + self.frame_size] = pixels
+            struct.pack_into('<Q', self._shm, MRCN_SLOT_TIMESTAMP_OFFSET + 8 * slot, timestamp_us)
+            struct.pack_into('<I', self._shm, seq_offset, seq)
+            struct.pack_into('<I', self._shm, MRCN_SLOTS_OFFSET + 4, slot)
+            self.front_slot = slot
+        else:
+            self._shm[PIXEL_OFFSET:PIXEL_OFFSET + self.frame_size] = pixels
+        struct.pack_into('<Q', self._shm, 16, timestamp_us)
+        struct.pack_into('<I', self._shm, MRCN_SEQ_OFFSET, seq)
+        self.seq_num = seq
+        return seq
+
+    def run(self, fps=60.0, frames=None, duration=None, stop=None):
+        """
+        Publishes frames at fps until frames are written, duration seconds
+        pass or stop (a threading/multiprocessing Event) is set. Returns
+        pacing stats: frames written and a LatencyHistogram of how late each
+        publish started, so an unbounded run holds constant memory.
+        """
+        interval = 1.0 / fps
+        t_start = time.perf_counter()
+        written = 0
+        late_ms = LatencyHistogram()
+        while (frames is None or written < frames) and not (stop is not None and stop.is_set()):
+            due = t_start + written * interval
+            if duration is not None and due - t_start >= duration:
+                break
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+                now = time.perf_counter()
+            late_ms.record((now - due) * 1000)
+            self.publish()
+            written += 1
+        return {"frames": written, "elapsed_s": time.perf_counter() - t_start, "late_ms": late_ms}
+
+    def close(self, unlink=False):
+        self._shm.close()
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic MRCN frames into a shared-memory segment")
+    parser.add_argument("--path", default=f'/dev/shm/{SHM_NAME}')
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--format", type=int, default=FMT_BGRA8888, choices=sorted(PIXEL_FORMATS))
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--duration", type=float, help="Seconds to run (default: until interrupted)")
+    args = parser.parse_args()
+    compositor = MrcnCompositor(args.path, args.width, args.height, args.format, args.slots)
+    try:
+        stats = compositor.run(args.fps, duration=args.duration)
+    except KeyboardInterrupt:
+        stats = None
+    finally:
+        compositor.close()
+    if stats is not None:
+        print(json.dumps({"frames": stats["frames"], "elapsed_s": round(stats["elapsed_s"], 3),
+                          "late_ms": stats["late_ms"].summary()}))
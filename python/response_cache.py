@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Fallback Response Cache
+Remembers what the HTTP fallback extracted from each URL so repeat
+validations skip the download and the parse. Entries expire after the
+response's max-age (or DEFAULT_TTL_S) and are then revalidated with
+If-None-Match / If-Modified-Since; a 304 reuses the cached extraction.
+Extracted payloads are stored once per content digest, so mirrors and
+redirect aliases of the same page share memory.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_S = 30.0
+MAX_CACHE_BYTES = 8 * 1024 * 1024
+
+MAX_AGE = re.compile(r'(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*"?(\d+)', re.IGNORECASE)
+
+
+def freshness(headers, default_ttl=DEFAULT_TTL_S):
+    """Seconds a response may be served without revalidation, or None if it must not be stored."""
+    cache_control = (headers.get('Cache-Control') or '').lower()
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0.0
+    match = MAX_AGE.search(cache_control)
+    if match:
+        return float(match.group(1))
+    return default_ttl
+
+
+class _Entry:
+    __slots__ = ('digest', 'etag', 'last_modified', 'cache_control', 'expires', 'max_texts')
+
+    def __init__(self, digest, etag, last_modified, cache_control, expires, max_texts):
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+        self.expires = expires
+        self.max_texts = max_texts
+
+
+class ResponseCache:
+    """
+    URL -> extraction cache, LRU-bounded by the size of the stored payloads.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, default_ttl=DEFAULT_TTL_S):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # url -> _Entry, least recently used first
+        self._payloads = {}  # digest -> [payload, size, refcount]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def lookup(self, url, max_texts):
+        """
+        Returns (payload, validators). A fresh hit has no validators; a
+        stale entry returns its payload together with the conditional request
+        headers that revalidate it; a miss returns (None, {}).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry.max_texts != max_texts:
+                self.misses += 1
+                return None, {}
+            self._entries.move_to_end(url)
+            if now < entry.expires:
+                self.hits += 1
+                return self._payloads[entry.digest][0], {}
+            validators = {}
+            if entry.etag:
+                validators['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                validators['If-Modified-Since'] = entry.last_modified
+            if not validators:
+                self.misses += 1
+                return None, {}
+            self.stale += 1
+            return self._payloads[entry.digest][0], validators
+
+    def revalidate(self, url, headers):
+        """
+        Records a 304 for url, extending the entry's lifetime if it is still
+        cached. The 304's headers update the stored ones (RFC 9111 4.3.4),
+        so a stored no-cache or max-age outlives a 304 that omits it.
+        """
+        with self._lock:
+            self.revalidated += 1
+            entry = self._entries.get(url)
+            if entry is None:
+                return
+            entry.cache_control = headers.get('Cache-Control') or entry.cache_control
+            entry.etag = headers.get('ETag') or entry.etag
+            entry.last_modified = headers.get('Last-Modified') or entry.last_modified
+            ttl = freshness({'Cache-Control': entry.cache_control}, self.default_ttl)
+            if ttl is None:
+                self._drop(url)
+                return
+            entry.expires = time.monotonic() + ttl
+
+    def store(self, url, headers, payload, max_texts):
+        """Caches payload for url unless the response forbids it."""
+        ttl = freshness(headers, self.default_ttl)
+        if ttl is None:
+            self.invalidate(url)
+            return
+        encoded = json.dumps(payload, sort_keys=True).encode()
+        if len(encoded) > self.max_bytes:
+            return
+        digest = hashlib.blake2b(encoded, digest_size=16).hexdigest()
+        entry = _Entry(digest, headers.get('ETag'), headers.get('Last-Modified'),
+                       headers.get('Cache-Control'), time.monotonic() + ttl, max_texts)
+        with self._lock:
+            self._drop(url)
+            stored = self._payloads.get(digest)
+            if stored is None:
+                self._payloads[digest] = [payload, len(encoded), 1]
+                self._bytes += len(encoded)
+            else:
+                stored[2] += 1
+            self._entries[url] = entry
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, url):
+        with self._lock:
+            self._drop(url)
+
+    def _drop(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is None:
+            return
+        stored = self._payloads[entry.digest]
+        stored[2] -= 1
+        if stored[2] == 0:
+            del self._payloads[entry.digest]
+            self._bytes -= stored[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale": self.stale,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "payloads": len(self._payloads),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._payloads.clear()
+            self._bytes = 0
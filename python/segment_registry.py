@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — SHM Segment Registry
+Discovers the per-instance compositor segments on a host
+(/dev/shm/NeuralChromium_Video_<id>, plus the legacy unsuffixed segment)
+and keeps an LRU of open readers so many renderers can share one worker.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+SHM_DIR = '/dev/shm'
+SEGMENT_PREFIX = 'NeuralChromium_Video'
+DEFAULT_INSTANCE = 'default'
+MAX_OPEN_SEGMENTS = 16
+IDLE_EVICT_S = 60.0
+
+INSTANCE_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+
+class SegmentRegistry:
+    """
+    Maps instance ids to open ZeroCopyReaders. At most max_open mappings are
+    kept; the least recently used one is closed when a new instance is
+    opened, and evict_idle() closes any not used for idle_s seconds.
+    """
+
+    def __init__(self, shm_dir=SHM_DIR, prefix=SEGMENT_PREFIX, max_open=MAX_OPEN_SEGMENTS,
+                 idle_s=IDLE_EVICT_S, reader_factory=None):
+        self.shm_dir = shm_dir
+        self.prefix = prefix
+        self.max_open = max(1, max_open)
+        self.idle_s = idle_s
+        if reader_factory is None:
+            from zero_copy_vision import ZeroCopyReader as reader_factory
+        self._reader_factory = reader_factory
+        self._readers = OrderedDict()  # instance -> (reader, last_used)
+        self._lock = threading.Lock()
+
+    def path_for(self, instance=None):
+        instance = instance or DEFAULT_INSTANCE
+        if instance == DEFAULT_INSTANCE:
+            return os.path.join(self.shm_dir, self.prefix)
+        if not INSTANCE_ID.match(instance):
+            raise ValueError(f"Invalid instance id {instance!r}")
+        return os.path.join(self.shm_dir, f"{self.prefix}_{instance}")
+
+    def discover(self):
+        """Instance ids with a segment present, the legacy segment as 'default'."""
+        try:
+            names = os.listdir(self.shm_dir)
+        except OSError:
+            return []
+        instances = []
+        for name in names:
+            if name == self.prefix:
+                instances.append(DEFAULT_INSTANCE)
+            elif name.startswith(self.prefix + '_') and INSTANCE_ID.match(name[len(self.prefix) + 1:]):
+                instances.append(name[len(self.prefix) + 1:])
+        return sorted(instances)
+
+    def reader(self, instance=None):
+        """The open reader for instance, opening (and evicting the LRU) if needed."""
+        instance = instance or DEFAULT_INSTANCE
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            entry = self._readers.pop(instance, None)
+            reader = entry[0] if entry else self._reader_factory(self.path_for(instance))
+            self._readers[instance] = (reader, now)
+            while len(self._readers) > self.max_open:
+                evicted.append(self._readers.popitem(last=False)[1][0])
+        for old in evicted:
+            old.close()
+        return reader
+
+    def open_readers(self):
+        """{instance: reader} for the segments currently open, without touching their LRU position."""
+        with self._lock:
+            return {instance: reader for instance, (reader, _) in self._readers.items()}
+
+    def evict_idle(self, now=None):
+        """Closes readers idle for longer than idle_s; returns the evicted instance ids."""
+        now = time.monotonic() if now is None else now
+        evicted = []
+        with self._lock:
+            for instance, (reader, last_used) in list(self._readers.items()):
+                if now - last_used > self.idle_s:
+                    del self._readers[instance]
+                    evicted.append((instance, reader))
+        for _, reader in evicted:
+            reader.close()
+        return [instance for instance, _ in evicted]
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            open_segments = {
+                instance: round(now - last_used, 1)
+                for instance, (_, last_used) in self._readers.items()
+            }
+        return {
+            "instances": self.discover(),
+            "open": open_segments,
+            "max_open": self.max_open,
+            "idle_evict_s": self.idle_s,
+        }
+
+    def close(self):
+        with self._lock:
+            readers = [reader for reader, _ in self._readers.values()]
+            self._readers.clear()
+        for reader in readers:
+            reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List compositor SHM segments on this host")
+    parser.add_argument("--shm-dir", default=SHM_DIR)
+    args = parser.parse_args()
+    registry = SegmentRegistry(shm_dir=args.shm_dir)
+    print(json.dumps({"instances": registry.discover()}, indent=2))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Vision Metrics
+In-memory counters and latency histograms for a vision worker, rendered in
+the Prometheus text exposition format. Hot-path updates are a dict lookup
+and an add; everything derived (cache counters, per-segment frame stats) is
+read from its owner only when scraped, so scraping every few seconds costs
+one render and nothing between scrapes.
+
+The serve loop answers a "metrics" op with the rendered text, which the
+Node server aggregates across its workers on /metrics. A standalone worker
+can also expose it on a local HTTP port (--metrics-port).
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency_histogram import LatencyHistogram
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_HOST = '127.0.0.1'
+# Histogram bucket bounds in seconds, Prometheus' base unit.
+LATENCY_BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                     0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help). Every rendered family must be declared here.
+FAMILIES = {
+    "glazyr_vision_ops_total": ("counter", "Serve-mode requests handled, by op and outcome."),
+    "glazyr_vision_op_duration_seconds": ("histogram", "Serve-mode request service time, by op."),
+    "glazyr_vision_results_total": ("counter", "URL validations by path taken: zero_copy, fallback, torn or error."),
+    "glazyr_vision_read_duration_seconds": ("histogram", "Zero-copy frame read time, metrics and diff included."),
+    "glazyr_vision_fetch_duration_seconds": ("histogram", "Fallback HTTP fetch time, parsing excluded."),
+    "glazyr_vision_fetched_bytes_total": ("counter", "Fallback HTTP bytes fetched, on the wire and decoded."),
+    "glazyr_vision_cache_lookups_total": ("counter", "Response cache lookups, by outcome."),
+    "glazyr_vision_cache_entries": ("gauge", "Response cache entries held."),
+    "glazyr_vision_cache_bytes": ("gauge", "Response cache payload bytes held."),
+    "glazyr_vision_open_segments": ("gauge", "Compositor segments currently mapped."),
+    "glazyr_vision_frame_reads_total": ("counter", "Frame reads per segment, repeats of an unchanged frame included."),
+    "glazyr_vision_frames_total": ("counter", "Distinct frames read per segment."),
+    "glazyr_vision_frames_skipped_total": ("counter", "Frames published but never read, per segment."),
+    "glazyr_vision_frame_age_seconds": ("histogram", "Compositor-to-reader frame age per segment."),
+    "glazyr_vision_start_time_seconds": ("gauge", "Unix time the worker started."),
+}
+
+RESULT_PATHS = {"zero-copy-active": "zero_copy", "fallback-http": "fallback", "zero-copy-torn": "torn"}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histogram(name, hist, labels=None):
+    """Sample lines for one LatencyHistogram (recorded in ms) as a Prometheus histogram in seconds."""
+    labels = labels or {}
+    lines = []
+    cumulative = hist.counts_at_or_below([b * 1000 for b in LATENCY_BUCKETS_S])
+    for bound, count in zip(LATENCY_BUCKETS_S, cumulative):
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': repr(bound)})} {count}")
+    lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+    lines.append(f"{name}_sum{_labels(labels)} {_number(hist.total_us / 1e6)}")
+    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+    return lines
+
+
+class VisionMetrics:
+    """
+    Counters and histograms keyed by (family, sorted label items).
+    Collectors registered with add_collector() run at render time and
+    return (family, labels, value) samples, where value is a number or a
+    LatencyHistogram.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def inc(self, family, amount=1, **labels):
+        key = (family, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, family, value_ms, **labels):
+        key = (family, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, LatencyHistogram())
+        hist.record(value_ms)
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def observe_result(self, result):
+        """Accounts one validate result (run_zero_copy_vision's dict)."""
+        path = RESULT_PATHS.get(result.get("status"), "error")
+        self.inc("glazyr_vision_results_total", path=path)
+        if path == "zero_copy":
+            self.observe("glazyr_vision_read_duration_seconds", result["latency_ms"])
+        if "fetch_ms" in result:
+            self.observe("glazyr_vision_fetch_duration_seconds", result["fetch_ms"])
+        transfer = result.get("transfer")
+        if transfer:
+            self.inc("glazyr_vision_fetched_bytes_total", transfer["wire_bytes"], encoding="wire")
+            self.inc("glazyr_vision_fetched_bytes_total", transfer["body_bytes"], encoding="body")
+
+    def render(self):
+        """The whole registry in Prometheus text exposition format."""
+        families = {}
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = list(self._histograms.items())
+        for (family, labels), value in counters:
+            families.setdefault(family, []).append((dict(labels), value))
+        for (family, labels), hist in histograms:
+            families.setdefault(family, []).append((dict(labels), hist))
+        families.setdefault("glazyr_vision_start_time_seconds", []).append(({}, round(self.started, 3)))
+        for collect in self._collectors:
+            for family, labels, value in collect():
+                families.setdefault(family, []).append((labels, value))
+
+        lines = []
+        for family in sorted(families):
+            kind, help_text = FAMILIES[family]
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for labels, value in sorted(families[family], key=lambda sample: sorted(sample[0].items())):
+                if isinstance(value, LatencyHistogram):
+                    lines.extend(render_histogram(family, value, labels))
+                else:
+                    lines.append(f"{family}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def cache_collector(cache):
+    """Collector for a ResponseCache's lifetime counters and size."""
+    def collect():
+        stats = cache.stats()
+        for outcome, key in (("hit", "hits"), ("stale", "stale"), ("revalidated", "revalidated"), ("miss", "misses")):
+            yield "glazyr_vision_cache_lookups_total", {"outcome": outcome}, stats[key]
+        yield "glazyr_vision_cache_entries", {}, stats["entries"]
+        yield "glazyr_vision_cache_bytes", {}, stats["bytes"]
+    return collect
+
+
+def segment_collector(registry):
+    """Collector for the FrameStats of every segment a SegmentRegistry has open."""
+    def collect():
+        readers = registry.open_readers()
+        yield "glazyr_vision_open_segments", {}, len(readers)
+        for instance, reader in readers.items():
+            stats = reader.stats
+            labels = {"instance": instance}
+            yield "glazyr_vision_frame_reads_total", labels, stats.reads
+            yield "glazyr_vision_frames_total", labels, stats.frames
+            yield "glazyr_vision_frames_skipped_total", labels, stats.skipped
+            yield "glazyr_vision_frame_age_seconds", labels, stats.age
+    return collect
+
+
+def start_http_server(metrics, port, host=METRICS_HOST):
+    """Serves metrics.render() on GET /metrics from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # stdout/stderr belong to the serve protocol
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="vision-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — vision.json DOM-State Reader
+Loads the node list the renderer publishes at /dev/shm/glazyr_vision and
+indexes it by role, label token and position, so queries such as "buttons
+labelled Authorize" or "the node at (x, y)" don't scan every node. The file
+is re-parsed only when it changes; rects are [x, y, width, height].
+
+When the renderer also publishes the compact binary form (glazyr_vision.bin,
+see write_binary_state) and NumPy is installed, the reader maps that instead
+and answers queries straight from its columns without parsing any JSON.
+"""
+import argparse
+import array
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # without NumPy the reader sticks to the JSON form
+    np = None
+
+VISION_STATE_PATH = '/dev/shm/glazyr_vision'
+GRID_CELL = 64  # px; spatial index bucket size
+STATE_HISTORY = 8  # past states kept per reader as delta baselines
+
+# Binary node table: a 64-byte header, then 8-byte aligned columns
+#   rects float64[count][4] | roles uint16[count] | flags uint8[count] |
+#   id_off, id_len, label_off, label_len, extra_off, extra_len uint32[count] |
+#   role_off, role_len uint32[role_count] | UTF-8 string table
+# Ids are stored as JSON text so numeric ids stay numeric. Node fields the
+# columns cannot hold exactly (other keys, non-string roles or labels,
+# non-integer rects) go to a per-node JSON object in "extra", which
+# overrides the columns when the node is decoded. Rects are float64 so hit
+# tests on fractional rects match the JSON index. A NaN timestamp is None.
+GVNB_MAGIC = b'GVNB'
+GVNB_VERSION = 3
+GVNB_HEADER = struct.Struct('<4sHHIIdII')  # magic, version, header size, sequence, count, timestamp, role_count, strings
+GVNB_HEADER_SIZE = 64
+# flags: which of the column fields the node actually has
+GVNB_HAS_ID = 1
+GVNB_HAS_RECT = 2
+GVNB_HAS_ROLE = 4
+GVNB_HAS_LABEL = 8
+GVNB_STRING_COLUMNS = ('id_off', 'id_len', 'label_off', 'label_len', 'extra_off', 'extra_len')
+
+TOKEN = re.compile(r'\w+')
+
+
+def label_tokens(text):
+    return TOKEN.findall(('' if text is None else str(text)).lower())
+
+
+class VisionState:
+    """An immutable, indexed snapshot of one vision.json document."""
+
+    def __init__(self, document, sequence):
+        self.sequence = sequence
+        self.timestamp = document.get('timestamp')
+        self.nodes = [node for node in document.get('nodes', []) if isinstance(node, dict)]
+        self.node_count = len(self.nodes)
+        self._node_map = None
+        self._by_id = {}
+        self._by_role = {}
+        self._by_token = {}
+        self._grid = {}
+        for index, node in enumerate(self.nodes):
+            if 'id' in node:
+                self._by_id[node['id']] = index
+            self._by_role.setdefault(str(node.get('role', '')).lower(), []).append(index)
+            for token in set(label_tokens(node.get('label'))):
+                self._by_token.setdefault(token, []).append(index)
+            for cell in self._cells(node.get('rect')):
+                self._grid.setdefault(cell, []).append(index)
+
+    @staticmethod
+    def _cells(rect):
+        if not rect or len(rect) != 4:
+            return
+        x, y, w, h = rect
+        if w <= 0 or h <= 0:
+            return
+        for cx in range(int(x) // GRID_CELL, int(x + w - 1) // GRID_CELL + 1):
+            for cy in range(int(y) // GRID_CELL, int(y + h - 1) // GRID_CELL + 1):
+                yield cx, cy
+
+    def get(self, node_id):
+        index = self._by_id.get(node_id)
+        return None if index is None else self.nodes[index]
+
+    def node_map(self):
+        """id -> node for every node that has an id."""
+        if self._node_map is None:
+            self._node_map = {node['id']: node for node in self.nodes if 'id' in node}
+        return self._node_map
+
+    def query(self, role=None, label=None, within=None, limit=None):
+        """
+        Nodes matching every given filter, in document order. label matches
+        nodes whose label contains all of its words (case-insensitive);
+        within keeps nodes whose rect intersects [x, y, w, h].
+        """
+        candidates = None
+        if role is not None:
+            candidates = set(self._by_role.get(role.lower(), ()))
+        if label is not None:
+            for token in label_tokens(label):
+                matches = self._by_token.get(token, ())
+                candidates = set(matches) if candidates is None else candidates.intersection(matches)
+                if not candidates:
+                    break
+        if within is not None:
+            near = set()
+            for cell in self._cells(within):
+                near.update(self._grid.get(cell, ()))
+            x, y, w, h = within
+            near = {i for i in near if _intersects(self.nodes[i]['rect'], x, y, w, h)}
+            candidates = near if candidates is None else candidates & near
+        indices = range(len(self.nodes)) if candidates is None else sorted(candidates)
+        nodes = [self.nodes[i] for i in indices]
+        return nodes if limit is None else nodes[:limit]
+
+    def node_at(self, x, y):
+        """The smallest node containing (x, y); later nodes win ties, as they paint on top."""
+        best = None
+        best_area = None
+        for index in self._grid.get((int(x) // GRID_CELL, int(y) // GRID_CELL), ()):
+            nx, ny, nw, nh = self.nodes[index]['rect']
+            if nx <= x < nx + nw and ny <= y < ny + nh:
+                area = nw * nh
+                if best is None or area <= best_area:
+                    best, best_area = index, area
+        return None if best is None else self.nodes[best]
+
+
+def _intersects(rect, x, y, w, h):
+    rx, ry, rw, rh = rect
+    return rx < x + w and x < rx + rw and ry < y + h and y < ry + rh
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _binary_layout(count, role_count):
+    """Byte offsets of each column for a table of count nodes, plus where strings start."""
+    layout = {}
+    offset = GVNB_HEADER_SIZE
+    for name, size in (('rects', 32 * count), ('roles', 2 * count), ('flags', count),
+                       *((name, 4 * count) for name in GVNB_STRING_COLUMNS),
+                       ('role_off', 4 * role_count), ('role_len', 4 * role_count)):
+        layout[name] = offset
+        offset = _align(offset + size)
+    layout['strings'] = offset
+    return layout
+
+
+def write_binary_state(path, document, sequence=0):
+    """
+    Writes document's nodes as a GVNB node table, atomically replacing path.
+    This is the layout the renderer publishes; the Python writer serves tools
+    and tests. A sequence of 0 means none: readers then use the file's mtime.
+    """
+    nodes = [node for node in document.get('nodes', []) if isinstance(node, dict)]
+    strings = bytearray()
+
+    def intern(text):
+        data = str(text).encode('utf-8')
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    role_codes = {}
+    rects = array.array('d')
+    roles = array.array('H')
+    flags = array.array('B')
+    columns = {name: array.array('I') for name in (*GVNB_STRING_COLUMNS, 'role_off', 'role_len')}
+    for node in nodes:
+        extra = {key: value for key, value in node.items() if key not in ('id', 'rect', 'role', 'label')}
+        node_flags = 0
+        if 'id' in node:
+            node_flags |= GVNB_HAS_ID
+        rect = node.get('rect')
+        if isinstance(rect, (list, tuple)) and len(rect) == 4 and all(isinstance(v, (int, float)) for v in rect):
+            rects.extend(float(v) for v in rect)
+            if all(type(v) is int for v in rect) and type(rect) is list:
+                node_flags |= GVNB_HAS_RECT
+            else:
+                extra['rect'] = rect
+        else:
+            rects.extend((0, 0, 0, 0))
+            if 'rect' in node:
+                extra['rect'] = rect
+        for field, flag in (('role', GVNB_HAS_ROLE), ('label', GVNB_HAS_LABEL)):
+            if isinstance(node.get(field), str):
+                node_flags |= flag
+            elif field in node:
+                extra[field] = node[field]
+        # Roles keep their case; queries compare them case-insensitively.
+        role = str(node.get('role', ''))
+        if role not in role_codes:
+            role_codes[role] = len(role_codes)
+            for name, value in zip(('role_off', 'role_len'), intern(role)):
+                columns[name].append(value)
+        roles.append(role_codes[role])
+        flags.append(node_flags)
+        for field, text in (('id', json.dumps(node['id']) if 'id' in node else ''),
+                            # Non-string labels decode from extra but are indexed as text, like the JSON index.
+                            ('label', '' if node.get('label') is None else str(node['label'])),
+                            ('extra', json.dumps(extra) if extra else '')):
+            for name, value in zip((f'{field}_off', f'{field}_len'), intern(text)):
+                columns[name].append(value)
+
+    layout = _binary_layout(len(nodes), len(role_codes))
+    body = bytearray(layout['strings'] + len(strings))
+    timestamp = document.get('timestamp')
+    GVNB_HEADER.pack_into(body, 0, GVNB_MAGIC, GVNB_VERSION, GVNB_HEADER_SIZE, sequence, len(nodes),
+                          float('nan') if timestamp is None else float(timestamp), len(role_codes), len(strings))
+    for name, column in (('rects', rects), ('roles', roles), ('flags', flags), *columns.items()):
+        if sys.byteorder != 'little':
+            column.byteswap()
+        data = column.tobytes()
+        body[layout[name]:layout[name] + len(data)] = data
+    body[layout['strings']:] = strings
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+class BinaryVisionState:
+    """
+    VisionState over a mapped GVNB node table. Filters run as NumPy masks
+    over the columns and only the matching nodes are decoded into dicts.
+    """
+
+    def __init__(self, buffer):
+        magic, version, header_size, self.sequence, count, timestamp, role_count, string_bytes = \
+            GVNB_HEADER.unpack_from(buffer, 0)
+        if magic != GVNB_MAGIC or version != GVNB_VERSION:
+            raise ValueError(f"Not a GVNB v{GVNB_VERSION} node table")
+        layout = _binary_layout(count, role_count)
+        if len(buffer) < layout['strings'] + string_bytes:
+            raise ValueError("Truncated GVNB node table")
+        self.timestamp = None if timestamp != timestamp else timestamp  # NaN: the document had none
+        self.node_count = count
+        self._buffer = buffer
+        self._rects = np.frombuffer(buffer, '<f8', 4 * count, layout['rects']).reshape(count, 4)
+        self._roles = np.frombuffer(buffer, '<u2', count, layout['roles'])
+        self._flags = np.frombuffer(buffer, 'u1', count, layout['flags'])
+        for name in GVNB_STRING_COLUMNS:
+            setattr(self, '_' + name, np.frombuffer(buffer, '<u4', count, layout[name]))
+        self._strings = memoryview(buffer)[layout['strings']:layout['strings'] + string_bytes]
+        role_off = np.frombuffer(buffer, '<u4', role_count, layout['role_off'])
+        role_len = np.frombuffer(buffer, '<u4', role_count, layout['role_len'])
+        self._role_names = [self._string(o, n) for o, n in zip(role_off.tolist(), role_len.tolist())]
+        self._by_id = None
+        self._by_token = None
+        self._node_map = None
+
+    def _string(self, offset, length):
+        return str(self._strings[offset:offset + length], 'utf-8')
+
+    def _node(self, index):
+        flags = int(self._flags[index])
+        node = {}
+        if flags & GVNB_HAS_ID:
+            node["id"] = json.loads(self._string(int(self._id_off[index]), int(self._id_len[index])))
+        if flags & GVNB_HAS_RECT:
+            node["rect"] = [int(v) for v in self._rects[index].tolist()]
+        if flags & GVNB_HAS_ROLE:
+            node["role"] = self._role_names[self._roles[index]]
+        if flags & GVNB_HAS_LABEL:
+            node["label"] = self._string(int(self._label_off[index]), int(self._label_len[index]))
+        if self._extra_len[index]:
+            node.update(json.loads(self._string(int(self._extra_off[index]), int(self._extra_len[index]))))
+        return node
+
+    @property
+    def nodes(self):
+        return [self._node(i) for i in range(self.node_count)]
+
+    def get(self, node_id):
+        if self._by_id is None:
+            self._by_id = {json.loads(self._string(o, n)): i for i, (o, n) in
+                           enumerate(zip(self._id_off.tolist(), self._id_len.tolist())) if n}
+        index = self._by_id.get(node_id)
+        return None if index is None else self._node(index)
+
+    def node_map(self):
+        if self._node_map is None:
+            self._node_map = {node['id']: node for node in self.nodes if 'id' in node}
+        return self._node_map
+
+    def _label_index(self):
+        # Built on the first label query only; role and spatial queries never decode labels.
+        if self._by_token is None:
+            self._by_token = {}
+            for index, (o, n) in enumerate(zip(self._label_off.tolist(), self._label_len.tolist())):
+                for token in set(label_tokens(self._string(o, n))):
+                    self._by_token.setdefault(token, []).append(index)
+        return self._by_token
+
+    def query(self, role=None, label=None, within=None, limit=None):
+        mask = np.ones(self.node_count, dtype=bool)
+        if role is not None:
+            role = role.lower()
+            codes = [code for code, name in enumerate(self._role_names) if name.lower() == role]
+            mask &= np.isin(self._roles, codes)
+        if within is not None:
+            x, y, w, h = within
+            rx, ry, rw, rh = self._rects.T
+            mask &= (rx < x + w) & (x < rx + rw) & (ry < y + h) & (y < ry + rh) & (rw > 0) & (rh > 0)
+        if label is not None:
+            by_token = self._label_index()
+            keep = np.zeros(self.node_count, dtype=bool)
+            tokens = label_tokens(label)
+            if tokens:
+                candidates = set(by_token.get(tokens[0], ()))
+                for token in tokens[1:]:
+                    candidates.intersection_update(by_token.get(token, ()))
+                keep[list(candidates)] = True
+            else:
+                keep[:] = True
+            mask &= keep
+        indices = np.flatnonzero(mask)
+        if limit is not None:
+            indices = indices[:limit]
+        return [self._node(i) for i in indices.tolist()]
+
+    def node_at(self, x, y):
+        rx, ry, rw, rh = self._rects.T
+        hits = np.flatnonzero((rx <= x) & (x < rx + rw) & (ry <= y) & (y < ry + rh))
+        if not len(hits):
+            return None
+        area = rw[hits] * rh[hits]
+        return self._node(int(hits[np.flatnonzero(area == area.min())[-1]]))
+
+
+def diff_states(old, new):
+    """
+    Node changes from old to new, keyed by id: added nodes in full, removed
+    ids, and id plus the new value for nodes that moved (rect) or were
+    relabelled (label or role).
+    """
+    before = old.node_map()
+    after = new.node_map()
+    added, moved, relabelled = [], [], []
+    for node_id, node in after.items():
+        previous = before.get(node_id)
+        if previous is None:
+            added.append(node)
+            continue
+        if list(previous.get('rect') or ()) != list(node.get('rect') or ()):
+            moved.append({"id": node_id, "rect": node.get('rect')})
+        if previous.get('label') != node.get('label') or previous.get('role') != node.get('role'):
+            relabelled.append({"id": node_id, "role": node.get('role'), "label": node.get('label')})
+    return {
+        "added": added,
+        "removed": [node_id for node_id in before if node_id not in after],
+        "moved": moved,
+        "relabelled": relabelled,
+    }
+
+
+class VisionStateReader:
+    """
+    Returns the current VisionState, re-loading only when the file's
+    inode, size or mtime change. The binary table at binary_path (default
+    <path>.bin) is preferred when present, NumPy is available and the JSON
+    document is not newer than it (a stale table never hides fresh JSON). A JSON
+    document that fails to parse (caught mid-write) yields the previous
+    state if there is one. The last STATE_HISTORY states are kept, by
+    sequence, as baselines for deltas().
+    """
+
+    def __init__(self, path=None, binary_path=None, history=STATE_HISTORY):
+        self.path = path or VISION_STATE_PATH
+        self.binary_path = binary_path or self.path + '.bin'
+        self.history = history
+        self._stamp = None
+        self._state = None
+        self._states = OrderedDict()  # sequence -> state, oldest first
+
+    def _loaded(self, state, stamp):
+        self._state = state
+        self._stamp = stamp
+        self._states.pop(state.sequence, None)
+        self._states[state.sequence] = state
+        while len(self._states) > self.history:
+            self._states.popitem(last=False)
+        return state
+
+    def deltas(self, since_seq):
+        """(current state, changes since since_seq), with None changes if that baseline is gone."""
+        state = self.state()
+        if state is None:
+            return None, None
+        base = self._states.get(since_seq)
+        if base is None:
+            return state, None
+        return state, diff_states(base, state)
+
+    def _binary_state(self, json_mtime_ns=None):
+        try:
+            with open(self.binary_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if json_mtime_ns is not None and json_mtime_ns > st.st_mtime_ns:
+                    return None
+                stamp = (self.binary_path, st.st_ino, st.st_size, st.st_mtime_ns)
+                if stamp == self._stamp:
+                    return self._state
+                # Writers replace the file atomically, so the mapping stays valid
+                # (and unchanged) for as long as the state references it.
+                state = BinaryVisionState(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            return None  # absent, empty or not a GVNB table: use the JSON form
+        if not state.sequence:
+            # No sequence from the writer: fall back to the mtime, as for JSON.
+            state.sequence = st.st_mtime_ns // 1000
+        return self._loaded(state, stamp)
+
+    def state(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if np is not None:
+            state = self._binary_state(None if st is None else st.st_mtime_ns)
+            if state is not None:
+                return state
+        if st is None:
+            self._stamp = self._state = None
+            return None
+        stamp = (self.path, st.st_ino, st.st_size, st.st_mtime_ns)
+        if stamp == self._stamp:
+            return self._state
+        try:
+            with open(self.path, 'rb') as f:
+                document = json.loads(f.read())
+        except ValueError:
+            if self._state is not None:
+                return self._state
+            raise
+        # Prefer the renderer's own sequence number; otherwise the mtime (in
+        # microseconds), which every worker reading the file agrees on.
+        sequence = document.get('seq', document.get('sequence', st.st_mtime_ns // 1000))
+        return self._loaded(VisionState(document, sequence), stamp)
+
+
+def query_nodes(reader, role=None, label=None, at=None, within=None, limit=50, since_seq=None):
+    """
+    The serve-mode "nodes" op: filters the current state into a JSON-able
+    dict. With since_seq, returns only the changes to the whole node set
+    since that sequence; if it is no longer held, "resync" is set and the
+    filtered nodes are returned in full.
+    """
+    if since_seq is not None:
+        state, delta = reader.deltas(since_seq)
+        if delta is not None:
+            return {
+                "status": "ok",
+                "sequence": state.sequence,
+                "since_sequence": since_seq,
+                "timestamp": state.timestamp,
+                "total_nodes": state.node_count,
+                "delta": delta,
+            }
+    state = reader.state()
+    if state is None:
+        return {"status": "no-vision-state", "path": reader.path, "nodes": []}
+    if at is not None:
+        node = state.node_at(*at)
+        nodes = [node] if node is not None else []
+    else:
+        nodes = state.query(role, label, within, limit)
+    result = {
+        "status": "ok",
+        "sequence": state.sequence,
+        "timestamp": state.timestamp,
+        "total_nodes": state.node_count,
+        "count": len(nodes),
+        "nodes": nodes,
+    }
+    if since_seq is not None:
+        result["resync"] = True
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the vision.json DOM state")
+    parser.add_argument("--path", default=VISION_STATE_PATH)
+    parser.add_argument("--role")
+    parser.add_argument("--label")
+    parser.add_argument("--at", type=float, nargs=2, metavar=("X", "Y"))
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--to-binary", metavar="OUT",
+                        help="Convert the JSON document at --path to a GVNB node table and exit")
+    args = parser.parse_args()
+    if args.to_binary:
+        with open(args.path, 'rb') as f:
+            document = json.loads(f.read())
+        write_binary_state(args.to_binary, document, document.get('seq', 0))
+        sys.exit(0)
+    print(json.dumps(query_nodes(VisionStateReader(args.path), args.role, args.label, args.at,
+                                 limit=args.limit), indent=2))
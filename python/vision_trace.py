@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Glazyr Viz — Vision Trace
+Named spans around the stages of the vision hot path (mmap, header,
+pixels, diff, metrics, fetch, parse, serialize, and one per serve op).
+Disabled, a span is a shared no-op context manager; enabled, each span
+records its duration into a per-span LatencyHistogram and appends a
+complete event to a bounded ring that exports as Chrome trace JSON
+(chrome://tracing, ui.perfetto.dev).
+
+On demand the tracer also profiles a sample of serve ops: "cpu" runs them
+under cProfile, "memory" keeps tracemalloc running across them and diffs
+snapshots. Each capture stops by itself after its op budget, so a worker in
+production can be asked why p99 moved without restarting it.
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+from latency_histogram import LatencyHistogram
+
+TRACE_EVENTS = 20_000
+PROFILE_OPS = 20
+PROFILE_LINES = 25
+TRACEMALLOC_FRAMES = 1
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_start')
+
+    def __init__(self, tracer, name):
+        self._tracer = tracer
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer.add(self._name, self._start, time.perf_counter())
+        return False
+
+
+class _ProfiledOp:
+    """Runs one serve op under the tracer's armed capture."""
+    __slots__ = ('_tracer',)
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+
+    def __enter__(self):
+        capture = self._tracer._capture
+        if capture["kind"] == "cpu":
+            capture["profiler"].enable()
+        return self
+
+    def __exit__(self, *exc):
+        tracer = self._tracer
+        capture = tracer._capture
+        if capture["kind"] == "cpu":
+            capture["profiler"].disable()
+        capture["profiled"] += 1
+        if capture["profiled"] >= capture["ops"]:
+            tracer._finish_capture()
+        return False
+
+
+class Tracer:
+    """
+    Spans are recorded from any thread; profile captures are armed and
+    consumed by the serve loop's thread (cProfile only sees the thread that
+    enabled it, so batch ops profile their dispatch, not their pool).
+    """
+
+    def __init__(self, max_events=TRACE_EVENTS):
+        self.enabled = False
+        self.histograms = {}
+        self._events = deque(maxlen=max_events)
+        self._capture = None
+        self.last_profile = None
+        self._lock = threading.Lock()
+
+    # ── spans ──────────────────────────────────────────────────────────────
+
+    def span(self, name):
+        """Context manager timing one stage; NULL_SPAN while tracing is off."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, start_s, end_s):
+        """Records a span measured elsewhere from perf_counter() readings."""
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, LatencyHistogram())
+        hist.record((end_s - start_s) * 1000)
+        self._events.append((name, start_s, end_s, threading.get_ident()))
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self._events.clear()
+
+    def summary(self):
+        return {name: hist.summary() for name, hist in sorted(self.histograms.items())}
+
+    def chrome_trace(self):
+        """
+        The event ring as a Chrome trace (JSON object format). Timestamps are
+        raw perf_counter microseconds, a system-wide monotonic clock on
+        Linux, so traces from several workers line up when merged.
+        """
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                   "args": {"name": f"zero_copy_vision {pid}"}}]
+        for name, start_s, end_s, tid in list(self._events):
+            events.append({
+                "name": name,
+                "cat": "vision",
+                "ph": "X",
+                "ts": round(start_s * 1e6, 3),
+                "dur": round((end_s - start_s) * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"spans": self.summary()}}
+
+    # ── profile captures ───────────────────────────────────────────────────
+
+    def arm_profile(self, kind="cpu", ops=PROFILE_OPS, every=1, limit=PROFILE_LINES, dump=None):
+        """
+        Profiles every `every`-th serve op until `ops` of them ran. "cpu"
+        reports the top `limit` functions by cumulative time (and writes
+        pstats data to `dump` if given); "memory" reports the top `limit`
+        allocation sites grown over the capture.
+        """
+        if kind not in ("cpu", "memory"):
+            raise ValueError(f"Unknown profile kind: {kind!r} (expected 'cpu' or 'memory')")
+        if self._capture is not None:
+            raise RuntimeError(f"A {self._capture['kind']} capture is already running")
+        capture = {"kind": kind, "ops": max(1, int(ops)), "every": max(1, int(every)),
+                   "limit": max(1, int(limit)), "dump": dump, "seen": 0, "profiled": 0,
+                   "started": time.time()}
+        if kind == "cpu":
+            capture["profiler"] = cProfile.Profile()
+        else:
+            capture["owns_tracemalloc"] = not tracemalloc.is_tracing()
+            if capture["owns_tracemalloc"]:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            capture["baseline"] = tracemalloc.take_snapshot()
+        self._capture = capture
+        return self.profile_state()
+
+    def profiled(self):
+        """Context manager for one serve op: profiles it if the armed capture samples it."""
+        capture = self._capture
+        if capture is None:
+            return NULL_SPAN
+        capture["seen"] += 1
+        if (capture["seen"] - 1) % capture["every"]:
+            return NULL_SPAN
+        return _ProfiledOp(self)
+
+    def cancel_profile(self):
+        capture, self._capture = self._capture, None
+        if capture is not None and capture["kind"] == "memory" and capture["owns_tracemalloc"]:
+            tracemalloc.stop()
+
+    def profile_state(self):
+        capture = self._capture
+        if capture is None:
+            return {"state": "idle" if self.last_profile is None else "done"}
+        return {"state": "running", "kind": capture["kind"], "profiled": capture["profiled"],
+                "ops": capture["ops"], "every": capture["every"]}
+
+    def _finish_capture(self):
+        capture, self._capture = self._capture, None
+        report = {"kind": capture["kind"], "ops": capture["profiled"], "seen": capture["seen"],
+                  "elapsed_s": round(time.time() - capture["started"], 3)}
+        if capture["kind"] == "cpu":
+            stats = pstats.Stats(capture["profiler"])
+            if capture["dump"]:
+                stats.dump_stats(capture["dump"])
+                report["dump"] = capture["dump"]
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            report["functions"] = [{
+                "function": f"{os.path.basename(filename)}:{line}({func})",
+                "calls": total_calls,
+                "self_ms": round(self_s * 1000, 3),
+                "cumulative_ms": round(cumulative_s * 1000, 3),
+            } for (filename, line, func), (_, total_calls, self_s, cumulative_s, _) in rows[:capture["limit"]]]
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            if capture["owns_tracemalloc"]:
+                tracemalloc.stop()
+            growth = snapshot.compare_to(capture["baseline"], 'lineno')
+            report["allocations"] = [{
+                "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+            } for stat in growth[:capture["limit"]]]
+        self.last_profile = report
+
+
+# The process-wide tracer; GLAZYR_TRACE=1 turns spans on at startup.
+TRACER = Tracer()
+if os.environ.get('GLAZYR_TRACE', '').lower() in ('1', 'true', 'yes', 'on'):
+    TRACER.enable()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge Chrome traces exported by several vision workers")
+    parser.add_argument("files", nargs="+", help="Chrome trace JSON files (the trace op's chrome_trace)")
+    parser.add_argument("--out", default="-", help="Output file (default stdout)")
+    args = parser.parse_args()
+    merged = {"traceEvents": [], "displayTimeUnit": "ms"}
+    for name in args.files:
+        with open(name) as f:
+            merged["traceEvents"].extend(json.load(f)["traceEvents"])
+    if args.out == "-":
+        print(json.dumps(merged))
+    else:
+        with open(args.out, "w") as f:
+            json.dump(merged, f)
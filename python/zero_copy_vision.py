@@ -3,124 +3,1438 @@
 Glazyr Viz — Zero-Copy Vision Backbone
 Operates at hardware-speed using OS-Level Shared Memory.
 Includes a graceful fallback for local development without the NeuralChromium renderer.
+
+Run with --serve to keep a long-lived worker that answers newline-delimited JSON
+requests on stdin/stdout, holding the SHM mapping open between calls.
 """
 import argparse
+import asyncio
+import base64
+import codecs
 import json
+import zlib
+from collections import OrderedDict, deque
 import time
 import sys
 import os
+import struct
+import threading
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
 
-def run_zero_copy_vision(url):
-    # Try exact Zero-Copy on Linux where NeuralChromium renders
-    SHM_NAME = 'NeuralChromium_Video'
-    SHM_SIZE = 1920 * 1080 * 4 + 256
+from http_fetch import HttpFetcher
+from latency_histogram import LatencyHistogram
+from response_cache import ResponseCache
+from vision_state import VisionStateReader, query_nodes
+from vision_trace import NULL_SPAN, PROFILE_LINES, PROFILE_OPS, TRACER
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; ndarray views and frame metrics need it
+    np = None
+
+SHM_NAME = 'NeuralChromium_Video'
+MRCN_MAGIC = 0x4E43524D  # 'MRCN'
+MRCN_HEADER = struct.Struct('<IIIIQII')  # magic, width, height, stride, timestamp_us, fmt, seq_num
+MRCN_SEQ_OFFSET = 28
+PIXEL_OFFSET = 256
+
+# Optional multi-buffer layout, negotiated through the otherwise unused header
+# bytes. A compositor that sets slot_count >= 2 renders into slot
+# (front_slot + 1) % slot_count, then publishes it by writing that slot's
+# entry in the sequence table and flipping front_slot. Before overwriting a
+# slot it zeroes the slot's sequence entry, and it stamps the slot's
+# timestamp entry before publishing its sequence number. Zero-filled headers
+# (slot_count 0 or 1) mean the legacy single buffer at PIXEL_OFFSET, which
+# the compositor overwrites in place and only then bumps seq_num: it has no
+# write-in-progress marker, so a read cannot detect a write that is still
+# running when it re-checks the sequence number.
+MRCN_SLOTS = struct.Struct('<III')  # slot_count, front_slot, slot_bytes
+MRCN_SLOTS_OFFSET = 32
+MRCN_SLOT_SEQ_OFFSET = 64  # uint32 sequence number per slot
+MRCN_SLOT_TIMESTAMP_OFFSET = 96  # uint64 timestamp_us per slot; 0 means use the header's
+MRCN_MAX_SLOTS = 8
+
+# Pixel formats carried in the header's fmt field: code -> (name, bytes per
+# pixel of the first plane). NV12 is a full-size Y plane followed by a
+# half-height interleaved UV plane, both `stride` bytes per row.
+FMT_BGRA8888 = 0
+FMT_RGBA8888 = 1
+FMT_RGB565 = 2
+FMT_NV12 = 3
+PIXEL_FORMATS = {
+    FMT_BGRA8888: ("BGRA", 4),
+    FMT_RGBA8888: ("RGBA", 4),
+    FMT_RGB565: ("RGB565", 2),
+    FMT_NV12: ("NV12", 1),
+}
+
+TORN_FRAME_RETRIES = 3
+
+# wait_for_frame busy-polls the header for FRAME_SPIN_S (a poll is a mapped
+# header read, about a microsecond and no syscall), then sleeps with
+# exponential backoff capped at FRAME_MAX_SLEEP_S. A frame published during
+# the spin is seen within microseconds; after it, within one capped sleep
+# plus timer slack, about 0.6 ms, at roughly 2000 wakeups/s (a few percent
+# of a core) while idle.
+FRAME_SPIN_S = 0.0005
+FRAME_MIN_SLEEP_S = 0.00005
+FRAME_MAX_SLEEP_S = 0.0005
+
+# A mapped reader stats the segment only when the header's geometry changes,
+# a read would run past the mapping, or SEGMENT_RECHECK_S has passed (which
+# catches a segment unlinked and recreated under the same path), so polls
+# stay syscall-free.
+SEGMENT_RECHECK_S = 1.0
+
+# Frame accounting: rolling counters cover the last FRAME_STATS_WINDOW_S
+# seconds. timestamp_us is CLOCK_MONOTONIC (Chromium's TimeTicks); an age
+# outside [0, FRAME_AGE_MAX_S) means the stamp is on another clock and is
+# not reported.
+FRAME_STATS_WINDOW_S = 10.0
+FRAME_AGE_MAX_S = 3600
+
+
+# Frame metrics are opt-in per call; callers only pay for what they ask for.
+METRIC_LUMA = 1
+METRIC_HISTOGRAM = 2
+METRIC_TILES = 4
+METRIC_THUMBNAIL = 8
+METRIC_NAMES = {
+    "luma": METRIC_LUMA,
+    "histogram": METRIC_HISTOGRAM,
+    "tiles": METRIC_TILES,
+    "thumbnail": METRIC_THUMBNAIL,
+}
+
+DIFF_TILE = 32
+DIFF_HISTORY = 8
+
+# The fallback only keeps this much of a page, so it stops downloading and
+# parsing once the title and the text budget are filled.
+TEXT_BUDGET = 50
+PREVIEW_CHARS = 500
+# A compressed chunk can inflate to hundreds of KB; feed it in slices so the
+# budget check runs often.
+FEED_SLICE = 4096
+
+# Batch validation: total in-flight URLs, and how many of those may hit the
+# same host at once. After BATCH_DEADLINE_S no new URL is started; the ones
+# in flight finish and the rest are reported as unfinished.
+BATCH_CONCURRENCY = 8
+BATCH_PER_HOST = 2
+BATCH_DEADLINE_S = 300.0
+
+# Rec.709 luma weights scaled to sum to 256, so a weighted BGRA pixel fits
+# in uint16 and the whole plane is computed without floating point.
+LUMA_WEIGHTS_BGR = (19, 183, 54)
+# Luma-based metrics (luma, tiles, thumbnail) read every LUMA_STEP-th row and
+# column: a quarter of the pixels, which keeps all metrics on a 1080p frame
+# within a few milliseconds on one core.
+LUMA_STEP = 2
+
+
+class TornFrameError(RuntimeError):
+    """The compositor kept overwriting the frame for every retry of a snapshot read."""
+
+
+class SegmentUnavailableError(RuntimeError):
+    """The SHM segment is too small to hold a frame, e.g. while the compositor creates or resizes it."""
 
-    if os.name == 'posix':
+
+def frame_bytes(fmt, stride, height):
+    """Size of a frame's pixel data for the given header fields."""
+    if fmt not in PIXEL_FORMATS:
+        raise ValueError(f"Unsupported MRCN pixel format {fmt}")
+    if fmt == FMT_NV12:
+        return stride * (height + (height + 1) // 2)
+    return stride * height
+
+
+class FrameView:
+    """
+    Zero-copy window onto the pixel region of one MRCN frame.
+
+    `pixels` is a flat memoryview backed directly by the SHM mapping, so the
+    compositor's writes show through it. Release the view (or use it as a
+    context manager) once done so the reader can remap or close the segment.
+    """
+
+    def __init__(self, shm, width, height, stride, timestamp_us, fmt, seq_num,
+                 offset=PIXEL_OFFSET, seq_offset=MRCN_SEQ_OFFSET, slot=0):
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.timestamp_us = timestamp_us
+        self.fmt = fmt
+        self.format_name, self.bytes_per_pixel = PIXEL_FORMATS[fmt]
+        self.seq_num = seq_num
+        self.slot = slot
+        self._shm = shm
+        self._seq_offset = seq_offset
+        self.pixels = memoryview(shm)[offset:offset + frame_bytes(fmt, stride, height)]
+
+    def is_consistent(self):
+        """
+        True while this frame's sequence number is unchanged. For a slot that
+        means the compositor has not started overwriting it (it zeroes the
+        slot's entry first); the legacy single buffer only bumps seq_num
+        once a write finished, so a write still in progress goes unnoticed.
+        """
+        return struct.unpack_from('<I', self._shm, self._seq_offset)[0] == self.seq_num
+
+    def ndarray(self):
+        """
+        Read-only array sharing the mapping, shaped by pixel format:
+          BGRA / RGBA — uint8 (height, stride/4, 4)
+          RGB565      — uint16 (height, stride/2)
+          NV12        — uint8 Y plane (height, stride)
+        """
+        if np is None:
+            raise RuntimeError("NumPy is not installed; use FrameView.pixels instead")
+        plane = self.pixels[:self.stride * self.height]
+        if self.bytes_per_pixel == 4:
+            return np.frombuffer(plane, dtype=np.uint8).reshape(self.height, self.stride // 4, 4)
+        if self.fmt == FMT_RGB565:
+            return np.frombuffer(plane, dtype='<u2').reshape(self.height, self.stride // 2)
+        return np.frombuffer(plane, dtype=np.uint8).reshape(self.height, self.stride)
+
+    def release(self):
         try:
-            import mmap
-            import struct
-            shm_path = f'/dev/shm/{SHM_NAME}'
-            if os.path.exists(shm_path):
-                shm_fd = os.open(shm_path, os.O_RDWR)
-                shm = mmap.mmap(shm_fd, SHM_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+            self.pixels.release()
+        except BufferError:
+            pass  # an ndarray still borrows the buffer; it is freed with the array
 
-                t_start = time.perf_counter()
+    def __enter__(self):
+        return self
 
-                shm.seek(0)
-                header_data = shm.read(32)
-                magic, width, height, stride, timestamp_us, fmt, seq_num = struct.unpack('<IIIIQII', header_data)
-
-                if magic == 0x4E43524D:  # 'MRCN'
-                    shm.seek(256)
-                    pixel_data = shm.read(width * height * 4)
-                    sample_blue = sum(pixel_data[0:4000:4]) / 1000.0
-
-                    t_read = (time.perf_counter() - t_start) * 1000
-
-                    result = {
-                        "url": url,
-                        "status": "zero-copy-active",
-                        "resolution": f"{width}x{height}",
-                        "latest_sequence": seq_num,
-                        "visual_luma_metric": round(sample_blue, 2),
-                        "latency_ms": round(t_read, 2),
-                        "timestamp_us": timestamp_us,
-                        "message": "Direct visual linkage established. The Serialization Tax is dead."
-                    }
-                    print(json.dumps(result, indent=2))
-                    sys.exit(0)
-        except Exception:
-            pass  # Fall through to HTTP fallback
+    def __exit__(self, *exc):
+        self.release()
 
-    # FALLBACK: HTTP contextual extraction for local dev / Windows
-    import urllib.request
-    from html.parser import HTMLParser
-
-    class TextExtractor(HTMLParser):
-        def __init__(self):
-            super().__init__()
-            self.texts = []
-            self.title = ""
-            self._in_title = False
-            self._in_skip = False
-
-        def handle_starttag(self, tag, attrs):
-            if tag == "title":
-                self._in_title = True
-            if tag in ("script", "style"):
-                self._in_skip = True
-
-        def handle_endtag(self, tag):
-            if tag == "title":
-                self._in_title = False
-            if tag in ("script", "style"):
-                self._in_skip = False
-
-        def handle_data(self, data):
-            if self._in_title:
-                self.title = data.strip()
-            elif not self._in_skip:
-                text = data.strip()
-                if text:
-                    self.texts.append(text)
 
-    t_start = time.perf_counter()
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'GlazyrViz/0.2.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8', errors='ignore')
-            t_fetch = (time.perf_counter() - t_start) * 1000
+def metric_mask(names):
+    """Turns a list of metric names (see METRIC_NAMES) into a bit mask."""
+    mask = 0
+    for name in names or ():
+        if name not in METRIC_NAMES:
+            raise ValueError(f"Unknown metric {name!r}; expected one of {sorted(METRIC_NAMES)}")
+        mask |= METRIC_NAMES[name]
+    return mask
+
+
+def _color_planes(frame, region=None):
+    """
+    Visible (B, G, R) uint8 planes, optionally of region=(x, y, w, h) only:
+    views for 32-bit formats, decoded for RGB565, None for NV12.
+    """
+    x, y, w, h = region or (0, 0, frame.width, frame.height)
+    pixels = frame.ndarray()[y:y + h, x:x + w]
+    if frame.fmt == FMT_BGRA8888:
+        return pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    if frame.fmt == FMT_RGBA8888:
+        return pixels[..., 2], pixels[..., 1], pixels[..., 0]
+    if frame.fmt == FMT_RGB565:
+        b5 = (pixels & 0x1f).astype(np.uint8)
+        g6 = ((pixels >> 5) & 0x3f).astype(np.uint8)
+        r5 = (pixels >> 11).astype(np.uint8)
+        return (b5 << 3) | (b5 >> 2), (g6 << 2) | (g6 >> 4), (r5 << 3) | (r5 >> 2)
+    return None
+
+
+def _luma_plane(frame, step=1):
+    """Rec.709 luma scaled by 256, as uint16, of every step-th row and column."""
+    planes = _color_planes(frame)
+    if planes is None:  # NV12 already carries luma in its Y plane
+        return np.multiply(frame.ndarray()[::step, :frame.width:step], 256, dtype=np.uint16)
+    b, g, r = (plane[::step, ::step] for plane in planes)
+    luma = np.multiply(b, LUMA_WEIGHTS_BGR[0], dtype=np.uint16)
+    term = np.multiply(g, LUMA_WEIGHTS_BGR[1], dtype=np.uint16)
+    luma += term
+    np.multiply(r, LUMA_WEIGHTS_BGR[2], dtype=np.uint16, out=term)
+    luma += term
+    return luma
+
+
+def _legacy_blue_sample(frame):
+    """The historical visual_luma_metric: mean blue (Y for NV12) of the first 1000 pixels."""
+    if frame.bytes_per_pixel == 4:
+        blue = 0 if frame.fmt == FMT_BGRA8888 else 2
+        return sum(frame.pixels[blue:blue + 4000:4]) / 1000.0
+    if frame.fmt == FMT_RGB565:
+        return sum(((w & 0x1f) << 3) | ((w & 0x1f) >> 2) for w in frame.pixels[:2000].cast('H')) / 1000.0
+    return sum(frame.pixels[0:1000]) / 1000.0
+
+
+def _box_sums(plane, rows, cols):
+    """Sums of plane over a rows x cols grid of equal boxes; edges that don't divide evenly are dropped."""
+    bh, bw = plane.shape[0] // rows, plane.shape[1] // cols
+    row_sums = plane[:rows * bh, :cols * bw].reshape(rows * bh, cols, bw).sum(axis=2, dtype=np.uint32)
+    return row_sums.reshape(rows, bh, cols).sum(axis=1, dtype=np.uint64), bh * bw
+
+
+def compute_frame_metrics(frame, mask=METRIC_LUMA, grid=(8, 8), thumb_width=64,
+                          histogram_bins=32, histogram_step=2):
+    """
+    Vectorized metrics over a FrameView without copying the mapping:
+      luma      — mean Rec.709 luma of the visible frame, sampled every LUMA_STEP pixels
+      histogram — per-channel (B, G, R; Y for NV12) histograms with histogram_bins bins,
+                  sampled on every histogram_step-th row and column
+      tiles     — mean luma per cell of a grid=(rows, cols) layout
+      thumbnail — box-filtered 8-bit grayscale thumbnail, base64 encoded
+    The luma plane is computed once and shared by luma, tiles and thumbnail;
+    it is only read at full resolution when the grid or thumbnail has more
+    cells than the subsampled plane has pixels.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is not installed; frame metrics are unavailable")
+    if histogram_bins not in (2 ** n for n in range(9)):
+        raise ValueError("histogram_bins must be a power of two no larger than 256")
+    if mask & METRIC_TILES:
+        rows, cols = grid
+        if not (1 <= rows <= frame.height and 1 <= cols <= frame.width):
+            raise ValueError(f"Tile grid {rows}x{cols} does not fit a {frame.width}x{frame.height} frame")
+    tw = max(1, min(thumb_width, frame.width))
+    th = max(1, min(round(frame.height * tw / frame.width), frame.height))
+    need_rows, need_cols = 1, 1
+    if mask & METRIC_TILES:
+        need_rows, need_cols = rows, cols
+    if mask & METRIC_THUMBNAIL:
+        need_rows, need_cols = max(need_rows, th), max(need_cols, tw)
+    step = LUMA_STEP
+    if need_rows > -(-frame.height // step) or need_cols > -(-frame.width // step):
+        step = 1
+    metrics = {}
+
+    luma = _luma_plane(frame, step) if mask & (METRIC_LUMA | METRIC_TILES | METRIC_THUMBNAIL) else None
+
+    if mask & METRIC_LUMA:
+        metrics["luma_mean"] = round(int(luma.sum(dtype=np.uint64)) / (luma.size * 256), 2)
+
+    if mask & METRIC_HISTOGRAM:
+        planes = _color_planes(frame)
+        channels = dict(zip("bgr", planes)) if planes else {"y": frame.ndarray()[:, :frame.width]}
+        metrics["histogram"] = {
+            name: np.bincount(plane[::histogram_step, ::histogram_step].ravel(), minlength=256)
+                    .reshape(histogram_bins, -1).sum(axis=1).tolist()
+            for name, plane in channels.items()
+        }
+        metrics["histogram_step"] = histogram_step
+
+    if mask & METRIC_TILES:
+        sums, count = _box_sums(luma, rows, cols)
+        metrics["tiles"] = {
+            "grid": [rows, cols],
+            "luma_mean": np.round(sums / (count * 256), 1).tolist(),
+        }
+
+    if mask & METRIC_THUMBNAIL:
+        sums, count = _box_sums(luma, th, tw)
+        thumb = (sums // (count * 256)).astype(np.uint8)
+        metrics["thumbnail"] = {
+            "width": tw,
+            "height": th,
+            "format": "gray8",
+            "data": base64.b64encode(thumb.tobytes()).decode("ascii"),
+        }
+
+    return metrics
+
+
+def monotonic_us():
+    """The clock the compositor stamps into timestamp_us, in microseconds."""
+    return time.monotonic_ns() // 1000
+
+
+class FrameStats:
+    """
+    Accounts for every frame a reader hands out: compositor-to-reader age
+    (now - timestamp_us), sequence numbers skipped since the previous read,
+    and re-reads of an unchanged frame. snapshot() reports rolling fps,
+    drop rate and age percentiles over the last window_s seconds, plus
+    lifetime totals.
+    """
+
+    def __init__(self, window_s=FRAME_STATS_WINDOW_S):
+        self.window_s = window_s
+        self._window = deque()  # (t_s, new frame?, skipped, age_ms or None) per read
+        self._lock = threading.Lock()
+        self._started = None
+        self.last_seq = None
+        self.reads = 0
+        self.frames = 0
+        self.repeats = 0
+        self.skipped = 0
+        self.age = LatencyHistogram()
+
+    def observe(self, seq, timestamp_us, now_us=None):
+        """Accounts one read of frame seq and returns (age_ms or None, skipped)."""
+        now_us = monotonic_us() if now_us is None else now_us
+        age_us = now_us - timestamp_us
+        age_ms = age_us / 1000 if timestamp_us and 0 <= age_us < FRAME_AGE_MAX_S * 1e6 else None
+        t_now = now_us / 1e6
+        with self._lock:
+            if self._started is None:
+                self._started = t_now
+            new = seq != self.last_seq
+            skipped = 0
+            if new and self.last_seq is not None:
+                skipped = (seq - self.last_seq) % 2**32 - 1
+                if skipped >= 2**31:  # sequence went backwards: the compositor restarted
+                    skipped = 0
+            self.reads += 1
+            if new:
+                self.frames += 1
+                self.skipped += skipped
+                self.last_seq = seq
+            else:
+                self.repeats += 1
+            if age_ms is not None:
+                self.age.record(age_ms)
+            self._window.append((t_now, new, skipped, age_ms))
+            self._trim(t_now)
+        return age_ms, skipped
+
+    def _trim(self, t_now):
+        while self._window and self._window[0][0] < t_now - self.window_s:
+            self._window.popleft()
+
+    def snapshot(self):
+        t_now = monotonic_us() / 1e6
+        with self._lock:
+            self._trim(t_now)
+            window = list(self._window)
+            lifetime = {
+                "reads": self.reads,
+                "frames": self.frames,
+                "repeats": self.repeats,
+                "skipped": self.skipped,
+                "age_ms": self.age.summary(),
+            }
+            span = t_now - max(t_now - self.window_s, self._started) if self._started is not None else 0.0
+            last_seq = self.last_seq
+        frames = sum(1 for _, new, _, _ in window if new)
+        skipped = sum(entry[2] for entry in window)
+        ages = LatencyHistogram()
+        for *_, age_ms in window:
+            if age_ms is not None:
+                ages.record(age_ms)
+        return {
+            "window_s": round(span, 2),
+            "reads": len(window),
+            "frames": frames,
+            "skipped": skipped,
+            "fps": round(frames / span, 2) if span > 0 else 0.0,
+            "published_fps": round((frames + skipped) / span, 2) if span > 0 else 0.0,
+            "drop_rate": round(skipped / (frames + skipped), 4) if frames + skipped else 0.0,
+            "age_ms": ages.summary(),
+            "last_sequence": last_seq,
+            "lifetime": lifetime,
+        }
+
+
+class FrameDiffer:
+    """
+    Dirty-region detection between frames. Keeps a compact per-tile
+    fingerprint for the last few sequence numbers seen and reports which
+    tiles changed as merged [x, y, w, h] rectangles. A frame whose sequence
+    number matches the baseline is reported unchanged without touching pixels.
+    """
+
+    def __init__(self, tile=DIFF_TILE, history=DIFF_HISTORY):
+        self.tile = tile
+        self.history = history
+        self._prints = OrderedDict()  # seq_num -> (geometry, fingerprints)
+        self._last_seq = None
+        if np is not None:
+            rng = np.random.default_rng(0x4E43524D)
+            self._col_weights = rng.integers(1, 2 ** 63, size=tile // 2, dtype=np.uint64) | np.uint64(1)
+            self._row_weights = rng.integers(1, 2 ** 63, size=tile, dtype=np.uint64) | np.uint64(1)
+
+    def _geometry(self, frame):
+        return frame.width, frame.height, frame.stride, frame.fmt
+
+    def fingerprint(self, frame):
+        """
+        Per-tile fingerprints (rows x cols) of the frame's visible pixels.
+        NV12 frames are fingerprinted on their Y plane only.
+        """
+        t, bpp = self.tile, frame.bytes_per_pixel
+        rows, cols = -(-frame.height // t), -(-frame.width // t)
+        tile_words = t * bpp // 8
+        if np is None or frame.stride % 8 or not tile_words:
+            return self._fingerprint_crc(frame, rows, cols)
+
+        # Position-weighted wrapping sums over 8-byte words: cheap,
+        # vectorized, and sensitive to moved as well as changed pixels.
+        words = np.frombuffer(frame.pixels[:frame.stride * frame.height], dtype=np.uint64)
+        words = words.reshape(frame.height, frame.stride // 8)[:, :-(-frame.width * bpp // 8)]
+        pad_w = cols * tile_words - words.shape[1]
+        pad_h = rows * t - frame.height
+        if pad_w or pad_h:
+            words = np.pad(words, ((0, pad_h), (0, pad_w)))
+        weighted = words.reshape(rows * t, cols, tile_words) * self._col_weights[:tile_words]
+        row_prints = weighted.sum(axis=2, dtype=np.uint64).reshape(rows, t, cols)
+        row_prints *= self._row_weights[None, :, None]
+        return row_prints.sum(axis=1, dtype=np.uint64)
+
+    def _fingerprint_crc(self, frame, rows, cols):
+        t, bpp = self.tile, frame.bytes_per_pixel
+        prints = [[0] * cols for _ in range(rows)]
+        for y in range(frame.height):
+            row = frame.pixels[y * frame.stride:y * frame.stride + frame.width * bpp]
+            tile_row = prints[y // t]
+            for c in range(cols):
+                tile_row[c] = zlib.crc32(row[c * t * bpp:(c + 1) * t * bpp], tile_row[c])
+        return prints
+
+    def compare(self, frame, prints, since_seq=None):
+        """
+        Diffs prints against the fingerprints remembered for since_seq
+        (default: the last frame remembered). Does not update state.
+        """
+        base_seq = self._last_seq if since_seq is None else since_seq
+        baseline = self._prints.get(base_seq)
+        t = self.tile
+        if baseline is None or baseline[0] != self._geometry(frame):
+            return {
+                "changed": True,
+                "since_sequence": None,
+                "rects": [[0, 0, frame.width, frame.height]],
+                "changed_tiles": None,
+            }
+
+        if np is not None and not isinstance(prints, list):
+            dirty = (prints != baseline[1]).tolist()
+        else:
+            dirty = [[a != b for a, b in zip(r1, r2)] for r1, r2 in zip(prints, baseline[1])]
+
+        rects, open_rects = [], {}
+        for r, row in enumerate(dirty):
+            spans, c = [], 0
+            while c < len(row):
+                if row[c]:
+                    start = c
+                    while c < len(row) and row[c]:
+                        c += 1
+                    spans.append((start, c))
+                c += 1
+            next_open = {}
+            for span in spans:
+                rect = open_rects.pop(span, None)
+                if rect is None:
+                    rect = [span[0] * t, r * t, (span[1] - span[0]) * t, 0]
+                    rects.append(rect)
+                rect[3] += t
+                next_open[span] = rect
+            open_rects = next_open
+        for rect in rects:
+            rect[2] = min(rect[2], frame.width - rect[0])
+            rect[3] = min(rect[3], frame.height - rect[1])
+
+        changed_tiles = sum(map(sum, dirty))
+        return {
+            "changed": changed_tiles > 0,
+            "since_sequence": base_seq,
+            "rects": rects,
+            "changed_tiles": changed_tiles,
+        }
+
+    def unchanged(self, frame, since_seq=None):
+        """Fast path: True when the frame is the baseline itself, so no pixels need reading."""
+        base_seq = self._last_seq if since_seq is None else since_seq
+        baseline = self._prints.get(base_seq)
+        return (base_seq == frame.seq_num and baseline is not None
+                and baseline[0] == self._geometry(frame))
+
+    def remember(self, frame, prints):
+        self._prints[frame.seq_num] = (self._geometry(frame), prints)
+        self._prints.move_to_end(frame.seq_num)
+        while len(self._prints) > self.history:
+            self._prints.popitem(last=False)
+        self._last_seq = frame.seq_num
+
+
+class ZeroCopyReader:
+    """
+    Holds the compositor SHM segment mapped across calls so repeated reads
+    skip the open/mmap cost. One-shot callers can use it and close() it.
+    """
+
+    def __init__(self, shm_path=None):
+        self.shm_path = shm_path or f'/dev/shm/{SHM_NAME}'
+        self.differ = FrameDiffer()
+        self.stats = FrameStats()
+        self._shm = None
+        self._inode = None
+        self._header_geometry = None
+        self._recheck_at = 0.0
+        # Serializes read_frame for batch callers; a remap must not race a
+        # live FrameView and the differ's history is not thread-safe.
+        self._lock = threading.RLock()
+
+    def available(self):
+        return os.name == 'posix' and os.path.exists(self.shm_path)
+
+    def _ensure_mapped(self, min_size=0, check=False):
+        """
+        Maps the whole segment as sized by the compositor, remapping when the
+        segment is recreated or resized or when min_size exceeds the mapping.
+        The file is only re-stat'ed when check is set or the recheck is due.
+        """
+        if self._shm is not None and len(self._shm) >= min_size:
+            now = time.monotonic()
+            if not check and now < self._recheck_at:
+                return self._shm
+            st = os.stat(self.shm_path)
+            self._recheck_at = now + SEGMENT_RECHECK_S
+            if st.st_ino == self._inode and st.st_size == len(self._shm):
+                return self._shm
+        self.close()
+        import mmap
+        with TRACER.span("mmap"):
+            fd = os.open(self.shm_path, os.O_RDONLY)
+            try:
+                st = os.fstat(fd)
+                if st.st_size < max(min_size, PIXEL_OFFSET):
+                    raise SegmentUnavailableError(f"SHM segment is {st.st_size} bytes; expected at least {max(min_size, PIXEL_OFFSET)}")
+                self._shm = mmap.mmap(fd, st.st_size, mmap.MAP_SHARED, mmap.PROT_READ)
+                self._inode = st.st_ino
+                self._recheck_at = time.monotonic() + SEGMENT_RECHECK_S
+            finally:
+                os.close(fd)  # the mapping keeps its own reference
+        return self._shm
 
-            parser = TextExtractor()
-            parser.feed(html)
-            t_parse = (time.perf_counter() - t_start) * 1000
+    def _mapping(self, check=False):
+        if os.name != 'posix':
+            return None
+        try:
+            return self._ensure_mapped(check=check)
+        except FileNotFoundError:
+            self.close()
+            return None
+
+    def close(self):
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                pass  # outstanding FrameViews keep the old mapping alive until released
+            self._shm = None
+            self._inode = None
+            self._header_geometry = None
+
+    def frame(self):
+        """Returns a FrameView over the current frame, or None if no MRCN frame is available."""
+        shm = self._mapping()
+        if shm is None:
+            return None
+        with TRACER.span("header"):
+            magic, width, height, stride, timestamp_us, fmt, seq_num = MRCN_HEADER.unpack_from(shm, 0)
+            if magic != MRCN_MAGIC:
+                return None
+
+            size = frame_bytes(fmt, stride, height)
+            offset, seq_offset, slot = PIXEL_OFFSET, MRCN_SEQ_OFFSET, 0
+            slot_count, front_slot, slot_bytes = MRCN_SLOTS.unpack_from(shm, MRCN_SLOTS_OFFSET)
+            if 2 <= slot_count <= MRCN_MAX_SLOTS and front_slot < slot_count:
+                slot = front_slot
+                offset = PIXEL_OFFSET + slot * max(slot_bytes, size)
+                seq_offset = MRCN_SLOT_SEQ_OFFSET + 4 * slot
+                seq_num = struct.unpack_from('<I', shm, seq_offset)[0]
+                timestamp_us = struct.unpack_from('<Q', shm, MRCN_SLOT_TIMESTAMP_OFFSET + 8 * slot)[0] or timestamp_us
+
+        geometry = (width, height, stride, fmt, slot_count, slot_bytes)
+        if geometry != self._header_geometry:
+            # New geometry usually means the compositor resized or recreated the segment.
+            self._header_geometry = geometry
+            if self._mapping(check=True) is not shm:
+                return self.frame()
+        if offset + size > len(shm):
+            # Geometry grew since we mapped; the compositor resizes the segment first.
+            self._ensure_mapped(offset + size)
+            return self.frame()
+        return FrameView(shm, width, height, stride, timestamp_us, fmt, seq_num, offset, seq_offset, slot)
+
+    def sequence(self):
+        """Latest published sequence number, or None if no MRCN frame is available."""
+        shm = self._mapping()
+        if shm is None:
+            return None
+        magic, *_, seq_num = MRCN_HEADER.unpack_from(shm, 0)
+        return seq_num if magic == MRCN_MAGIC else None
+
+    def wait_for_frame(self, after_seq=None, timeout=1.0):
+        """
+        Blocks until the header's seq_num differs from after_seq (spin, then
+        back off) and returns it, or returns None after timeout seconds.
+        """
+        t_now = time.perf_counter()
+        deadline = t_now + timeout
+        spin_until = t_now + FRAME_SPIN_S
+        delay = FRAME_MIN_SLEEP_S
+        while True:
+            seq = self.sequence()
+            if seq is not None and seq != after_seq:
+                return seq
+            t_now = time.perf_counter()
+            if t_now >= deadline:
+                return None
+            if t_now < spin_until:
+                continue
+            time.sleep(min(delay, deadline - t_now))
+            delay = min(delay * 2, FRAME_MAX_SLEEP_S)
+
+    async def frames(self, after_seq=None, timeout=1.0):
+        """
+        Async iterator over new sequence numbers. Never spins, so it is safe to
+        run on an event loop; stops when no new frame arrives within timeout.
+        """
+        while True:
+            deadline = time.perf_counter() + timeout
+            delay = FRAME_MIN_SLEEP_S
+            while True:
+                seq = self.sequence()
+                if seq is not None and seq != after_seq:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 2, FRAME_MAX_SLEEP_S)
+            yield seq
+            after_seq = seq
+
+    def snapshot(self, compute, retries=TORN_FRAME_RETRIES):
+        """
+        Lock-free read: runs compute(frame) and re-checks the frame's sequence
+        number afterwards, retrying if it changed. With the multi-slot layout
+        this is a consistent snapshot; with the legacy single buffer it only
+        catches writes that completed during compute (see is_consistent).
+        Returns (frame, value, torn_retries) with the frame already released,
+        None if no frame is available, and raises TornFrameError once every
+        attempt was torn.
+        """
+        for attempt in range(retries + 1):
+            frame = self.frame()
+            if frame is None:
+                return None
+            with frame:
+                value = compute(frame)
+                if frame.is_consistent():
+                    return frame, value, attempt
+        raise TornFrameError(f"Frame torn on all {retries + 1} read attempts")
+
+    def read_frame(self, url, metrics=0, diff=False, since_seq=None, **metric_options):
+        """
+        Returns the zero-copy result dict, or None if no MRCN frame is available.
+        `metrics` is a METRIC_* mask; metric_options go to compute_frame_metrics.
+        With diff=True the result carries the dirty rectangles since since_seq
+        (default: the previous frame read), and metrics are skipped when
+        nothing changed.
+        """
+        with self._lock:
+            metrics_error = None
+            if metrics and np is None:
+                metrics, metrics_error = 0, "NumPy is not installed; frame metrics are unavailable"
 
-            body_text = "\n".join(parser.texts[:50])
-            html_size = len(html)
-            context_size = len(body_text)
+            def compute(frame):
+                with TRACER.span("pixels"):
+                    sample_blue = _legacy_blue_sample(frame)
+                prints = frame_diff = None
+                if diff:
+                    with TRACER.span("diff"):
+                        if self.differ.unchanged(frame, since_seq):
+                            frame_diff = {"changed": False, "since_sequence": frame.seq_num, "rects": [], "changed_tiles": 0}
+                        else:
+                            prints = self.differ.fingerprint(frame)
+                            frame_diff = self.differ.compare(frame, prints, since_seq)
+                if not metrics or (frame_diff is not None and not frame_diff["changed"]):
+                    return sample_blue, None, frame_diff, prints
+                with TRACER.span("metrics"):
+                    frame_metrics = compute_frame_metrics(frame, metrics, **metric_options)
+                return sample_blue, frame_metrics, frame_diff, prints
+
+            try:
+                t_start = time.perf_counter()
+
+                snap = self.snapshot(compute)
+                if snap is None:
+                    return None
+                frame, (sample_blue, frame_metrics, frame_diff, prints), torn_retries = snap
+                if prints is not None:
+                    self.differ.remember(frame, prints)
+
+                t_read = (time.perf_counter() - t_start) * 1000
+                frame_age_ms, skipped = self.stats.observe(frame.seq_num, frame.timestamp_us)
+            except TornFrameError as e:
+                return {"url": url, "status": "zero-copy-torn", "error": str(e)}
+            except (FileNotFoundError, SegmentUnavailableError):
+                # Segment vanished or is being resized; remap on the next call.
+                self.close()
+                return None
 
             result = {
                 "url": url,
-                "status": "fallback-http",
-                "status_code": response.getcode(),
-                "title": parser.title,
-                "html_bytes": html_size,
-                "context_bytes": context_size,
-                "token_efficiency": f"{(1 - context_size / max(html_size, 1)) * 100:.1f}%",
-                "fetch_ms": round(t_fetch, 1),
-                "total_ms": round(t_parse, 1),
-                "message": "Zero-Copy path unavailable. Fallback HTTP contextual extraction used.",
-                "body_preview": body_text[:500]
+                "status": "zero-copy-active",
+                "resolution": f"{frame.width}x{frame.height}",
+                "pixel_format": frame.format_name,
+                "latest_sequence": frame.seq_num,
+                "frame_slot": frame.slot,
+                "torn_retries": torn_retries,
+                "visual_luma_metric": round(sample_blue, 2),
+                "latency_ms": round(t_read, 2),
+                "timestamp_us": frame.timestamp_us,
+                "frame_age_ms": None if frame_age_ms is None else round(frame_age_ms, 2),
+                "skipped_frames": skipped,
+                "message": "Direct visual linkage established. The Serialization Tax is dead."
             }
+            if frame_diff is not None:
+                result["diff"] = frame_diff
+            if frame_metrics is not None:
+                result["metrics"] = frame_metrics
+            if metrics_error:
+                result["metrics_error"] = metrics_error
+            return result
+
 
-            print(json.dumps(result, indent=2))
+class TextExtractor(HTMLParser):
+    """
+    Collects the page title and up to max_texts text nodes. Feed it chunks as
+    they arrive and stop once `done` is set. Text inside script, style,
+    noscript, svg and template subtrees is ignored.
+    """
+    SKIP_TAGS = frozenset(("script", "style", "noscript", "svg", "template"))
+
+    def __init__(self, max_texts=TEXT_BUDGET):
+        super().__init__()
+        self.texts = []
+        self.title = ""
+        self.max_texts = max_texts
+        self._in_title = False
+        self._title_seen = False
+        self._skip_depth = 0
+
+    @property
+    def done(self):
+        return self._title_seen and len(self.texts) >= self.max_texts
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "body":
+            # No title once the body starts; don't wait for one.
+            self._title_seen = True
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            self._title_seen = True
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title:
+            self.title = data.strip()
+        elif len(self.texts) < self.max_texts:
+            text = data.strip()
+            if text:
+                self.texts.append(text)
+
+
+def _extract_text(response, max_texts):
+    """Streams response through a TextExtractor; returns (payload, parse_seconds)."""
+    parser = TextExtractor(max_texts)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    html_size = 0
+    parse_s = 0.0
+    t_first_feed = None
+    early_exit = False
+    for chunk in response.iter_chunks():
+        html = decoder.decode(chunk)
+        t_feed = time.perf_counter()
+        if t_first_feed is None:
+            t_first_feed = t_feed
+        for i in range(0, len(html), FEED_SLICE):
+            piece = html[i:i + FEED_SLICE]
+            html_size += len(piece)
+            parser.feed(piece)
+            if parser.done:
+                early_exit = True
+                break
+        parse_s += time.perf_counter() - t_feed
+        if early_exit:
+            # Finishing a short remainder keeps the connection pooled.
+            response.drain()
+            break
+    else:
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+    if TRACER.enabled and t_first_feed is not None:
+        # Parsing interleaves with the download; the span is the summed feed
+        # time, drawn from the first feed.
+        TRACER.add("parse", t_first_feed, t_first_feed + parse_s)
+
+    body_text = "\n".join(parser.texts)
+    context_size = len(body_text)
+    return {
+        "status_code": response.status,
+        "title": parser.title,
+        "html_bytes": html_size,
+        "context_bytes": context_size,
+        "token_efficiency": f"{(1 - context_size / max(html_size, 1)) * 100:.1f}%",
+        "early_exit": early_exit,
+        "body_preview": body_text[:PREVIEW_CHARS],
+    }, parse_s
+
+
+def run_http_fallback(url, fetcher=None, max_texts=TEXT_BUDGET, cache=None):
+    # FALLBACK: HTTP contextual extraction for local dev / Windows
+    t_start = time.perf_counter()
+    result = {
+        "url": url,
+        "status": "fallback-http",
+        "message": "Zero-Copy path unavailable. Fallback HTTP contextual extraction used.",
+    }
+    cached, validators = None, {}
+    if cache is not None:
+        cached, validators = cache.lookup(url, max_texts)
+        if cached is not None and not validators:
+            result.update(cached)
+            result["total_ms"] = round((time.perf_counter() - t_start) * 1000, 3)
+            result["cache"] = {"state": "hit", **cache.stats()}
+            return result
+
+    owned = fetcher is None
+    if owned:
+        fetcher = HttpFetcher()
+    try:
+        with fetcher.fetch(url, headers=validators) as response:
+            if response.status == 304 and cached is not None:
+                # Unchanged since we cached it: no body to download or parse.
+                response.read()
+                cache.revalidate(url, response.headers)
+                payload, parse_s, state = cached, 0.0, "revalidated"
+            else:
+                payload, parse_s = _extract_text(response, max_texts)
+                state = "miss"
+                if cache is not None:
+                    cache.store(url, response.headers, payload, max_texts)
+            t_done = time.perf_counter()
+            t_total = (t_done - t_start) * 1000
+            if TRACER.enabled:
+                TRACER.add("fetch", t_start, t_done - parse_s)
+
+            result.update(payload)
+            result.update({
+                "fetch_ms": round(t_total - parse_s * 1000, 1),
+                "parse_ms": round(parse_s * 1000, 1),
+                "total_ms": round(t_total, 1),
+                "transfer": {
+                    "content_encoding": response.content_encoding,
+                    "wire_bytes": response.wire_bytes,
+                    "body_bytes": response.body_bytes,
+                    "reused_connection": response.reused_connection,
+                },
+            })
+            if cache is not None:
+                result["cache"] = {"state": state, **cache.stats()}
+            return result
 
     except Exception as e:
-        print(json.dumps({"error": str(e), "url": url}))
-        sys.exit(1)
+        return {"error": str(e), "url": url}
+    finally:
+        if owned:
+            fetcher.close()
+
+
+def run_zero_copy_vision(url, reader=None, metrics=0, diff=False, since_seq=None, fetcher=None,
+                         cache=None, **metric_options):
+    # Try exact Zero-Copy on Linux where NeuralChromium renders
+    owned = reader is None
+    if owned:
+        reader = ZeroCopyReader()
+    try:
+        result = reader.read_frame(url, metrics, diff, since_seq, **metric_options)
+    finally:
+        if owned:
+            reader.close()
+    if result is not None:
+        return result
+    return run_http_fallback(url, fetcher, cache=cache)
+
+
+def validate_batch(urls, emit, reader=None, fetcher=None, cache=None, concurrency=BATCH_CONCURRENCY,
+                   per_host=BATCH_PER_HOST, deadline_s=BATCH_DEADLINE_S, **options):
+    """
+    Validates urls on a thread pool, calling emit({"index": i, **result})
+    as each one completes. At most `concurrency` URLs are in flight, and at
+    most `per_host` of them against any one host; URLs for a saturated host
+    wait without holding a pool thread. No URL is started after deadline_s
+    seconds (None for no deadline); those are counted as unfinished and the
+    summary's timed_out is set. Returns a summary including latency
+    percentiles per URL and, for fallback fetches, of the fetch alone.
+    """
+    t_start = time.perf_counter()
+    deadline = None if deadline_s is None else t_start + deadline_s
+    owned = fetcher is None
+    if owned:
+        fetcher = HttpFetcher()
+    concurrency = max(1, concurrency)
+    per_host = max(1, per_host)
+
+    latency = LatencyHistogram()
+    fetch_latency = LatencyHistogram()
+
+    def validate(url):
+        t_url = time.perf_counter()
+        try:
+            result = run_zero_copy_vision(url, reader, fetcher=fetcher, cache=cache, **options)
+        except Exception as e:
+            return {"error": str(e), "url": url}
+        latency.record((time.perf_counter() - t_url) * 1000)
+        if "fetch_ms" in result:
+            fetch_latency.record(result["fetch_ms"])
+        return result
+
+    queued = [(index, url, urllib.parse.urlsplit(url).hostname or '') for index, url in enumerate(urls)]
+    host_load = {}
+    in_flight = {}
+    failed = 0
+    unfinished = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while queued or in_flight:
+                if deadline is not None and queued and time.perf_counter() >= deadline:
+                    unfinished = len(queued)
+                    queued = []
+                # Start the earliest queued URLs whose host still has room.
+                waiting = []
+                for position, (index, url, host) in enumerate(queued):
+                    if len(in_flight) >= concurrency:
+                        waiting.extend(queued[position:])
+                        break
+                    if host_load.get(host, 0) < per_host:
+                        host_load[host] = host_load.get(host, 0) + 1
+                        in_flight[pool.submit(validate, url)] = (index, host)
+                    else:
+                        waiting.append((index, url, host))
+                queued = waiting
+                timeout = None if deadline is None or not queued else max(0.0, deadline - time.perf_counter())
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, host = in_flight.pop(future)
+                    host_load[host] -= 1
+                    result = future.result()
+                    if "error" in result:
+                        failed += 1
+                    emit({"index": index, **result})
+    finally:
+        if owned:
+            fetcher.close()
+    return {
+        "count": len(urls),
+        "ok": len(urls) - failed - unfinished,
+        "failed": failed,
+        "unfinished": unfinished,
+        "timed_out": unfinished > 0,
+        "total_ms": round((time.perf_counter() - t_start) * 1000, 1),
+        "latency_ms": latency.summary(),
+        "fetch_ms": fetch_latency.summary(),
+    }
+
+
+def watch_frames(reader, emit, after_seq=None, max_frames=1, timeout=1.0):
+    """Emits a frame-ready event for each of the next max_frames sequence numbers."""
+    count = 0
+    while count < max_frames:
+        seq = reader.wait_for_frame(after_seq, timeout)
+        if seq is None:
+            break
+        frame = reader.frame()
+        if frame is None:
+            break
+        with frame:
+            frame_age_ms, _ = reader.stats.observe(frame.seq_num, frame.timestamp_us)
+            emit({
+                "latest_sequence": frame.seq_num,
+                "skipped": 0 if after_seq is None else max(0, (frame.seq_num - after_seq) % 2**32 - 1),
+                "resolution": f"{frame.width}x{frame.height}",
+                "timestamp_us": frame.timestamp_us,
+                "frame_age_ms": None if frame_age_ms is None else round(frame_age_ms, 2),
+            })
+        after_seq = frame.seq_num
+        count += 1
+    return {"frames": count, "latest_sequence": after_seq, "timed_out": count < max_frames}
+
+
+def _require(request, *fields):
+    """Rejects a serve-mode request missing any of fields, naming them."""
+    missing = [field for field in fields if request.get(field) is None]
+    if missing:
+        raise ValueError(f"{request.get('op')!r} request is missing required field(s): {', '.join(missing)}")
+
+
+def _metric_request(request):
+    """Pulls the optional metric selection out of a serve-mode request."""
+    options = {
+        "metrics": metric_mask(request.get("metrics")),
+        "diff": bool(request.get("diff")),
+        "since_seq": request.get("since_seq"),
+    }
+    if "grid" in request:
+        options["grid"] = tuple(request["grid"])
+    if "thumb_width" in request:
+        options["thumb_width"] = int(request["thumb_width"])
+    if "histogram_bins" in request:
+        options["histogram_bins"] = int(request["histogram_bins"])
+    if "histogram_step" in request:
+        options["histogram_step"] = max(1, int(request["histogram_step"]))
+    return options
+
+
+def serve(stdin=None, stdout=None, metrics_port=None):
+    """
+    Long-lived worker loop. Each request is one JSON object per line:
+        {"id": 1, "op": "validate", "url": "https://...", "instance": "tab3"}
+    and each reply is one JSON object per line carrying the same id:
+        {"id": 1, "ok": true, "result": {...}}
+    Streaming ops ("watch", "batch") first send any number of
+        {"id": 1, "event": {...}}
+    lines before their final reply. "instance" selects a per-renderer
+    segment via the SegmentRegistry; omitted means the legacy segment.
+    Every op's service time is recorded in a per-op histogram that the
+    "latency" op reports ("raw": true adds the serialized histograms for
+    merging across workers; "reset": true starts a new window).
+    The "trace" op switches the per-stage spans of vision_trace on or off
+    ("enable"), reports their histograms, returns the span ring as a Chrome
+    trace ("export"), and arms or cancels a sampled cProfile/tracemalloc
+    capture of the following ops ("profile": "cpu" | "memory" | "cancel",
+    with "ops", "every", "limit", "dump").
+    The "metrics" op returns the worker's vision_metrics counters and
+    histograms as Prometheus text; with metrics_port they are also served
+    on http://127.0.0.1:<metrics_port>/metrics.
+    "watch" follows a frame_fanout ring instead of the segment when the
+    request names one ("fanout") or, without "instance", GLAZYR_FANOUT does;
+    it reads the segment directly while that ring does not exist.
+    """
+    from segment_registry import SegmentRegistry
+    from vision_metrics import CONTENT_TYPE, VisionMetrics, cache_collector, segment_collector, start_http_server
+
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    write_lock = threading.Lock()  # batch events are emitted from pool threads
+    registry = SegmentRegistry(reader_factory=ZeroCopyReader)
+    # One fetcher and cache for the worker's lifetime so fallback fetches
+    # reuse connections and repeat URLs skip the download and parse.
+    fetcher = HttpFetcher()
+    cache = ResponseCache()
+    vision_state = VisionStateReader(os.environ.get('GLAZYR_VISION_STATE'))
+    op_latency = {}
+    metrics = VisionMetrics()
+    metrics.add_collector(cache_collector(cache))
+    metrics.add_collector(segment_collector(registry))
+    metrics_server = start_http_server(metrics, metrics_port) if metrics_port else None
+    fanout_consumers = {}
+
+    def reply(message):
+        with TRACER.span("serialize"):
+            # NaN/Infinity are not JSON; raising here turns them into an error reply.
+            line = json.dumps(message, allow_nan=False) + "\n"
+        with write_lock:
+            stdout.write(line)
+            stdout.flush()
+
+    def op_validate(request, emit):
+        _require(request, "url")
+        reader = registry.reader(request.get("instance"))
+        result = run_zero_copy_vision(request["url"], reader, fetcher=fetcher, cache=cache,
+                                      **_metric_request(request))
+        metrics.observe_result(result)
+        if "fetch_ms" in result:
+            op_latency.setdefault("fetch", LatencyHistogram()).record(result["fetch_ms"])
+        if "error" in result:
+            return {"ok": False, "error": result["error"], "result": result}
+        return {"ok": True, "result": result}
+
+    def op_batch(request, emit):
+        _require(request, "urls")
+        options = _metric_request(request)
+        options.pop("diff")
+        options.pop("since_seq")
+
+        def emit_result(event):
+            metrics.observe_result(event)
+            emit(event)
+        result = validate_batch(
+            list(request["urls"]),
+            emit_result,
+            registry.reader(request.get("instance")),
+            fetcher,
+            cache,
+            concurrency=int(request.get("concurrency", BATCH_CONCURRENCY)),
+            per_host=int(request.get("per_host", BATCH_PER_HOST)),
+            deadline_s=float(request.get("deadline_s", BATCH_DEADLINE_S)),
+            **options,
+        )
+        return {"ok": True, "result": result}
+
+    def op_nodes(request, emit):
+        result = query_nodes(
+            vision_state,
+            role=request.get("role"),
+            label=request.get("label"),
+            at=request.get("at"),
+            within=request.get("within"),
+            limit=int(request.get("limit", 50)),
+            since_seq=request.get("since_seq"),
+        )
+        return {"ok": True, "result": result}
+
+    def op_export(request, emit):
+        from frame_export import EXPORT_MAX_WIDTH, JPEG_QUALITY, export_frame
+
+        result = export_frame(
+            registry.reader(request.get("instance")),
+            roi=request.get("roi"),
+            max_width=int(request.get("max_width", EXPORT_MAX_WIDTH)),
+            fmt=request.get("format", "png"),
+            quality=int(request.get("quality", JPEG_QUALITY)),
+        )
+        if result is None:
+            return {"ok": False, "error": "No compositor frame available"}
+        return {"ok": True, "result": result}
+
+    def fanout_consumer(request):
+        """The FanoutConsumer a watch follows, or None to read the segment itself."""
+        from frame_fanout import FANOUT_NAME, FanoutConsumer, ring_path
+
+        name = request.get("fanout")
+        if name is None and not request.get("instance"):
+            name = os.environ.get('GLAZYR_FANOUT')
+        if not name:
+            return None
+        name = FANOUT_NAME if name is True else str(name)
+        consumer = fanout_consumers.get(name)
+        try:
+            inode = os.stat(ring_path(name)).st_ino
+        except FileNotFoundError:
+            inode = None
+        if consumer is not None and consumer.inode != inode:
+            # The producer restarted (new ring) or stopped (no ring).
+            fanout_consumers.pop(name).close()
+            consumer = None
+        if consumer is None and inode is not None:
+            try:
+                consumer = fanout_consumers[name] = FanoutConsumer(name)
+            except FileNotFoundError:
+                return None
+        return consumer
+
+    def op_watch(request, emit):
+        consumer = fanout_consumer(request)
+        if consumer is not None:
+            from frame_fanout import watch_fanout
+
+            result = watch_fanout(
+                consumer,
+                emit,
+                after_seq=request.get("after_seq"),
+                max_frames=int(request.get("max_frames", 1)),
+                timeout=float(request.get("timeout_ms", 1000)) / 1000,
+            )
+            return {"ok": True, "result": result}
+        result = watch_frames(
+            registry.reader(request.get("instance")),
+            emit,
+            after_seq=request.get("after_seq"),
+            max_frames=int(request.get("max_frames", 1)),
+            timeout=float(request.get("timeout_ms", 1000)) / 1000,
+        )
+        return {"ok": True, "result": result}
+
+    def op_stats(request, emit):
+        if request.get("instance"):
+            readers = {request["instance"]: registry.reader(request["instance"])}
+        else:
+            readers = registry.open_readers()
+        return {"ok": True, "result": {
+            "pid": os.getpid(),
+            "segments": {instance: reader.stats.snapshot() for instance, reader in readers.items()},
+        }}
+
+    def op_latency_report(request, emit):
+        result = {"ops": {op: hist.summary() for op, hist in sorted(op_latency.items())}}
+        if request.get("raw"):
+            result["histograms"] = {op: hist.to_dict() for op, hist in op_latency.items()}
+        if request.get("reset"):
+            op_latency.clear()
+        return {"ok": True, "result": result}
+
+    def op_trace(request, emit):
+        if request.get("enable") is True:
+            TRACER.enable()
+        elif request.get("enable") is False:
+            TRACER.disable()
+        profile = request.get("profile")
+        if profile == "cancel":
+            TRACER.cancel_profile()
+        elif profile:
+            TRACER.arm_profile(
+                profile,
+                ops=int(request.get("ops", PROFILE_OPS)),
+                every=int(request.get("every", 1)),
+                limit=int(request.get("limit", PROFILE_LINES)),
+                dump=request.get("dump"),
+            )
+        result = {"pid": os.getpid(), "enabled": TRACER.enabled, "spans": TRACER.summary(),
+                  "profile": TRACER.profile_state()}
+        if TRACER.last_profile is not None:
+            result["last_profile"] = TRACER.last_profile
+        if request.get("export"):
+            result["chrome_trace"] = TRACER.chrome_trace()
+        if request.get("reset"):
+            TRACER.reset()
+        return {"ok": True, "result": result}
+
+    handlers = {
+        "validate": op_validate,
+        "batch": op_batch,
+        "watch": op_watch,
+        "nodes": op_nodes,
+        "export": op_export,
+        "latency": op_latency_report,
+        "trace": op_trace,
+        "metrics": lambda request, emit: {"ok": True, "result": {"content_type": CONTENT_TYPE,
+                                                                  "text": metrics.render()}},
+        "stats": op_stats,
+        "segments": lambda request, emit: {"ok": True, "result": registry.stats()},
+        "ping": lambda request, emit: {"ok": True, "result": {"pid": os.getpid()}},
+    }
+
+    try:
+        while True:
+            line = stdin.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply({"id": None, "ok": False, "error": f"Malformed request: {e}"})
+                continue
+
+            req_id = request.get("id")
+            op = request.get("op")
+            handler = handlers.get(op)
+            t_op = time.perf_counter()
+            introspection = op in ("latency", "trace", "metrics")
+            ok = False
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown op: {op!r}")
+                with NULL_SPAN if introspection else TRACER.profiled():
+                    response = handler(request, lambda event: reply({"id": req_id, "event": event}))
+                ok = response.get("ok", False)
+                reply({"id": req_id, **response})
+            except Exception as e:
+                reply({"id": req_id, "ok": False, "error": str(e)})
+            if handler is not None and not introspection:
+                t_done = time.perf_counter()
+                op_latency.setdefault(op, LatencyHistogram()).record((t_done - t_op) * 1000)
+                metrics.inc("glazyr_vision_ops_total", op=op, outcome="ok" if ok else "error")
+                metrics.observe("glazyr_vision_op_duration_seconds", (t_done - t_op) * 1000, op=op)
+                if TRACER.enabled:
+                    TRACER.add(f"op.{op}", t_op, t_done)
+            registry.evict_idle()
+    finally:
+        for consumer in fanout_consumers.values():
+            consumer.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        registry.close()
+        fetcher.close()
+
+
+def _read_jsonl_urls(stream):
+    """URLs from JSONL lines: either {"url": ...} objects or bare JSON strings."""
+    urls = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        urls.append(entry["url"] if isinstance(entry, dict) else str(entry))
+    return urls
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--url", required=True, help="URL to validate")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--url", action="append",
+                      help="URL to validate; repeat to validate a batch concurrently")
+    mode.add_argument("--jsonl", action="store_true",
+                      help="Validate a batch of URLs read from stdin, one JSON object ({\"url\": ...}) per line")
+    mode.add_argument("--serve", action="store_true",
+                      help="Run as a persistent worker speaking newline-delimited JSON on stdin/stdout")
+    parser.add_argument("--metrics", default="",
+                        help=f"Comma-separated frame metrics to compute: {', '.join(METRIC_NAMES)}")
+    parser.add_argument("--instance", help="Read the NeuralChromium_Video_<instance> segment instead of the default")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Batch mode: URLs validated at once")
+    parser.add_argument("--per-host", type=int, default=BATCH_PER_HOST,
+                        help="Batch mode: concurrent requests allowed per host")
+    parser.add_argument("--deadline", type=float, default=BATCH_DEADLINE_S,
+                        help="Batch mode: seconds after which no further URL is started")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve mode: also expose Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Trace the run's stages and write a Chrome trace (chrome://tracing, Perfetto) to FILE")
     args = parser.parse_args()
-    run_zero_copy_vision(args.url)
+    if args.trace:
+        import atexit
+        TRACER.enable()
+
+        def write_trace():
+            with open(args.trace, "w") as f:
+                json.dump(TRACER.chrome_trace(), f)
+        atexit.register(write_trace)
+    if args.serve:
+        serve(metrics_port=args.metrics_port)
+        sys.exit(0)
+    reader = None
+    if args.instance:
+        from segment_registry import SegmentRegistry
+        reader = ZeroCopyReader(SegmentRegistry(reader_factory=ZeroCopyReader).path_for(args.instance))
+    metrics = metric_mask(filter(None, args.metrics.split(",")))
+    if args.jsonl or len(args.url) > 1:
+        # Batch mode: one compact JSON line per URL as it completes.
+        urls = _read_jsonl_urls(sys.stdin) if args.jsonl else args.url
+        summary = validate_batch(
+            urls,
+            lambda result: print(json.dumps(result), flush=True),
+            reader or ZeroCopyReader(),
+            cache=ResponseCache(),
+            concurrency=args.concurrency,
+            per_host=args.per_host,
+            deadline_s=args.deadline,
+            metrics=metrics,
+        )
+        print(json.dumps({"summary": summary}), flush=True)
+        sys.exit(1 if summary["failed"] or summary["unfinished"] else 0)
+    result = run_zero_copy_vision(args.url[0], reader, metrics=metrics)
+    if reader is not None:
+        reader.close()
+    if "error" in result:
+        print(json.dumps(result))
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
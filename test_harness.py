@@ -227,7 +227,12 @@ def run():
 
     expected = [
         "shm_vision_validate",
+        "shm_vision_validate_batch",
         "peek_vision_buffer",
+        "export_frame",
+        "watch_vision_frames",
+        "list_vision_instances",
+        "query_vision_nodes",
         "browser_navigate",
         "browser_click",
         "browser_type",